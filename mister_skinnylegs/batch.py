@@ -0,0 +1,114 @@
+import dataclasses
+import json
+import os
+import pathlib
+import typing
+
+from .util.fs_utils import sanitize_filename
+from .profile_session import BrowserType
+
+CHROMIUM_PROFILE_MARKER = "Preferences"
+MOZILLA_PROFILE_MARKERS = ("prefs.js", "places.sqlite")
+MOZILLA_CACHE_FOLDER_NAME = "cache2"
+
+
+@dataclasses.dataclass(frozen=True)
+class BatchProfile:
+    """
+    A profile to be processed as part of a batch. The name is used for the profile's output folder so must be unique
+    within the batch.
+    """
+    name: str
+    profile_path: pathlib.Path
+    browser_type: BrowserType
+    cache_folder: typing.Optional[pathlib.Path] = None
+
+
+def _make_unique_names(profiles: list[BatchProfile]) -> list[BatchProfile]:
+    seen = set()
+    result = []
+    for profile in profiles:
+        base_name = sanitize_filename(profile.name) or "profile"
+        name = base_name
+        suffix = 1
+        while name.lower() in seen:
+            suffix += 1
+            name = f"{base_name}_{suffix}"
+        seen.add(name.lower())
+        result.append(dataclasses.replace(profile, name=name))
+    return result
+
+
+def read_manifest(manifest_path: pathlib.Path) -> list[BatchProfile]:
+    """
+    Reads a batch manifest: a JSON file containing a list of objects with the keys "profile" (the path to the
+    profile folder), "browser" ("chromium" or "mozilla") and optionally "cache" (the path to the cache folder) and
+    "name" (the name for the profile's output folder; defaults to the profile folder's name). Relative paths are
+    relative to the manifest's folder.
+
+    :param manifest_path: path to the manifest
+    :return: the profiles in the manifest
+    """
+    with manifest_path.open("rt", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if not isinstance(manifest, list):
+        raise ValueError(f"Manifest {manifest_path} should contain a list of profiles")
+
+    base_folder = manifest_path.parent
+    profiles = []
+    for idx, entry in enumerate(manifest):
+        if not isinstance(entry, dict) or "profile" not in entry or "browser" not in entry:
+            raise ValueError(f"Manifest entry {idx} should be an object with at least 'profile' and 'browser' keys")
+        try:
+            browser_type = BrowserType[entry["browser"]]
+        except KeyError:
+            raise ValueError(f"Manifest entry {idx} has an unsupported browser: {entry['browser']}")
+
+        profile_path = base_folder / entry["profile"]
+        cache_folder = base_folder / entry["cache"] if entry.get("cache") else None
+        profiles.append(BatchProfile(entry.get("name") or profile_path.name, profile_path, browser_type, cache_folder))
+
+    return _make_unique_names(profiles)
+
+
+def _find_mozilla_cache(root: pathlib.Path, profile_path: pathlib.Path) -> typing.Optional[pathlib.Path]:
+    # the cache is usually kept outside the profile (e.g., on Windows it's under "Local" rather than "Roaming"), in
+    # a folder with the same name as the profile folder
+    if (profile_path / MOZILLA_CACHE_FOLDER_NAME).is_dir():
+        return profile_path / MOZILLA_CACHE_FOLDER_NAME
+    for candidate in root.rglob(profile_path.name):
+        if candidate != profile_path and (candidate / MOZILLA_CACHE_FOLDER_NAME).is_dir():
+            return candidate / MOZILLA_CACHE_FOLDER_NAME
+    return None
+
+
+def discover_profiles(root: pathlib.Path) -> list[BatchProfile]:
+    """
+    Finds the browser profiles under a root folder: Chromium profiles are identified by their Preferences file and
+    Mozilla profiles by their prefs.js and places.sqlite files. Mozilla profiles are only included if their cache
+    folder can be found. Profiles are named after their path relative to the root.
+
+    :param root: the folder to search
+    :return: the profiles found
+    """
+    profiles = []
+    for folder, dir_names, file_names in os.walk(root):
+        folder = pathlib.Path(folder)
+        browser_type = None
+        cache_folder = None
+        if CHROMIUM_PROFILE_MARKER in file_names:
+            browser_type = BrowserType.chromium
+        elif all(marker in file_names for marker in MOZILLA_PROFILE_MARKERS):
+            cache_folder = _find_mozilla_cache(root, folder)
+            if cache_folder is not None:
+                browser_type = BrowserType.mozilla
+
+        if browser_type is not None:
+            dir_names.clear()  # don't descend into the profile itself
+            name = "_".join(folder.relative_to(root).parts) or folder.name
+            profiles.append(BatchProfile(name, folder, browser_type, cache_folder))
+        else:
+            dir_names.sort()
+
+    return _make_unique_names(profiles)
@@ -20,25 +20,29 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import csv
 import datetime
-import enum
 import json
+import os
 import sys
 import pathlib
 import typing
 import collections.abc as colabc
 import asyncio
+import concurrent.futures
+import threading
 
-import ccl_chromium_reader.structures
-
-from mister_skinnylegs.util.profile_folder_protocols import ArtifactLocationProtocol
 from .util.plugin_loader import PluginLoader
 from .util.artifact_utils import ArtifactSpec, ReportPresentation, LogFunction, ArtifactStorage, ArtifactResult
-from .util.fs_utils import sanitize_filename, ArtifactFileSystemStorage
-
-from ccl_chromium_reader import ChromiumProfileFolder
-from ccl_mozilla_reader import MozillaProfileFolder
+from .util.fs_utils import sanitize_filename, ArtifactFileSystemStorageMaker, MEDIA_STORE_FOLDER_NAME, ARCHIVE_FORMATS
+from .util.row_spool import RowSpool
+from .result_writers import (
+    ExtendedEncoder, TABLE_FORMATS, DEFAULT_TABLE_FORMATS, JSONL_FORMATS, CASE_DATABASE_FILE_NAME, CaseDatabase,
+    write_json_result, write_csv_result, write_columnar_result, write_jsonl_result, check_table_formats)
+from .profile_session import BrowserType, ProfileSession, open_profile
+from .worker_pool import ArtifactJob, init_worker, run_artifact_job, make_result_envelope
+from .batch import BatchProfile, read_manifest, discover_profiles
+from .timeline import TIMELINE_FILE_NAME, TimelineBuilder, is_timeline_artifact
+from .output_pipeline import DEFAULT_WRITER_THREADS, OutputPipeline
 
 __version__ = "0.0.16"
 __description__ = "an open plugin framework for parsing website/webapp artifacts in browser data"
@@ -59,20 +63,6 @@ https://github.com/cclgroupltd/mister-skinnylegs
 """
 
 
-class ExtendedEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime.datetime):
-            return obj.isoformat()
-        if isinstance(obj, ArtifactLocationProtocol):
-            return obj.friendly_string
-        return super().default(obj)
-
-
-class BrowserType(enum.Enum):
-    chromium = 1
-    mozilla = 2
-
-
 class MisterSkinnylegs:
     """
     Mister Skinnylegs is a plugin framework for website/web app artifacts stored by a browser.
@@ -85,6 +75,9 @@ class MisterSkinnylegs:
             storage_maker_func: colabc.Callable[[ArtifactSpec], ArtifactStorage],
             cache_folder: typing.Optional[pathlib.Path]=None,
             log_callback: typing.Optional[LogFunction]=None,
+            workers: int=1,
+            index_folder: typing.Optional[pathlib.Path]=None,
+            result_cache_folder: typing.Optional[pathlib.Path]=None
             ):
         """
         Constructor
@@ -97,9 +90,20 @@ class MisterSkinnylegs:
         :param cache_folder:
         :param log_callback: a callback function for logging. Should be a function that takes a single string
                argument which is the message to be logged.
+        :param workers: the number of worker processes to run artifacts in. If this is 1 (the default) artifacts are
+               run in this process; otherwise they are run in a process pool and storage_maker_func must be
+               picklable (i.e., not a lambda or closure).
+        :param index_folder: optional folder in which a persistent index of the profile's cache and history is kept,
+               so that repeat runs against the same profile can resolve queries without re-reading it.
+        :param result_cache_folder: optional folder in which artifacts' results are cached; later runs reuse the
+               cached result for artifacts whose plugin, version and input data are unchanged.
         """
+        self._plugin_path = plugin_path
         self._plugin_loader = PluginLoader(plugin_path)
 
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
         if not profile_path.is_dir():
             raise NotADirectoryError(profile_path)
 
@@ -111,34 +115,57 @@ class MisterSkinnylegs:
         self._cache_folder_path = cache_folder
         self._storage_maker_func = storage_maker_func
         self._log_callback = log_callback or MisterSkinnylegs.log_fallback
-
-        match self._browser_type:
-            case BrowserType.chromium:
-                self._make_profile = lambda: ChromiumProfileFolder(
-                    self._profile_folder_path, cache_folder=self._cache_folder_path, missing_data_ok=True)
-            case BrowserType.mozilla:
-                self._make_profile = lambda: MozillaProfileFolder(self._profile_folder_path, self._cache_folder_path)
-            case _:
-                raise NotImplementedError(f"Browser type {self._browser_type} not supported")
-
-    async def _run_artifact(self, spec: ArtifactSpec):
-        # with ChromiumProfileFolder(self._profile_folder_path, cache_folder=self._cache_folder_path) as profile:
-        with self._make_profile() as profile:
-            result = spec.function(profile, self._log_callback, self._storage_maker_func(spec))
-            return spec, {
-                "artifact_service": spec.service,
-                "artifact_name": spec.name,
-                "artifact_version": spec.version,
-                "artifact_description": spec.description,
-                "result": result.result}
+        self._workers = workers
+        self._index_folder = index_folder
+        self._result_cache_folder = result_cache_folder
+
+        if not isinstance(self._browser_type, BrowserType):
+            raise NotImplementedError(f"Browser type {self._browser_type} not supported")
+
+    def _make_session(self) -> ProfileSession:
+        return ProfileSession(
+            self._profile_folder_path, self._browser_type, self._cache_folder_path,
+            subscriptions=self._plugin_loader.subscriptions, index_folder=self._index_folder,
+            result_cache_folder=self._result_cache_folder)
+
+    async def _run_artifact(self, spec: ArtifactSpec, session: ProfileSession):
+        spec, path = self._plugin_loader[spec.name]
+        result = session.run_artifact(spec, path, self._log_callback, self._storage_maker_func(spec))
+        return spec, make_result_envelope(spec, result.result)
+
+    def _make_job(self, spec: ArtifactSpec) -> ArtifactJob:
+        return ArtifactJob(
+            spec.name, self._profile_folder_path, self._browser_type, self._cache_folder_path,
+            self._storage_maker_func, self._index_folder, self._result_cache_folder)
+
+    async def _run_all_in_pool(self):
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._workers, initializer=init_worker, initargs=(self._plugin_path,)) as pool:
+            futures = [
+                loop.run_in_executor(pool, run_artifact_job, self._make_job(spec)) for spec, path in self.artifacts]
+            for future in asyncio.as_completed(futures):
+                artifact_name, envelope, log_messages = await future
+                for message in log_messages:
+                    self._log_callback(message)
+                spec, path = self._plugin_loader[artifact_name]
+                yield spec, envelope
 
     async def run_all(self):
         """
-        Async generator function that runs all loaded plugins against the profile folder provided to the constructor
+        Async generator function that runs all loaded plugins against the profile folder provided to the constructor.
+        In process, a single profile session is opened for the run and shared by every artifact; with multiple
+        workers, each worker process keeps its own session. Results are yielded as they are completed.
         """
-        tasks = (self._run_artifact(spec) for spec, path in self.artifacts)
-        for coro in asyncio.as_completed(tasks):
-            yield await coro
+        if self._workers > 1:
+            async for spec, envelope in self._run_all_in_pool():
+                yield spec, envelope
+            return
+
+        with self._make_session() as session:
+            tasks = (self._run_artifact(spec, session) for spec, path in self.artifacts)
+            for coro in asyncio.as_completed(tasks):
+                yield await coro
 
     async def run_one(self, artifact_name: str):
         """
@@ -146,8 +173,8 @@ class MisterSkinnylegs:
         :param artifact_name:
         """
         spec, path = self._plugin_loader[artifact_name]
-        result = self._run_artifact(spec)
-        return spec, result
+        with self._make_session() as session:
+            return await self._run_artifact(spec, session)
 
     @property
     def artifacts(self) -> colabc.Iterable[tuple[ArtifactSpec, pathlib.Path]]:
@@ -161,6 +188,10 @@ class MisterSkinnylegs:
     def browser_type(self):
         return self._browser_type
 
+    @property
+    def workers(self) -> int:
+        return self._workers
+
     @staticmethod
     def log_fallback(message: str):
         print(f"Log:\t{message}")
@@ -184,19 +215,16 @@ class MisterSkinnylegs:
         :param log_callback: a LogFunction callback
         :return:
         """
-        if browser_type == BrowserType.chromium:
-            profile = ChromiumProfileFolder(profile_path, cache_folder=cache_path, missing_data_ok=True)
-        elif browser_type == BrowserType.mozilla:
-            profile = MozillaProfileFolder(profile_path, cache_path)
-        else:
+        if not isinstance(browser_type, BrowserType):
             raise ValueError(f"Unknown BrowserType: {browser_type}")
 
+        profile = open_profile(profile_path, browser_type, cache_path)
         return spec.function(profile, log_callback, storage)
 
 
 class SimpleLog:
     """
-    A simple log class designed to be passed around.
+    A simple log class designed to be passed around. Messages can be logged from any thread.
     """
 
     def __init__(self, out_path: pathlib.Path):
@@ -206,6 +234,7 @@ class SimpleLog:
         :param out_path: File path for the log file. Must not already exist.
         """
         self._f = out_path.open("xt", encoding="utf-8")
+        self._lock = threading.Lock()
 
     def log_message(self, message: str) -> None:
         """
@@ -217,16 +246,18 @@ class SimpleLog:
         tab = "\t"
         message = message.replace('\n', '\n\t')
         formatted_message = f"{datetime.datetime.now()}{tab}{caller_name}{tab}{message}"
-        self._f.write(formatted_message)
-        self._f.write("\n")
+        with self._lock:
+            self._f.write(formatted_message)
+            self._f.write("\n")
 
-        print(formatted_message.encode(sys.stdout.encoding, "replace").decode(sys.stdout.encoding))
+            print(formatted_message.encode(sys.stdout.encoding, "replace").decode(sys.stdout.encoding))
 
     def close(self) -> None:
         """
         Close the log file.
         """
-        self._f.close()
+        with self._lock:
+            self._f.close()
 
     def __enter__(self):
         return self
@@ -235,26 +266,124 @@ class SimpleLog:
         self.close()
 
 
-def write_csv(csv_out: typing.TextIO, result: list):
-    fields = []
-    for rec in result:
-        for k in rec.keys():
-            if k not in fields:
-                fields.append(k)
+def write_csv(
+        csv_out: typing.TextIO, result: colabc.Iterable, columns: typing.Optional[colabc.Sequence[str]]=None,
+        log: typing.Optional[LogFunction]=None):
+    write_csv_result(csv_out, result, columns, log_func=log)
+
+
+def write_artifact_output(
+        spec: ArtifactSpec, result: dict, report_output_folder: pathlib.Path,
+        log: LogFunction, table_formats: colabc.Sequence[str]=DEFAULT_TABLE_FORMATS,
+        jsonl_shard_rows: typing.Optional[int]=None) -> typing.Optional[pathlib.Path]:
+    """
+    Writes an artifact's result envelope to the report output folder (as json, and also in each of the table formats
+    for table artifacts). The sqlite table format adds the rows to the case database in the report output folder,
+    which is shared by all the artifacts; the json lines formats write a header file plus the rows (in shards of
+    jsonl_shard_rows rows, if given).
+
+    :return: the path of the json output, or None if the artifact had no results
+    """
+    log(f"Results acquired for {spec.name}")
+    try:
+        if not result["result"]:
+            log(f"{spec.name} had no results, skipping")
+            return None
+
+        out_dir_path = report_output_folder / sanitize_filename(spec.service)
+        out_dir_path.mkdir(exist_ok=True)
+        out_file_path = out_dir_path / (sanitize_filename(spec.name) + ".json")
+
+        log(f"Generating output at {out_file_path}")
 
-    writer = csv.DictWriter(csv_out, fields,)
-    writer.writeheader()
-    for row in result:
-        writer.writerow(
-            {k: (v.friendly_string if isinstance(v, ccl_chromium_reader.structures.ArtifactLocation) else v)
-             for k, v in row.items()})
+        with out_file_path.open("xt", encoding="utf-8") as out:
+            write_json_result(out, result)
+        if spec.presentation == ReportPresentation.table:
+            for table_format in dict.fromkeys(table_formats):
+                if table_format == "sqlite":
+                    table_out_path = report_output_folder / CASE_DATABASE_FILE_NAME
+                elif table_format in JSONL_FORMATS:
+                    table_out_path = out_file_path.with_suffix(f".{table_format}.header.json")
+                else:
+                    table_out_path = out_file_path.with_suffix(f".{table_format}")
+                log(f"Generating {table_format} output at {table_out_path}")
+                match table_format:
+                    case "csv":
+                        with table_out_path.open("xt", encoding="utf-8", newline="") as csv_out:
+                            csv_out.write("\ufeff")
+                            write_csv(csv_out, result["result"], spec.columns, log)
+                    case "parquet" | "arrow":
+                        write_columnar_result(
+                            table_out_path, table_format, result["result"], spec.columns, log_func=log)
+                    case "sqlite":
+                        with CaseDatabase(table_out_path) as case_db:
+                            case_db.add_table(result, spec.columns, log_func=log)
+                    case "jsonl" | "jsonl.gz" | "jsonl.zst":
+                        write_jsonl_result(
+                            out_dir_path, out_file_path.stem, result, table_format, jsonl_shard_rows)
+                    case _:
+                        raise ValueError(f"Unsupported table format: {table_format}")
+
+        return out_file_path
+    finally:
+        if isinstance(result["result"], RowSpool):
+            result["result"].close()
+
+
+def add_to_timeline(
+        timeline: typing.Optional[TimelineBuilder], spec: ArtifactSpec, result: dict, log: LogFunction) -> None:
+    """
+    Adds the artifact's rows to the timeline, if there is one and the artifact is timestamped. Must be called before
+    the result is written (which releases the rows).
+    """
+    if timeline is None or not is_timeline_artifact(spec) or not result["result"]:
+        return
+    event_count = timeline.add_artifact(spec, result["result"])
+    log(f"Added {event_count} events from {spec.name} to the timeline")
+
+
+def write_timeline(timeline: TimelineBuilder, report_output_folder: pathlib.Path, log: LogFunction) -> None:
+    """
+    Writes the timeline to the report output folder, and deletes any data it spilled to disk.
+    """
+    with timeline:
+        timeline_path = report_output_folder / TIMELINE_FILE_NAME
+        log(f"Generating timeline at {timeline_path}")
+        with timeline_path.open("xt", encoding="utf-8", newline="") as out:
+            out.write("\ufeff")
+            event_count = timeline.write_csv(out)
+        log(f"Timeline contains {event_count} events")
+
+
+def check_sidecar_folders(
+        input_folders: colabc.Iterable[typing.Optional[pathlib.Path]],
+        sidecar_folders: colabc.Iterable[typing.Optional[pathlib.Path]]) -> None:
+    """
+    Checks that none of the sidecar folders (index folder, result cache) are inside any of the input folders.
+    """
+    input_folders = tuple(folder.resolve() for folder in input_folders if folder is not None)
+    for sidecar_folder in sidecar_folders:
+        if sidecar_folder is None:
+            continue
+        for source_folder in input_folders:
+            if sidecar_folder.resolve().is_relative_to(source_folder):
+                raise ValueError(f"Folder {sidecar_folder} must not be inside the input folder {source_folder}")
 
 
 async def main(
         profile_input_folder: pathlib.Path,
         report_output_folder: pathlib.Path,
         browser_type: BrowserType,
-        cache_folder: typing.Optional[pathlib.Path]=None):
+        cache_folder: typing.Optional[pathlib.Path]=None,
+        workers: int=1,
+        index_folder: typing.Optional[pathlib.Path]=None,
+        result_cache_folder: typing.Optional[pathlib.Path]=None,
+        table_formats: colabc.Sequence[str]=DEFAULT_TABLE_FORMATS,
+        jsonl_shard_rows: typing.Optional[int]=None,
+        timeline: bool=False,
+        writer_threads: int=DEFAULT_WRITER_THREADS,
+        dedup_media: bool=False,
+        media_archive_format: typing.Optional[str]=None):
     print(BANNER)
 
     if not profile_input_folder.is_dir():
@@ -268,6 +397,11 @@ async def main(
         if cache_folder is None or not cache_folder.is_dir():
             raise NotADirectoryError("Processing Mozilla requires a specific cache folder")
 
+    check_sidecar_folders((profile_input_folder, cache_folder), (index_folder, result_cache_folder))
+    check_table_formats(table_formats)
+    if jsonl_shard_rows is not None and jsonl_shard_rows < 1:
+        raise ValueError("jsonl_shard_rows must be at least 1")
+
     report_output_folder.mkdir(parents=True)
     log_file = SimpleLog(report_output_folder / f"log_{datetime.datetime.now():%Y%m%d_%H%M%S}.log")
     log = log_file.log_message
@@ -276,14 +410,21 @@ async def main(
         PLUGIN_PATH,
         profile_input_folder,
         browser_type,
-        lambda s: ArtifactFileSystemStorage(
-            report_output_folder / sanitize_filename(s.service),
-            sanitize_filename(s.name) + "_files"),
+        ArtifactFileSystemStorageMaker(report_output_folder, dedup_media, media_archive_format),
         cache_folder=cache_folder,
-        log_callback=log)
+        log_callback=log,
+        workers=workers,
+        index_folder=index_folder,
+        result_cache_folder=result_cache_folder)
 
     log(f"Mister Skinnylegs v{__version__} is on the go!")
     log(f"Working with profile folder: {mr_sl.profile_folder}")
+    if mr_sl.workers > 1:
+        log(f"Running artifacts with {mr_sl.workers} worker processes")
+    if index_folder is not None:
+        log(f"Using profile index folder: {index_folder}")
+    if result_cache_folder is not None:
+        log(f"Using result cache folder: {result_cache_folder}")
     log("")
 
     log("Plugins loaded:")
@@ -294,29 +435,193 @@ async def main(
     log("")
     log("Processing starting...")
 
-    async for spec, result in mr_sl.run_all():
-        log(f"Results acquired for {spec.name}")
-        if not result["result"]:
-            log(f"{spec.name} had no results, skipping")
-            continue
+    # results are written on the pipeline's threads while the next artifacts run; the timeline has to be added to
+    # here, in order, before the result is handed over (writing a result releases its rows)
+    timeline_builder = TimelineBuilder() if timeline else None
+    with OutputPipeline(writer_threads) as pipeline:
+        async for spec, result in mr_sl.run_all():
+            add_to_timeline(timeline_builder, spec, result, log)
+            pipeline.submit(
+                write_artifact_output, spec, result, report_output_folder, log, table_formats, jsonl_shard_rows)
+    if timeline_builder is not None:
+        write_timeline(timeline_builder, report_output_folder, log)
 
-        out_dir_path = report_output_folder / sanitize_filename(spec.service)
-        out_dir_path.mkdir(exist_ok=True)
-        out_file_path = out_dir_path / (sanitize_filename(spec.name) + ".json")
+    log("")
+    log("Processing complete")
+    log("Mister Skinnylegs is going home...")
 
-        log(f"Generating output at {out_file_path}")
+    log_file.close()
+    print()
+    print()
 
-        with out_file_path.open("xt", encoding="utf-8") as out:
-            json.dump(result, out, cls=ExtendedEncoder)
-        if spec.presentation == ReportPresentation.table:
-            csv_out_path = out_file_path.with_suffix(".csv")
-            log(f"Generating csv output at {csv_out_path}")
-            with csv_out_path.open("xt", encoding="utf-8", newline="") as csv_out:
-                csv_out.write("\ufeff")
-                write_csv(csv_out, result["result"])
 
+async def batch_main(
+        profiles: colabc.Sequence[BatchProfile],
+        report_output_folder: pathlib.Path,
+        workers: int,
+        index_folder: typing.Optional[pathlib.Path]=None,
+        result_cache_folder: typing.Optional[pathlib.Path]=None,
+        table_formats: colabc.Sequence[str]=DEFAULT_TABLE_FORMATS,
+        jsonl_shard_rows: typing.Optional[int]=None,
+        timeline: bool=False,
+        writer_threads: int=DEFAULT_WRITER_THREADS,
+        dedup_media: bool=False,
+        media_archive_format: typing.Optional[str]=None):
+    """
+    Runs every artifact against every profile in a batch. Each (profile, artifact) pair is a job for a single
+    worker pool shared by the whole batch; each profile's output (and log, and timeline if requested) goes in its
+    own subfolder of the report output folder, and a summary of the batch is written to batch_summary.json.
+    Output is written on the writer threads, with all of a profile's output written by the same thread.
+    """
+    print(BANNER)
+
+    if report_output_folder.exists():
+        raise FileExistsError(f"Output folder {report_output_folder} already exists")
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    check_table_formats(table_formats)
+    if jsonl_shard_rows is not None and jsonl_shard_rows < 1:
+        raise ValueError("jsonl_shard_rows must be at least 1")
+
+    report_output_folder.mkdir(parents=True)
+    log_file = SimpleLog(report_output_folder / f"log_{datetime.datetime.now():%Y%m%d_%H%M%S}.log")
+    log = log_file.log_message
+    plugin_loader = PluginLoader(PLUGIN_PATH)
+    specs = [spec for spec, path in plugin_loader.artifacts]
+    started = datetime.datetime.now()
+
+    log(f"Mister Skinnylegs v{__version__} is on the go!")
+    log(f"Working with a batch of {len(profiles)} profiles, {len(specs)} artifacts and {workers} worker processes")
     log("")
-    log("Processing complete")
+
+    # validate the profiles up front so that one bad entry doesn't stop the rest of the batch
+    summaries: dict[str, dict] = {}
+    runnable = []
+    for profile in profiles:
+        summary = {
+            "name": profile.name,
+            "profile_folder": str(profile.profile_path),
+            "browser_type": profile.browser_type.name,
+            "cache_folder": str(profile.cache_folder) if profile.cache_folder is not None else None,
+            "output_folder": str(report_output_folder / profile.name),
+            "status": "pending",
+            "artifacts_run": 0,
+            "artifacts_with_results": [],
+            "errors": []
+        }
+        summaries[profile.name] = summary
+        try:
+            if not profile.profile_path.is_dir():
+                raise NotADirectoryError(f"Profile folder {profile.profile_path} does not exist or is not a directory")
+            if profile.browser_type == BrowserType.mozilla and (
+                    profile.cache_folder is None or not profile.cache_folder.is_dir()):
+                raise NotADirectoryError("Processing Mozilla requires a specific cache folder")
+            check_sidecar_folders((profile.profile_path, profile.cache_folder), (index_folder, result_cache_folder))
+        except (OSError, ValueError) as ex:
+            log(f"Skipping profile {profile.name}: {ex}")
+            summary["status"] = "skipped"
+            summary["errors"].append({"artifact": None, "error": str(ex)})
+            continue
+        runnable.append(profile)
+
+    # each profile gets its own log, opened with its first result and closed after its last
+    profile_logs: dict[str, SimpleLog] = {}
+    remaining_jobs = {profile.name: len(specs) for profile in runnable}
+    timelines = {profile.name: TimelineBuilder() for profile in runnable} if timeline else {}
+
+    def profile_log(profile: BatchProfile) -> SimpleLog:
+        if profile.name not in profile_logs:
+            profile_output_folder = report_output_folder / profile.name
+            profile_output_folder.mkdir(exist_ok=True)
+            profile_logs[profile.name] = SimpleLog(
+                profile_output_folder / f"log_{datetime.datetime.now():%Y%m%d_%H%M%S}.log")
+            profile_logs[profile.name].log_message(f"Working with profile folder: {profile.profile_path}")
+        return profile_logs[profile.name]
+
+    def write_profile_output(profile: BatchProfile, spec: ArtifactSpec, envelope: dict, plog: LogFunction):
+        # a failure is recorded against the profile rather than raised, which would abort the rest of the batch
+        try:
+            if write_artifact_output(
+                    spec, envelope, report_output_folder / profile.name, plog,
+                    table_formats, jsonl_shard_rows) is not None:
+                summaries[profile.name]["artifacts_with_results"].append(spec.name)
+        except Exception as ex:
+            log(f"ERROR: writing the output of {spec.name} failed for profile {profile.name}: {ex!r}")
+            plog(f"ERROR: writing the output of {spec.name} failed: {ex!r}")
+            summaries[profile.name]["errors"].append({"artifact": spec.name, "error": repr(ex)})
+
+    def finish_profile(profile: BatchProfile, plog: LogFunction):
+        summary = summaries[profile.name]
+        if profile.name in timelines:
+            write_timeline(timelines.pop(profile.name), report_output_folder / profile.name, plog)
+        summary["status"] = "complete" if not summary["errors"] else "complete_with_errors"
+        profile_logs.pop(profile.name).close()
+        log(f"Profile {profile.name} complete "
+            f"({len(summary['artifacts_with_results'])} artifacts with results, "
+            f"{len(summary['errors'])} errors)")
+
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(PLUGIN_PATH,)) as pool, \
+            OutputPipeline(writer_threads) as pipeline:
+
+        async def run_job(profile: BatchProfile, job: ArtifactJob):
+            try:
+                return profile, job, await loop.run_in_executor(pool, run_artifact_job, job), None
+            except Exception as ex:
+                return profile, job, None, ex
+
+        # jobs are queued profile by profile so that workers tend to keep working on the same (already open) profile
+        jobs = [
+            run_job(profile, ArtifactJob(
+                spec.name, profile.profile_path, profile.browser_type, profile.cache_folder,
+                ArtifactFileSystemStorageMaker(report_output_folder / profile.name, dedup_media, media_archive_format),
+                index_folder, result_cache_folder))
+            for profile in runnable for spec in specs]
+        log(f"Processing {len(jobs)} jobs...")
+
+        for coro in asyncio.as_completed(jobs):
+            profile, job, job_result, ex = await coro
+            summary = summaries[profile.name]
+            summary["status"] = "running"
+            plog = profile_log(profile).log_message
+            if ex is not None:
+                log(f"ERROR: {job.artifact_name} failed for profile {profile.name}: {ex!r}")
+                plog(f"ERROR: {job.artifact_name} failed: {ex!r}")
+                summary["errors"].append({"artifact": job.artifact_name, "error": repr(ex)})
+            else:
+                artifact_name, envelope, log_messages = job_result
+                for message in log_messages:
+                    plog(message)
+                spec, path = plugin_loader[artifact_name]
+                add_to_timeline(timelines.get(profile.name), spec, envelope, plog)
+                pipeline.submit(write_profile_output, profile, spec, envelope, plog, key=profile.name)
+                summary["artifacts_run"] += 1
+
+            remaining_jobs[profile.name] -= 1
+            if remaining_jobs[profile.name] == 0:
+                # runs after the profile's output has been written, as it's on the same thread
+                pipeline.submit(finish_profile, profile, plog, key=profile.name)
+
+    finished = datetime.datetime.now()
+    batch_summary = {
+        "mister_skinnylegs_version": __version__,
+        "started": started.isoformat(),
+        "finished": finished.isoformat(),
+        "workers": workers,
+        "profile_count": len(profiles),
+        "profiles_processed": len(runnable),
+        "profiles_skipped": len(profiles) - len(runnable),
+        "artifact_count": len(specs),
+        "error_count": sum(len(summary["errors"]) for summary in summaries.values()),
+        "profiles": list(summaries.values())
+    }
+    with (report_output_folder / "batch_summary.json").open("xt", encoding="utf-8") as out:
+        json.dump(batch_summary, out, indent=2)
+
+    log("")
+    log(f"Batch complete in {finished - started}: {batch_summary['profiles_processed']} profiles processed, "
+        f"{batch_summary['profiles_skipped']} skipped, {batch_summary['error_count']} errors")
     log("Mister Skinnylegs is going home...")
 
     log_file.close()
@@ -384,6 +689,51 @@ def cli():
         "help": "output folder for processed data - should not already exist"}
     cache_folder_arg_names = ["--cache-folder", "-c"]
     cache_folder_arg_args = {"action": "store", "dest": "cache_folder", "type": pathlib.Path}
+    workers_arg_names = ["--workers", "-w"]
+    workers_arg_args = {
+        "type": int, "dest": "workers", "default": 1,
+        "help": "number of worker processes to run artifacts in (default: 1, which runs in-process)"}
+    index_folder_arg_names = ["--index-folder", "-i"]
+    index_folder_arg_args = {
+        "type": pathlib.Path, "dest": "index_folder", "default": None,
+        "help": "optional folder to keep a persistent index of the profile's cache and history in, which speeds up "
+                "repeat runs against the same profile (must not be inside the profile folder)"}
+    result_cache_arg_names = ["--result-cache", "-r"]
+    result_cache_arg_args = {
+        "type": pathlib.Path, "dest": "result_cache", "default": None,
+        "help": "optional folder to cache artifact results in; on later runs against the same profile, artifacts "
+                "whose plugin and input data haven't changed are not re-run (must not be inside the profile folder)"}
+    table_format_arg_names = ["--table-format", "-T"]
+    table_format_arg_args = {
+        "action": "append", "choices": TABLE_FORMATS, "dest": "table_formats", "default": None,
+        "help": "format to write table artifacts' rows in, alongside the json output; can be given more than once "
+                f"(default: {', '.join(DEFAULT_TABLE_FORMATS)}). The parquet and arrow formats require pyarrow, "
+                "jsonl.zst requires zstandard"}
+    timeline_arg_names = ["--timeline"]
+    timeline_arg_args = {
+        "action": "store_true", "dest": "timeline",
+        "help": f"also write a single timeline ({TIMELINE_FILE_NAME}) of the events from every artifact which has "
+                f"timestamps, in time order"}
+    writer_threads_arg_names = ["--writer-threads", "-W"]
+    writer_threads_arg_args = {
+        "type": int, "dest": "writer_threads", "default": DEFAULT_WRITER_THREADS,
+        "help": "number of threads writing output while artifacts are being run "
+                f"(default: {DEFAULT_WRITER_THREADS}; 0 writes each artifact's output before running the next)"}
+    dedup_media_arg_names = ["--dedup-media", "-D"]
+    dedup_media_arg_args = {
+        "action": "store_true", "dest": "dedup_media",
+        "help": "store each distinct exported file (e.g., thumbnails) once, in a content-addressed store in the "
+                f"output folder ({MEDIA_STORE_FOLDER_NAME}), with the artifacts' files hard linked to it"}
+    media_archive_arg_names = ["--media-archive", "-A"]
+    media_archive_arg_args = {
+        "choices": ARCHIVE_FORMATS, "dest": "media_archive", "default": None,
+        "help": "write the files exported by each artifact (e.g., thumbnails) into a single zip or tar archive, "
+                "with an index mapping the references in the output to the archive's members, rather than as "
+                "separate files"}
+    shard_rows_arg_names = ["--shard-rows", "-S"]
+    shard_rows_arg_args = {
+        "type": int, "dest": "shard_rows", "default": None,
+        "help": "with the jsonl table formats, split each artifact's rows into files of (at most) this many rows"}
 
     sub_parsers = arg_parser.add_subparsers(required=True, help="browsers", dest="browser_type")
     chrome_parser = sub_parsers.add_parser("chromium")
@@ -407,6 +757,16 @@ def cli():
         required=True,
         **output_folder_arg_args
     )
+    chrome_parser.add_argument(*workers_arg_names, **workers_arg_args)
+    chrome_parser.add_argument(*index_folder_arg_names, **index_folder_arg_args)
+    chrome_parser.add_argument(*result_cache_arg_names, **result_cache_arg_args)
+    chrome_parser.add_argument(*table_format_arg_names, **table_format_arg_args)
+    chrome_parser.add_argument(*shard_rows_arg_names, **shard_rows_arg_args)
+    chrome_parser.add_argument(*timeline_arg_names, **timeline_arg_args)
+    chrome_parser.add_argument(*writer_threads_arg_names, **writer_threads_arg_args)
+    chrome_media_group = chrome_parser.add_mutually_exclusive_group()
+    chrome_media_group.add_argument(*dedup_media_arg_names, **dedup_media_arg_args)
+    chrome_media_group.add_argument(*media_archive_arg_names, **media_archive_arg_args)
     mozilla_parser.add_argument(
         *profile_folder_arg_names,
         required=True,
@@ -425,6 +785,53 @@ def cli():
         required=True,
         **output_folder_arg_args
     )
+    mozilla_parser.add_argument(*workers_arg_names, **workers_arg_args)
+    mozilla_parser.add_argument(*index_folder_arg_names, **index_folder_arg_args)
+    mozilla_parser.add_argument(*result_cache_arg_names, **result_cache_arg_args)
+    mozilla_parser.add_argument(*table_format_arg_names, **table_format_arg_args)
+    mozilla_parser.add_argument(*shard_rows_arg_names, **shard_rows_arg_args)
+    mozilla_parser.add_argument(*timeline_arg_names, **timeline_arg_args)
+    mozilla_parser.add_argument(*writer_threads_arg_names, **writer_threads_arg_args)
+    mozilla_media_group = mozilla_parser.add_mutually_exclusive_group()
+    mozilla_media_group.add_argument(*dedup_media_arg_names, **dedup_media_arg_args)
+    mozilla_media_group.add_argument(*media_archive_arg_names, **media_archive_arg_args)
+
+    batch_parser = sub_parsers.add_parser(
+        "batch",
+        help="process many profiles, listed in a manifest or found under a root folder")
+    batch_source_group = batch_parser.add_mutually_exclusive_group(required=True)
+    batch_source_group.add_argument(
+        "--manifest", "-m",
+        type=pathlib.Path,
+        dest="manifest",
+        help="a json file listing the profiles to process: a list of objects with the keys 'profile', 'browser' "
+             "('chromium' or 'mozilla') and optionally 'cache' and 'name'")
+    batch_source_group.add_argument(
+        "--root-folder", "-f",
+        type=pathlib.Path,
+        dest="root_folder",
+        help="a folder to search for profiles; every chromium profile, and every mozilla profile whose cache "
+             "folder can be found, is processed")
+    batch_parser.add_argument(
+        *output_folder_arg_names,
+        required=True,
+        **output_folder_arg_args
+    )
+    batch_parser.add_argument(
+        *workers_arg_names,
+        type=int,
+        dest="workers",
+        default=os.cpu_count() or 1,
+        help="number of worker processes shared by the whole batch (default: the number of CPUs)")
+    batch_parser.add_argument(*index_folder_arg_names, **index_folder_arg_args)
+    batch_parser.add_argument(*result_cache_arg_names, **result_cache_arg_args)
+    batch_parser.add_argument(*table_format_arg_names, **table_format_arg_args)
+    batch_parser.add_argument(*shard_rows_arg_names, **shard_rows_arg_args)
+    batch_parser.add_argument(*timeline_arg_names, **timeline_arg_args)
+    batch_parser.add_argument(*writer_threads_arg_names, **writer_threads_arg_args)
+    batch_media_group = batch_parser.add_mutually_exclusive_group()
+    batch_media_group.add_argument(*dedup_media_arg_names, **dedup_media_arg_args)
+    batch_media_group.add_argument(*media_archive_arg_names, **media_archive_arg_args)
     if "-h" in sys.argv or "--help" in sys.argv:
         print(BANNER)
         arg_parser.print_help()
@@ -441,9 +848,29 @@ def cli():
         exit(0)
 
     args = arg_parser.parse_args()
+    table_formats = tuple(args.table_formats) if args.table_formats else DEFAULT_TABLE_FORMATS
+
+    if args.browser_type == "batch":
+        if args.manifest is not None:
+            profiles = read_manifest(args.manifest)
+        else:
+            if not args.root_folder.is_dir():
+                raise NotADirectoryError(f"Root folder {args.root_folder} does not exist or is not a directory")
+            profiles = discover_profiles(args.root_folder)
+        asyncio.run(
+            batch_main(profiles, args.output_folder, args.workers,
+                       index_folder=args.index_folder, result_cache_folder=args.result_cache,
+                       table_formats=table_formats, jsonl_shard_rows=args.shard_rows,
+                       timeline=args.timeline, writer_threads=args.writer_threads, dedup_media=args.dedup_media,
+                       media_archive_format=args.media_archive))
+        return
 
     asyncio.run(
-        main(args.profile_folder, args.output_folder, BrowserType[args.browser_type], cache_folder=args.cache_folder))
+        main(args.profile_folder, args.output_folder, BrowserType[args.browser_type], cache_folder=args.cache_folder,
+             workers=args.workers, index_folder=args.index_folder, result_cache_folder=args.result_cache,
+             table_formats=table_formats, jsonl_shard_rows=args.shard_rows, timeline=args.timeline,
+             writer_threads=args.writer_threads, dedup_media=args.dedup_media,
+             media_archive_format=args.media_archive))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import itertools
+import queue
+import threading
+import typing
+import collections.abc as colabc
+
+# the number of threads writing output by default
+DEFAULT_WRITER_THREADS = 2
+# the number of tasks which can be waiting for each writer thread before submitting more blocks
+DEFAULT_QUEUE_SIZE = 4
+
+
+class OutputPipeline:
+    """
+    Runs output tasks (e.g., writing an artifact's results) on dedicated writer threads, so that encoding and writing
+    the output of one artifact overlaps with running the next. Each thread has a bounded queue: once it is full,
+    submit blocks until the thread catches up, so results can't pile up in memory faster than they can be written.
+
+    Tasks submitted with the same key always run on the same thread, in the order they were submitted; tasks
+    without a key are shared between the threads in turn. An exception in a task doesn't stop the tasks after it;
+    the first exception is raised again by close (or by the next call to submit). With no threads, tasks are simply
+    run as they are submitted.
+    """
+    def __init__(self, thread_count: int=DEFAULT_WRITER_THREADS, queue_size: int=DEFAULT_QUEUE_SIZE):
+        """
+        Constructor
+
+        :param thread_count: the number of writer threads; 0 runs tasks in the submitting thread
+        :param queue_size: the number of tasks which can be waiting for each thread
+        """
+        if thread_count < 0:
+            raise ValueError("thread_count must not be negative")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self._queues: list[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(thread_count)]
+        self._threads = [
+            threading.Thread(target=self._work, args=(q,), name=f"output-writer-{idx}", daemon=True)
+            for idx, q in enumerate(self._queues)]
+        self._round_robin = itertools.cycle(range(thread_count)) if thread_count else None
+        self._errors: list[Exception] = []
+        self._closed = False
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self, task_queue: queue.Queue) -> None:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                return
+            func, args = task
+            try:
+                func(*args)
+            except Exception as ex:
+                self._errors.append(ex)
+
+    def _raise_error(self) -> None:
+        if self._errors:
+            raise self._errors[0]
+
+    def submit(self, func: colabc.Callable[..., typing.Any], *args, key: typing.Optional[colabc.Hashable]=None) -> None:
+        """
+        Queues func(*args) to be run on a writer thread, blocking while that thread's queue is full.
+
+        :param func: the function to run
+        :param args: the arguments to pass to it
+        :param key: optional key; tasks with the same key run on the same thread in order
+        """
+        if self._closed:
+            raise ValueError("The pipeline is closed")
+        self._raise_error()
+        if not self._queues:
+            func(*args)
+            return
+        idx = hash(key) % len(self._queues) if key is not None else next(self._round_robin)
+        self._queues[idx].put((func, args))
+
+    @property
+    def thread_count(self) -> int:
+        return len(self._threads)
+
+    def close(self) -> None:
+        """
+        Waits for all of the queued tasks to finish and stops the threads. Raises the first exception from a task,
+        if there was one.
+        """
+        if not self._closed:
+            self._closed = True
+            for task_queue in self._queues:
+                task_queue.put(None)
+            for thread in self._threads:
+                thread.join()
+        self._raise_error()
+
+    def __enter__(self) -> "OutputPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # already failing, so just finish up without replacing the exception
+            try:
+                self.close()
+            except Exception:
+                pass
@@ -2,6 +2,7 @@ import json
 import re
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
 
@@ -74,7 +75,8 @@ __artifacts__ = (
         "Recovers Binance User Details records from the Cache",
         "0.1",
         get_binance_userdetails,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(USER_DETAILS_PATTERN),)
     ),
     ArtifactSpec(
         "Binance",
@@ -82,6 +84,7 @@ __artifacts__ = (
         "Recovers Binance Balance records from the Cache",
         "0.1",
         get_binance_balances,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(BALANCES_PATTERN),)
     ),
 )
@@ -3,6 +3,7 @@ import re
 import urllib.parse
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
 SEARCH_URL_PATTERN = re.compile(r"https?://.*bing.*?\.[A-z]{2,3}/search")
@@ -55,6 +56,8 @@ __artifacts__ = (
         "0.2.1",
         bing_search_urls,
         ReportPresentation.table,
-        timestamp_field_names=("timestamp",)
+        timestamp_field_names=("timestamp",),
+        cache_subscriptions=(CacheSubscription(SEARCH_URL_PATTERN),),
+        history_subscriptions=(HistorySubscription(SEARCH_URL_PATTERN),)
     ),
 )
@@ -3,6 +3,7 @@ import re
 from datetime import datetime
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
 
@@ -99,7 +100,9 @@ __artifacts__ = (
         "Recovers ChatGPT chat information from History and Cache",
         "0.2",
         get_chatgpt_chatinfo,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(CONVERSATION_API_URL_PATTERN),),
+        history_subscriptions=(HistorySubscription(CONVERSATION_URL_PATTERN),)
     ),
     ArtifactSpec(
         "ChatGPT",
@@ -107,6 +110,7 @@ __artifacts__ = (
         "Recovers ChatGPT user information from Cache",
         "0.2",
         get_chatgpt_userinfo,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(USER_DETAILS_API_URL_PATTERN),)
     ),
 )
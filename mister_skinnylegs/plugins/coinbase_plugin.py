@@ -2,6 +2,7 @@ import json
 import re
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
 
@@ -230,7 +231,8 @@ __artifacts__ = (
         "Recovers Coinbase Payement Methods records from the Cache",
         "0.1",
         get_coinbase_paymentmethods,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(PAYMENT_METHODS_PATTERN),)
     ),
     ArtifactSpec(
         "Coinbase",
@@ -238,7 +240,8 @@ __artifacts__ = (
         "Recovers Coinbase User Details records from the Cache",
         "0.1",
         get_coinbase_userdetails,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(USER_DETAILS_PATTERN),)
     ),
     ArtifactSpec(
         "Coinbase",
@@ -246,7 +249,8 @@ __artifacts__ = (
         "Recovers Coinbase Balances records from the Cache",
         "0.1",
         get_coinbase_balances,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(BALANCES_PATTERN),)
     ),
     ArtifactSpec(
         "Coinbase",
@@ -254,6 +258,7 @@ __artifacts__ = (
         "Recovers Coinbase Transactions from the Cache",
         "0.1",
         get_coinbase_transactions,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=tuple(CacheSubscription(x) for x in TRANSACTION_PATTERNS)
     ),
 )
@@ -3,6 +3,7 @@ import re
 from datetime import datetime
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
 USER_DETAILS_API_URL_PATTERN = re.compile(r"chat.deepseek.*?\.[A-z]{2,3}/api/v0/users/current")
@@ -202,7 +203,8 @@ __artifacts__ = (
         "Recovers DeepSeek user information from Cache",
         "0.1",
         get_deepseek_userinfo,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(USER_DETAILS_API_URL_PATTERN),)
     ),
     ArtifactSpec(
         "DeepSeek",
@@ -210,7 +212,9 @@ __artifacts__ = (
         "Recovers DeepSeek Chat Session Information from Cache and History",
         "0.1",
         get_deepseek_chat_sessions,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(CHAT_SESSIONS_API_URL_PATTERN),),
+        history_subscriptions=(HistorySubscription(CHAT_URL_PATTERN),)
     ),
     ArtifactSpec(
         "DeepSeek",
@@ -218,6 +222,7 @@ __artifacts__ = (
         "Recovers DeepSeek Chat Messages from Cache",
         "0.1",
         get_deepseek_chat_messages,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(CHAT_MESSAGES_API_URL_PATTERN),)
     ),
 )
\ No newline at end of file
@@ -2,15 +2,17 @@ import json
 import re
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
+MESSAGES_URL_PATTERN = re.compile(r"discord.com/api/v\d{1,2}/channels/\d+?/messages")
 
 def get_messages(profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
     # This is a basic first pass at this, designed to adhere to a tabular output, in reality a custom report
     # format is more appropriate long-term, particularly when it comes to attachments
     results = []
 
-    for cache_rec in profile.iterate_cache(url=re.compile(r"discord.com/api/v\d{1,2}/channels/\d+?/messages")):
+    for cache_rec in profile.iterate_cache(url=MESSAGES_URL_PATTERN):
         msg_list = json.loads(cache_rec.data.decode("utf-8"))
         for msg in msg_list:
             attachments = "\n".join(
@@ -45,6 +47,8 @@ __artifacts__ = (
         "Recovers Discord chat messages from the Cache",
         "0.1",
         get_messages,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp",),
+        cache_subscriptions=(CacheSubscription(MESSAGES_URL_PATTERN),)
     ),
 )
@@ -4,10 +4,13 @@ import datetime
 import urllib.parse
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 from ccl_chromium_reader.ccl_chromium_profile_folder import ChromiumProfileFolder
 
 EPOCH = datetime.datetime(1970, 1, 1)
+THUMBNAIL_URL_PATTERN = re.compile(r"https://previews.dropbox.com/p/thumb/")
+HOME_URL_PATTERN = re.compile(r"dropbox\.com/home")
 
 
 def parse_unix_ms(ms):
@@ -56,7 +59,7 @@ def uax_records(profile: BrowserProfileProtocol, log_func: LogFunction, storage:
 def recovered_file_system(
         profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
     results = set()
-    for rec in profile.iterate_history_records(re.compile(r"dropbox\.com/home")):
+    for rec in profile.iterate_history_records(HOME_URL_PATTERN):
         # example url: https://www.dropbox.com/home/Alpha/Bravo?preview=6b+Mkv.mkv
         split_url = rec.url.split("/home/", 1)
         if len(split_url) < 2:
@@ -78,7 +81,7 @@ def thumbnails(profile: BrowserProfileProtocol, log_func: LogFunction, storage:
     results = []
     has_response_time = isinstance(profile, ChromiumProfileFolder)
 
-    for idx, rec in enumerate(profile.iterate_cache(re.compile(r"https://previews.dropbox.com/p/thumb/"))):
+    for idx, rec in enumerate(profile.iterate_cache(THUMBNAIL_URL_PATTERN)):
         if rec.metadata:
             content_disposition = rec.metadata.get_attribute("content-disposition")[0]
             cache_filename = re.search(r"filename=\"(.+?)\"", content_disposition).group(1)
@@ -86,16 +89,15 @@ def thumbnails(profile: BrowserProfileProtocol, log_func: LogFunction, storage:
         else:
             out_filename = f"{idx}_"
 
-        with storage.get_binary_stream(out_filename, rec.data_location.source_file) as file_out:
-            file_out.write(rec.data)
+        file_reference = storage.put_blob(out_filename, rec.data, rec.data_location.source_file)
 
-        log_func(f"Exporting thumbnail to: {file_out.get_file_location_reference()}")
+        log_func(f"Exporting thumbnail to: {file_reference}")
 
         results.append({
             "url": rec.key.url,
             "cache request time": rec.metadata.request_time if rec.metadata else None,
             "cache response time": rec.metadata.response_time if has_response_time and rec.metadata else None,
-            "extracted file reference": file_out.get_file_location_reference()
+            "extracted file reference": file_reference
         })
 
     results.sort(key=lambda x: x["cache request time"] or datetime.datetime(1601, 1, 1))
@@ -110,7 +112,8 @@ __artifacts__ = (
         "Recovers user activity from 'uxa' records in Session Storage",
         "0.3",
         uax_records,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp",)
     ),
     ArtifactSpec(
         "Dropbox",
@@ -118,7 +121,8 @@ __artifacts__ = (
         "Recovers a partial file system from URLs in the history",
         "0.2",
         recovered_file_system,
-        ReportPresentation.table
+        ReportPresentation.table,
+        history_subscriptions=(HistorySubscription(HOME_URL_PATTERN),)
     ),
     ArtifactSpec(
         "Dropbox",
@@ -126,6 +130,7 @@ __artifacts__ = (
         "Recovers thumbnails for files stored in Dropbox",
         "0.4",
         thumbnails,
-        ReportPresentation.table
+        ReportPresentation.table,
+        cache_subscriptions=(CacheSubscription(THUMBNAIL_URL_PATTERN),)
     ),
 )
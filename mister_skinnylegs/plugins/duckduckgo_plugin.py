@@ -2,6 +2,8 @@ import re
 import urllib.parse
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription
+from mister_skinnylegs.util.common import AnyKeySearch
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
 
@@ -11,6 +13,9 @@ SEARCH_URL_PATTERN = re.compile(r"https?://.*duckduckgo.*?\.[A-z]{2,3}/\?t.*q=")
 SEARCH_LINK_URL_PATTERN = re.compile(r"https?://links.duckduckgo.*?\.[A-z]{2,3}/d.js")
 
 
+_is_search_cache_url = AnyKeySearch(SEARCH_LINK_URL_PATTERN, SEARCH_URL_PATTERN)
+
+
 def _get_search_details(url: str):
     url = urllib.parse.urlsplit(url)
     query = urllib.parse.parse_qs(url.query)
@@ -35,8 +40,7 @@ def ddg_search_urls(
             }
         )
 
-    for cache_rec in profile.iterate_cache(
-            url=lambda u: (SEARCH_LINK_URL_PATTERN.search(u) or SEARCH_URL_PATTERN.search(u)) is not None):
+    for cache_rec in profile.iterate_cache(url=_is_search_cache_url):
         search_term = _get_search_details(cache_rec.key.url)
         results.append(
             {
@@ -58,6 +62,9 @@ __artifacts__ = (
         "Recovers Duckduckgo searches from URLs in history, cache",
         "0.2",
         ddg_search_urls,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp",),
+        cache_subscriptions=(CacheSubscription(_is_search_cache_url),),
+        history_subscriptions=(HistorySubscription(SEARCH_URL_PATTERN),)
     ),
 )
\ No newline at end of file
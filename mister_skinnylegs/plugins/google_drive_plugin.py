@@ -2,6 +2,8 @@ import re
 import datetime
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription
+from mister_skinnylegs.util.common import AnyKeySearch
 from ccl_chromium_reader import ChromiumProfileFolder
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
@@ -19,12 +21,9 @@ def parse_unix_ms(ms):
     return EPOCH + datetime.timedelta(milliseconds=ms)
 
 
-def _matches_file_listing_pattern(s: str):
-    return bool(FOLDERS_URL_PATTERN.match(s) or FILES_URL_PATTERN.match(s) or DOCS_URL_PATTERN.match(s))
-
-
-def _matches_thumbnail_pattern(s: str):
-    return bool(THUMBNAIL_URL_PATTERN_1.search(s) or THUMBNAIL_URL_PATTERN_2.search(s))
+# the listing patterns are all anchored at the start, so searching for them is the same as matching
+_matches_file_listing_pattern = AnyKeySearch(FOLDERS_URL_PATTERN, FILES_URL_PATTERN, DOCS_URL_PATTERN)
+_matches_thumbnail_pattern = AnyKeySearch(THUMBNAIL_URL_PATTERN_1, THUMBNAIL_URL_PATTERN_2)
 
 
 def folders_and_files(
@@ -79,16 +78,15 @@ def thumbnails(profile: BrowserProfileProtocol, log_func: LogFunction, storage:
         else:
             out_filename = f"{idx}_"
 
-        with storage.get_binary_stream(out_filename, rec.data_location.source_file) as file_out:
-            file_out.write(rec.data)
+        file_reference = storage.put_blob(out_filename, rec.data, rec.data_location.source_file)
 
-        log_func(f"Exporting thumbnail to: {file_out.get_file_location_reference()}")
+        log_func(f"Exporting thumbnail to: {file_reference}")
 
         results.append({
             "url": rec.key.url,
             "cache request time": rec.metadata.request_time if rec.metadata else None,
             "cache response time": rec.metadata.response_time if has_response_time and rec.metadata else None,
-            "extracted file reference": file_out.get_file_location_reference()
+            "extracted file reference": file_reference
         })
 
     results.sort(key=lambda x: x["cache request time"] or datetime.datetime(1601, 1, 1))
@@ -118,7 +116,9 @@ __artifacts__ = (
         "Recovers Google Drive and Docs folder and file names (and urls) from history records",
         "0.2",
         folders_and_files,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp",),
+        history_subscriptions=(HistorySubscription(_matches_file_listing_pattern),)
     ),
     ArtifactSpec(
         "Google Drive",
@@ -128,7 +128,8 @@ __artifacts__ = (
         thumbnails,
         ReportPresentation.table,
         None,
-        ["extracted file reference"]
+        ["extracted file reference"],
+        cache_subscriptions=(CacheSubscription(_matches_thumbnail_pattern),)
     ),
     ArtifactSpec(
         "Google Drive",
@@ -136,6 +137,7 @@ __artifacts__ = (
         "Recovers indications of Google Drive usage",
         "0.2",
         timeline_usage,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp",)
     ),
 )
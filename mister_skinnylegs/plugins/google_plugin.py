@@ -6,6 +6,7 @@ import struct
 import urllib.parse
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription
 from ccl_chromium_reader import ChromiumProfileFolder
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
@@ -113,7 +114,10 @@ __artifacts__ = (
         "Recovers google searches from URLs in history, session storage, cache",
         "0.5",
         google_search_urls,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp",),
+        cache_subscriptions=(CacheSubscription(SEARCH_URL_PATTERN, omit_cached_data=True),),
+        history_subscriptions=(HistorySubscription(SEARCH_URL_PATTERN),)
     ),
 )
 
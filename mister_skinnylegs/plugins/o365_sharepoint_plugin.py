@@ -6,6 +6,8 @@ import uuid
 import urllib.parse
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, HistorySubscription, RowSchema
+from mister_skinnylegs.util.common import AnyKeySearch
 from ccl_chromium_reader import ChromiumProfileFolder
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
@@ -61,6 +63,37 @@ DOWNLOADS_ACTIVITY_PATTERNS = [
 
 THUMB_UNIQUE_ID_PATTERN = re.compile(r"(?<=/items/)(?P<unique_id>" + _GUID_FRAGMENT + ")(?=/driveItem)")
 
+# the recent files artifact has a fixed set of columns (filled in from either API), so its rows are compact TableRows
+RECENT_FILES_ROW_SCHEMA = RowSchema((
+    "cache record location",
+    "cache request timestamp",
+    "cache response timestamp",
+    "api endpoint cache url",
+    "method",
+    "source",
+    "id",
+    "odata id",
+    "file name",
+    "file url",
+    "file size",
+    "file created time",
+    "file created by",
+    "file modified time",
+    "file modified by",
+    "record modified time",
+    "file owner",
+    "sharepoint site",
+    "sharepoint web id",
+    "sharepoint list id",
+    "sharepoint unique id",
+    "sharepoint parent id",
+    "onedrive drive id",
+    "onedrive item id",
+    "modified by",
+    "thumbnail url",
+    "extracted thumbnail reference",
+))
+
 NULL_GUID = "00000000-0000-0000-0000-000000000000"
 
 
@@ -105,7 +138,7 @@ def _get_sharepoint_recent_files(profile: BrowserProfileProtocol, log_func: LogF
 
         for file in files:
             file = file["file"]
-            file_results.append({
+            file_results.append(RECENT_FILES_ROW_SCHEMA.row_from_dict({
                 "cache record location": f"{cache_record.data_location.file_name}@{cache_record.data_location.offset}",
                 "cache request timestamp": cache_record.metadata.request_time,
                 "cache response timestamp": cache_record.metadata.response_time if has_response_time else None,
@@ -133,7 +166,7 @@ def _get_sharepoint_recent_files(profile: BrowserProfileProtocol, log_func: LogF
                 "modified by": file["SharePointItem"].get("ModifiedBy"),
                 "thumbnail url": None,
                 "extracted thumbnail reference": None
-            })
+            }))
 
             if file["SharePointItem"]["UniqueId"] != NULL_GUID and file["FileName"]:
                 unique_id = file["SharePointItem"]["UniqueId"].lower()
@@ -154,11 +187,10 @@ def _get_sharepoint_recent_files(profile: BrowserProfileProtocol, log_func: LogF
         else:
             out_file_name = f"thumb_sp_{idx:04}_{unique_id}{extension}"
 
-        with storage.get_binary_stream(out_file_name, source_file=cache_record.data_location.source_file) as out:
-            out.write(cache_record.data)
+        file_reference = storage.put_blob(out_file_name, cache_record.data, cache_record.data_location.source_file)
 
         thumb_file_references.setdefault(unique_id, [])
-        thumb_file_references[unique_id].append((out.get_file_location_reference(), cache_record.key.url))
+        thumb_file_references[unique_id].append((file_reference, cache_record.key.url))
 
     # Add thumb data to relevant records
     for rec in file_results:
@@ -200,7 +232,7 @@ def _get_edgeworth_recent_files(profile: BrowserProfileProtocol, log_func: LogFu
                         f"{file['modification_info']['user']['display_name']} - " +
                         f"{file['modification_info']['user'].get('upn') or file['modification_info']['user'].get('id', '')}")
 
-            file_results.append({
+            file_results.append(RECENT_FILES_ROW_SCHEMA.row_from_dict({
                 "cache record location": f"{cache_record.data_location.file_name}@{cache_record.data_location.offset}",
                 "cache request timestamp": cache_record.metadata.request_time,
                 "cache response timestamp": cache_record.metadata.response_time if has_response_time else None,
@@ -228,7 +260,7 @@ def _get_edgeworth_recent_files(profile: BrowserProfileProtocol, log_func: LogFu
                 "modified by": None,
                 "thumbnail url": None,
                 "extracted thumbnail reference": None
-            })
+            }))
 
             od_drive_id = file["onedrive_info"]["drive_id"] if file.get("onedrive_info") else None
             od_item_id = file["onedrive_info"]["item_id"] if file.get("onedrive_info") else None
@@ -254,11 +286,10 @@ def _get_edgeworth_recent_files(profile: BrowserProfileProtocol, log_func: LogFu
         else:
             out_file_name = f"thumb_gr_{idx:04}_{od_drive_id}_{od_item_id}{extension}"
 
-        with storage.get_binary_stream(out_file_name, cache_record.data_location.source_file) as out:
-            out.write(cache_record.data)
+        file_reference = storage.put_blob(out_file_name, cache_record.data, cache_record.data_location.source_file)
 
         thumb_file_references.setdefault(key, [])
-        thumb_file_references[key].append((out.get_file_location_reference(), cache_record.key.url))
+        thumb_file_references[key].append((file_reference, cache_record.key.url))
 
     # Assign thumb references to records
     for rec in file_results:
@@ -279,16 +310,9 @@ def get_recent_files(profile: BrowserProfileProtocol, log_func: LogFunction, sto
     return ArtifactResult(results)
 
 
-def _is_cache_activity_url(s: str) -> bool:
-    return any(x.search(s) for x in CACHE_ACTIVITY_PATTERNS)
-
-
-def _is_history_activity_url(s: str) -> bool:
-    return any(x.search(s) for x in HISTORY_ACTIVITY_PATTERNS)
-
-
-def _is_downloads_activity_url(s: str) -> bool:
-    return any(x.search(s) for x in DOWNLOADS_ACTIVITY_PATTERNS)
+_is_cache_activity_url = AnyKeySearch(*CACHE_ACTIVITY_PATTERNS)
+_is_history_activity_url = AnyKeySearch(*HISTORY_ACTIVITY_PATTERNS)
+_is_downloads_activity_url = AnyKeySearch(*DOWNLOADS_ACTIVITY_PATTERNS)
 
 
 def get_activity(profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
@@ -467,7 +491,14 @@ __artifacts__ = (
         get_recent_files,
         ReportPresentation.table,
         None,
-        ["extracted thumbnail reference"]
+        ["extracted thumbnail reference"],
+        columns=RECENT_FILES_ROW_SCHEMA.columns,
+        cache_subscriptions=(
+            CacheSubscription(RECENT_FILES_SHAREPOINT_URL_PATTERN),
+            CacheSubscription(SHAREPOINT_THUMB_FILES_URL_PATTERN),
+            CacheSubscription(RECENT_FILES_EDGEWORTH_URL_PATTERN),
+            CacheSubscription(GRAPH_THUMB_FILES_URL_PATTERN),
+        )
     ),
     ArtifactSpec(
         "O365-Sharepoint",
@@ -475,6 +506,9 @@ __artifacts__ = (
         "Recovers artifacts related to user activity (viewing, editing, downloading, etc.) for Sharepoint and O365",
         "0.2",
         get_activity,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp",),
+        cache_subscriptions=(CacheSubscription(_is_cache_activity_url),),
+        history_subscriptions=(HistorySubscription(_is_history_activity_url),)
     ),
 )
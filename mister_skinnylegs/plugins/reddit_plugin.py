@@ -8,7 +8,10 @@ import typing
 import urllib.parse
 
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import CacheSubscription, StreamingArtifactResult
+from mister_skinnylegs.util.common import AnyKeySearch
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
+from mister_skinnylegs.util.spillable import SpillableCollection
 
 # This appears to be an implementation of the Matrix chat platform. With some work we could probably abstract this
 #  to work with Matrix in a generic fashion? Not sure where else we see it at the moment though.
@@ -31,6 +34,13 @@ EPOCH = datetime.datetime(1970, 1, 1)
 mimetypes.add_type("image/webp", ".webp")
 
 
+_is_matrix_url = AnyKeySearch(
+    REDDIT_MATRIX_SYNC_PATTERN,
+    REDDIT_MATRIX_ROOMS_PATTERN,
+    REDDIT_MATRIX_THUMBNAIL_PATTERN,
+    REDDIT_MATRIX_DOWNLOAD_PATTERN)
+
+
 def decode_unix_ms(ms):
     return EPOCH + datetime.timedelta(milliseconds=ms)
 
@@ -79,7 +89,7 @@ def process_message(event: dict, result: dict, log_func: LogFunction):
 
 
 def process_event(
-        event: dict, messages_raw: list,
+        event: dict, messages_raw: SpillableCollection,
         display_name_lookup: dict[str, str], data_location: str,
         log_func: LogFunction) -> typing.NoReturn:
     # Might not always need the result, but we'll grab it here
@@ -145,7 +155,7 @@ def process_event(
                 log_func(f"WARNING: Unexpected event type: {event['type']}")
 
 
-def process_room_endpoint(url: str, obj: dict, messages_raw: list,
+def process_room_endpoint(url: str, obj: dict, messages_raw: SpillableCollection,
                           display_name_lookup: dict[str, str], data_location: str,
                           log_func: LogFunction) -> typing.NoReturn:
     if "/event" in url:
@@ -172,17 +182,13 @@ def process_room_endpoint(url: str, obj: dict, messages_raw: list,
 
 
 def get_messages(profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
-    # we have to collate everything together before we can assign display names, images, etc.
-    messages_raw = []
+    # we have to collate everything together before we can assign display names, images, etc. There can be a lot of
+    #  messages, so they're held in a collection which spills to disk rather than a list
+    messages_raw = SpillableCollection()
     # display_name_lookup: dict[tuple[str, str], str] = {}  # (room, user id) : display name
     display_name_lookup: dict[str, str] = {}  # user id: display name
     media_lookup = {}
-    for i, record in enumerate(profile.iterate_cache(
-            url=lambda x: any(y.search(x) is not None for y in (
-                    REDDIT_MATRIX_SYNC_PATTERN,
-                    REDDIT_MATRIX_ROOMS_PATTERN,
-                    REDDIT_MATRIX_THUMBNAIL_PATTERN,
-                    REDDIT_MATRIX_DOWNLOAD_PATTERN)))):
+    for i, record in enumerate(profile.iterate_cache(url=_is_matrix_url)):
 
         if REDDIT_MATRIX_ROOMS_PATTERN.search(record.key.url):
             obj = json.loads(record.data.decode("utf-8"))
@@ -233,10 +239,12 @@ def get_messages(profile: BrowserProfileProtocol, log_func: LogFunction, storage
     # a reverse lookup would be faster, but needs a one to one with content-to-id but the same resource can
     #  be attributed to multiple ids, annoyingly.
     file_exports: dict[str: int] = {}  # id to a count to do file naming
-    for record in profile.iterate_cache():
-        key_hits = []
-        if not record.data:
+    # only query for the media urls, so that only the bodies of media records are read from the cache
+    media_urls = frozenset(itertools.chain.from_iterable(media_lookup.values()))
+    for record in profile.iterate_cache(url=media_urls) if media_urls else ():
+        if not any(record.key.url in vals for vals in media_lookup.values()) or not record.data:
             continue
+        key_hits = []
         for media_id, vals in media_lookup.items():
             if record.key.url in vals:
                 key_hits.append(media_id)
@@ -247,28 +255,35 @@ def get_messages(profile: BrowserProfileProtocol, log_func: LogFunction, storage
             out_extension = ""
             if record.metadata and (mime := record.metadata.get_attribute("content-type")):
                 out_extension = mimetypes.guess_extension(mime[0]) or ""
-            with storage.get_binary_stream(f"{media_id}_{file_exports[media_id]}{out_extension}", record.data_location.source_file) as o:
-                o.write(record.data)
+            storage.put_blob(
+                f"{media_id}_{file_exports[media_id]}{out_extension}", record.data, record.data_location.source_file)
 
-    # Build a lookup and try and fix up records without a room
-    event_to_room_id = {m["event id"]: m["room id"] for m in messages_raw if m["room id"] is not None}
-    for m in messages_raw:
-        if m["room id"] is None and m["event id"] in event_to_room_id:
-            m["room id"] = event_to_room_id[m["event id"]]
+    return StreamingArtifactResult(_fix_up_messages(messages_raw, display_name_lookup))
 
-    # Insert display names if we've found them
-    for message in messages_raw:
-        # display_name_key = (message["room id"], message["sender id"])
-        display_name_key = message["sender id"]
-        message["sender display name"] = display_name_lookup.get(display_name_key)
 
+def _message_identity(message: dict) -> tuple:
     # a little hacky, but effective method to deduplicate messages. This works as the dict isn't nested in here;
     #  don't do this for nested dicts - it won't work!
-    messages_deduped = sorted(
-        {tuple((k, v) for (k, v) in sorted(msg.items()) if k != "data location"): msg for msg in messages_raw}.values(),
-        key=lambda x: x["timestamp utc"])
+    return tuple((k, v) for (k, v) in sorted(message.items()) if k != "data location")
+
+
+def _fix_up_messages(messages_raw: SpillableCollection, display_name_lookup: dict[str, str]) -> typing.Iterator[dict]:
+    with messages_raw, SpillableCollection(
+            sort_key=lambda x: x["timestamp utc"], dedupe_key=_message_identity) as messages_deduped:
+        # Build a lookup and try and fix up records without a room
+        event_to_room_id = {m["event id"]: m["room id"] for m in messages_raw if m["room id"] is not None}
+        for message in messages_raw:
+            if message["room id"] is None and message["event id"] in event_to_room_id:
+                message["room id"] = event_to_room_id[message["event id"]]
+
+            # Insert display names if we've found them
+            # display_name_key = (message["room id"], message["sender id"])
+            display_name_key = message["sender id"]
+            message["sender display name"] = display_name_lookup.get(display_name_key)
+
+            messages_deduped.append(message)
 
-    return ArtifactResult(messages_deduped)
+        yield from messages_deduped
 
 
 __artifacts__ = (
@@ -278,6 +293,8 @@ __artifacts__ = (
         "Recovers Reddit chat messages from the Cache and IndexedDB",
         "0.2",
         get_messages,
-        ReportPresentation.table
+        ReportPresentation.table,
+        timestamp_field_names=("timestamp utc",),
+        cache_subscriptions=(CacheSubscription(_is_matrix_url),)
     ),
 )
@@ -1,29 +1,34 @@
 from mister_skinnylegs.util.artifact_utils import ArtifactResult, ArtifactSpec, LogFunction, ReportPresentation, ArtifactStorage
+from mister_skinnylegs.util.artifact_utils import StreamingArtifactResult, RowSchema
 from ccl_chromium_reader import ChromiumProfileFolder
 from mister_skinnylegs.util.profile_folder_protocols import BrowserProfileProtocol
 
+# local and session storage dumps can run to millions of rows, so they use compact rows
+STORAGE_ROW_SCHEMA = RowSchema(("record location", "host", "key", "value"))
+
 
 def dump_history(profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
     # TODO: Some of these fields are Chromium specific and may need tweaking for other browsers/standard interface
-    results = []
     is_chrome = isinstance(profile, ChromiumProfileFolder)
-    for rec in profile.iterate_history_records():
-        data = {
-            "record location": rec.record_location,
-            "title": rec.title,
-            "url": rec.url,
-            "visit time": rec.visit_time,
 
-        }
-        if is_chrome:
-            data.update(
-                {
-                    "transition core": rec.transition.core.name,
-                    "transition qualifiers": ", ".join(q.name for q in rec.transition.qualifier),
-                    "parent record id": rec.parent_visit_id if rec.has_parent else "None"
-                }
-            )
-        results.append(data)
+    def rows():
+        for rec in profile.iterate_history_records():
+            data = {
+                "record location": rec.record_location,
+                "title": rec.title,
+                "url": rec.url,
+                "visit time": rec.visit_time,
+
+            }
+            if is_chrome:
+                data.update(
+                    {
+                        "transition core": rec.transition.core.name,
+                        "transition qualifiers": ", ".join(q.name for q in rec.transition.qualifier),
+                        "parent record id": rec.parent_visit_id if rec.has_parent else "None"
+                    }
+                )
+            yield data
     #
     # results = [
     #     {
@@ -38,7 +43,7 @@ def dump_history(profile: BrowserProfileProtocol, log_func: LogFunction, storage
     #     for rec in profile.iterate_history_records()
     # ]
 
-    return ArtifactResult(results)
+    return StreamingArtifactResult(rows())
 
 
 def dump_downloads(profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
@@ -81,32 +86,22 @@ def dump_downloads(profile: BrowserProfileProtocol, log_func: LogFunction, stora
 
 
 def dump_localstorage(profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
-    results = [
-        {
-            "record location": rec.record_location,
-            "host": rec.storage_key,
-            "key": rec.script_key,
-            "value": rec.value
-        }
+    results = (
+        STORAGE_ROW_SCHEMA.row(rec.record_location, rec.storage_key, rec.script_key, rec.value)
         for rec in profile.iter_local_storage()
-    ]
+    )
 
-    return ArtifactResult(results)
+    return StreamingArtifactResult(results)
 
 
 def dump_sessionstorage(
         profile: BrowserProfileProtocol, log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
-    results = [
-        {
-            "record location": rec.record_location,
-            "host": rec.host,
-            "key": rec.key,
-            "value": rec.value
-        }
+    results = (
+        STORAGE_ROW_SCHEMA.row(rec.record_location, rec.host, rec.key, rec.value)
         for rec in profile.iter_session_storage()
-    ]
+    )
 
-    return ArtifactResult(results)
+    return StreamingArtifactResult(results)
 
 
 __artifacts__ = (
@@ -116,27 +111,31 @@ __artifacts__ = (
         "Dumps History Records",
         "0.2",
         dump_history,
-        ReportPresentation.table),
+        ReportPresentation.table,
+        timestamp_field_names=("visit time",)),
     ArtifactSpec(
         "Data Dump",
         "Downloads",
         "Dumps Download Records",
         "0.2",
         dump_downloads,
-        ReportPresentation.table),
+        ReportPresentation.table,
+        timestamp_field_names=("start time", "end time")),
     ArtifactSpec(
         "Data Dump",
         "Localstorage",
         "Dumps Localstorage Records",
         "0.2",
         dump_localstorage,
-        ReportPresentation.table),
+        ReportPresentation.table,
+        columns=STORAGE_ROW_SCHEMA.columns),
     ArtifactSpec(
         "Data Dump",
         "Sessionstorage",
         "Dumps Sessionstorage Records",
         "0.1",
         dump_sessionstorage,
-        ReportPresentation.table),
+        ReportPresentation.table,
+        columns=STORAGE_ROW_SCHEMA.columns),
 
 )
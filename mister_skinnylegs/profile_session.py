@@ -0,0 +1,194 @@
+import enum
+import pathlib
+import typing
+
+from ccl_chromium_reader import ChromiumProfileFolder
+from ccl_mozilla_reader import MozillaProfileFolder
+
+from .util.profile_folder_protocols import BrowserProfileProtocol
+from .util.artifact_utils import ArtifactSpec, ArtifactResult, ArtifactStorage, LogFunction
+from .util.scan_dispatch import ScanDispatcher, DispatchedProfile, SubscriptionIndex
+from .util.profile_index import ProfileIndex, IndexedProfile
+from .util.result_cache import ResultCache, WHOLE_PROFILE_SOURCE
+from .util.row_spool import spool_result
+
+
+class BrowserType(enum.Enum):
+    chromium = 1
+    mozilla = 2
+
+
+def open_profile(
+        profile_path: pathlib.Path,
+        browser_type: BrowserType,
+        cache_folder: typing.Optional[pathlib.Path]=None) -> BrowserProfileProtocol:
+    """
+    Opens the profile folder with the reader appropriate for the browser type
+
+    :param profile_path: path to the browser profile folder
+    :param browser_type: a BrowserType defining what type of browser is being targeted
+    :param cache_folder: path to the browser cache folder, if it is not in the profile folder
+    :return: an object implementing BrowserProfileProtocol
+    """
+    match browser_type:
+        case BrowserType.chromium:
+            return ChromiumProfileFolder(profile_path, cache_folder=cache_folder, missing_data_ok=True)
+        case BrowserType.mozilla:
+            return MozillaProfileFolder(profile_path, cache_folder)
+        case _:
+            raise NotImplementedError(f"Browser type {browser_type} not supported")
+
+
+def profile_source_paths(
+        profile_path: pathlib.Path,
+        browser_type: BrowserType,
+        cache_folder: typing.Optional[pathlib.Path]=None) -> dict[str, tuple[pathlib.Path, ...]]:
+    """
+    Returns the files/folders which hold each of the data sources of a profile (see result_cache.SOURCE_ATTRIBUTES).
+
+    :param profile_path: path to the browser profile folder
+    :param browser_type: a BrowserType defining what type of browser is being targeted
+    :param cache_folder: path to the browser cache folder, if it is not in the profile folder
+    """
+    whole_profile = (profile_path, cache_folder) if cache_folder is not None else (profile_path,)
+    match browser_type:
+        case BrowserType.chromium:
+            return {
+                "cache": (cache_folder,) if cache_folder is not None else (profile_path / "Cache",),
+                "history": (profile_path / "History",),
+                "local_storage": (profile_path / "Local Storage",),
+                "session_storage": (profile_path / "Session Storage",),
+                "indexeddb": (profile_path / "IndexedDB",),
+                WHOLE_PROFILE_SOURCE: whole_profile
+            }
+        case BrowserType.mozilla:
+            # everything other than the cache is spread across the profile folder, so that is used for all of them
+            return {
+                "cache": (cache_folder,),
+                "history": (profile_path,),
+                "local_storage": (profile_path,),
+                "session_storage": (profile_path,),
+                "indexeddb": (profile_path,),
+                WHOLE_PROFILE_SOURCE: whole_profile
+            }
+        case _:
+            raise NotImplementedError(f"Browser type {browser_type} not supported")
+
+
+class ProfileSession:
+    """
+    Holds a single opened profile which is shared by every artifact run against it, so that the (expensive)
+    parsing of history, LevelDB stores and the cache index happens once per run rather than once per artifact.
+    The profile is opened on first use and closed when the session is closed.
+
+    Artifacts are given the profile wrapped in a DispatchedProfile: if the SubscriptionIndex for the artifacts in
+    the run is provided, their data subscriptions are served by a single ScanDispatcher for the session. If
+    shared_scans is False (as in worker processes, which are only given some of the run's artifacts) each artifact
+    instead gets a ScanDispatcher for its own subscriptions, so that nothing is walked or held on behalf of
+    artifacts which run elsewhere. If an index folder is provided, cache and history queries are resolved against a
+    persistent ProfileIndex kept there, which is built on the first run against the profile. If a result cache
+    folder is provided, artifacts' results are cached there and reused by later runs when valid.
+    """
+    def __init__(
+            self,
+            profile_path: pathlib.Path,
+            browser_type: BrowserType,
+            cache_folder: typing.Optional[pathlib.Path]=None,
+            subscriptions: typing.Optional[SubscriptionIndex]=None,
+            index_folder: typing.Optional[pathlib.Path]=None,
+            result_cache_folder: typing.Optional[pathlib.Path]=None,
+            shared_scans: bool=True):
+        self._profile_path = profile_path
+        self._browser_type = browser_type
+        self._cache_folder = cache_folder
+        self._subscriptions = subscriptions if subscriptions is not None else SubscriptionIndex(())
+        self._shared_scans = shared_scans
+        self._index_folder = index_folder
+        self._result_cache: typing.Optional[ResultCache] = None
+        if result_cache_folder is not None:
+            self._result_cache = ResultCache(
+                result_cache_folder,
+                f"{browser_type.name}\0{profile_path.resolve()}\0{cache_folder and cache_folder.resolve()}",
+                profile_source_paths(profile_path, browser_type, cache_folder))
+        self._profile: typing.Optional[BrowserProfileProtocol] = None
+        self._dispatcher: typing.Optional[ScanDispatcher] = None
+
+    @property
+    def profile(self) -> BrowserProfileProtocol:
+        if self._profile is None:
+            profile = open_profile(self._profile_path, self._browser_type, self._cache_folder)
+            if self._index_folder is not None:
+                index = ProfileIndex.for_profile(self._index_folder, self._profile_path, self._cache_folder)
+                profile = IndexedProfile(profile, index)
+            self._profile = profile
+        return self._profile
+
+    def profile_for(self, spec: ArtifactSpec) -> BrowserProfileProtocol:
+        """
+        Returns the profile to be passed to the given artifact's function.
+        """
+        if not self._shared_scans:
+            return DispatchedProfile(self.profile, ScanDispatcher(self.profile, SubscriptionIndex((spec,))), spec.name)
+        if self._dispatcher is None:
+            self._dispatcher = ScanDispatcher(self.profile, self._subscriptions)
+        return DispatchedProfile(self.profile, self._dispatcher, spec.name)
+
+    def run_artifact(
+            self, spec: ArtifactSpec, plugin_file: pathlib.Path,
+            log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
+        """
+        Runs the artifact against the session's profile (or, if the session has a result cache, reuses its cached
+        result where valid), then closes the storage and releases any data held on the artifact's behalf. The rows of
+        streaming results are consumed into a RowSpool before the data is released.
+
+        :param spec: the artifact's spec
+        :param plugin_file: path to the plugin file which the artifact was loaded from
+        :param log_func: the log function to pass to the artifact
+        :param storage: the storage to pass to the artifact
+        """
+        try:
+            if self._result_cache is not None:
+                return self._result_cache.run(spec, plugin_file, lambda: self.profile_for(spec), log_func, storage)
+            return spool_result(spec.function(self.profile_for(spec), log_func, storage))
+        finally:
+            storage.close()
+            self.release(spec)
+
+    def release(self, spec: ArtifactSpec) -> None:
+        """
+        Informs the session that an artifact has finished, so any data held on its behalf can be dropped.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.release(spec.name)
+
+    @property
+    def profile_path(self) -> pathlib.Path:
+        return self._profile_path
+
+    @property
+    def browser_type(self) -> BrowserType:
+        return self._browser_type
+
+    @property
+    def cache_folder(self) -> typing.Optional[pathlib.Path]:
+        return self._cache_folder
+
+    @property
+    def index_folder(self) -> typing.Optional[pathlib.Path]:
+        return self._index_folder
+
+    @property
+    def is_open(self) -> bool:
+        return self._profile is not None
+
+    def close(self) -> None:
+        self._dispatcher = None
+        if self._profile is not None:
+            self._profile.close()
+            self._profile = None
+
+    def __enter__(self) -> "ProfileSession":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
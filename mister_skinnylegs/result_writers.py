@@ -0,0 +1,678 @@
+import csv
+import datetime
+import gzip
+import json
+import pathlib
+import sqlite3
+import typing
+import collections.abc as colabc
+
+from .util.artifact_utils import TableRow, LogFunction
+from .util.row_spool import RowSpool
+from .util.value_encoding import TypeDispatcher, json_converters, csv_converters, location_to_string
+
+# the size of the chunks in which output is written
+WRITE_BUFFER_SIZE = 0x40000
+# the number of rows passed to the csv writer at a time
+CSV_BATCH_SIZE = 1000
+# the number of rows in each row group (parquet) or record batch (arrow) of columnar output
+COLUMNAR_BATCH_SIZE = 0x10000
+# the number of rows passed to each executemany when loading the case database
+_SQLITE_BATCH_SIZE = 10000
+
+# the formats which table artifacts' rows can be written in, alongside the json envelope
+TABLE_FORMATS = ("csv", "parquet", "arrow", "sqlite", "jsonl", "jsonl.gz", "jsonl.zst")
+DEFAULT_TABLE_FORMATS = ("csv",)
+# the formats which need pyarrow
+_COLUMNAR_FORMATS = ("parquet", "arrow")
+# json lines formats and the compression they use
+JSONL_FORMATS = {"jsonl": None, "jsonl.gz": "gzip", "jsonl.zst": "zstd"}
+
+
+class ExtendedEncoder(json.JSONEncoder):
+    """
+    Encodes datetimes (as ISO 8601), locations (as their friendly strings), TableRows (as dicts), bytes (as hex)
+    and enums (as their names), along with everything the json module encodes itself. Converters are looked up by
+    type (see value_encoding.json_converters) rather than checked for each value.
+    """
+    def default(self, obj):
+        converter = json_converters.get(obj)
+        if converter is not None:
+            return converter(obj)
+        return super().default(obj)
+
+
+def prepare_row(row: typing.Any) -> typing.Any:
+    """
+    Prepares a row for encoding with ExtendedEncoder: a TableRow becomes a dict, and datetimes, locations, etc.
+    directly in the row are converted up front (into a copy of a dict row) so that the encoder doesn't have to call
+    back into python for them. Anything nested still goes through ExtendedEncoder.default.
+    """
+    if type(row) is TableRow:
+        # a dict has to be made for the encoder anyway, so the values are converted as it's made
+        return {
+            column: converter(value) if (converter := json_converters.get(value)) is not None else value
+            for column, value in zip(row.schema.columns, row.as_tuple())}
+    if type(row) is not dict:
+        return row
+    converted = None
+    for key, value in row.items():
+        converter = json_converters.get(value)
+        if converter is not None:
+            if converted is None:
+                converted = dict(row)
+            converted[key] = converter(value)
+    return converted if converted is not None else row
+
+
+class JsonResultWriter:
+    """
+    Writes artifact result envelopes as json. Rows of table results (lists or RowSpools) are encoded one at a time
+    and written in buffered chunks, so a streamed result is never held in memory as a whole. The output is byte for
+    byte the same as json.dump(envelope, out, cls=ExtendedEncoder).
+    """
+    def __init__(self, out: typing.TextIO, buffer_size: int=WRITE_BUFFER_SIZE):
+        self._out = out
+        self._buffer_size = buffer_size
+        self._buffer: list[str] = []
+        self._buffered = 0
+        # the encoder is used through encode(), which (unlike json.dump) takes the C accelerated path
+        self._encoder = ExtendedEncoder()
+
+    def _write(self, s: str) -> None:
+        self._buffer.append(s)
+        self._buffered += len(s)
+        if self._buffered >= self._buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._out.write("".join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+
+    def _write_rows(self, rows: colabc.Iterable) -> None:
+        encode = self._encoder.encode
+        self._write("[")
+        for idx, row in enumerate(rows):
+            if idx:
+                self._write(", ")
+            self._write(encode(prepare_row(row)))
+        self._write("]")
+
+    def write_envelope(self, envelope: dict) -> None:
+        """
+        Writes the envelope. If its result is a list or a RowSpool, and is the envelope's last key, the rows are
+        streamed; otherwise the envelope is encoded in one go.
+        """
+        result = envelope.get("result")
+        keys = list(envelope)
+        if not isinstance(result, (list, RowSpool)) or keys[-1] != "result":
+            self._write(self._encoder.encode(envelope))
+            self.flush()
+            return
+
+        head = {key: envelope[key] for key in keys[:-1]}
+        self._write(self._encoder.encode(head)[:-1] + ", " if head else "{")
+        self._write('"result": ')
+        self._write_rows(result)
+        self._write("}")
+        self.flush()
+
+
+def write_json_result(out: typing.TextIO, envelope: dict) -> None:
+    """
+    Writes the result envelope to out as json (see JsonResultWriter).
+    """
+    JsonResultWriter(out).write_envelope(envelope)
+
+
+def _report_undeclared_fields(
+        row: colabc.Mapping, column_set: frozenset[str], reported: set[str],
+        log_func: typing.Optional[LogFunction]) -> None:
+    # fields which aren't in the declared columns are left out of the output rather than failing the artifact part
+    # way through writing it; each is logged the first time it's seen
+    extras = [key for key in row if key not in column_set and key not in reported]
+    if extras:
+        reported.update(extras)
+        if log_func is not None:
+            log_func(f"Skipping fields which aren't in the declared columns: {extras}")
+
+
+def _csv_row_tuple(
+        row: dict, columns: tuple[str, ...], column_set: frozenset[str], reported: set[str],
+        log_func: typing.Optional[LogFunction]) -> tuple:
+    if type(row) is TableRow and row.schema.columns == columns:
+        # every column is present and in order, so there's nothing to check or look up
+        row_values = row.as_tuple()
+    else:
+        if not row.keys() <= column_set:
+            _report_undeclared_fields(row, column_set, reported, log_func)
+        row_values = [row.get(column, "") for column in columns]
+    get_converter = csv_converters.get
+    return tuple(
+        converter(value) if (converter := get_converter(value)) is not None else value for value in row_values)
+
+
+def _discover_columns(rows: colabc.Iterable[dict]) -> tuple[str, ...]:
+    # a dict keeps the columns in the order they're first seen, with O(1) membership tests
+    columns = {}
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns[key] = None
+    return tuple(columns)
+
+
+def write_csv_result(
+        out: typing.TextIO,
+        rows: colabc.Iterable[dict],
+        columns: typing.Optional[colabc.Sequence[str]]=None,
+        spool_folder: typing.Optional[pathlib.Path]=None,
+        log_func: typing.Optional[LogFunction]=None) -> None:
+    """
+    Writes the rows of a table result as csv (the header row followed by a row per dict, with missing fields left
+    empty and locations written as their friendly strings).
+
+    If the columns are declared, the rows are written in a single pass (and fields which aren't in the columns are
+    skipped, and logged). Otherwise the columns are discovered from the rows first, in the order they are first
+    seen, so the rows are read twice: lists and RowSpools are simply iterated again, anything else is spilled to a
+    temporary RowSpool first.
+
+    :param out: the text stream to write to (opened with newline="")
+    :param rows: the rows
+    :param columns: the declared columns, if any
+    :param spool_folder: folder for any temporary spool file; defaults to the system's temporary folder
+    :param log_func: function to log any skipped fields with
+    """
+    spilled = None
+    try:
+        if columns is None:
+            if not isinstance(rows, (colabc.Sequence, RowSpool)):
+                rows = spilled = RowSpool.spool(rows, spool_folder)
+            columns = _discover_columns(rows)
+
+        columns = tuple(columns)
+        column_set = frozenset(columns)
+        reported: set[str] = set()
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        batch = []
+        for row in rows:
+            batch.append(_csv_row_tuple(row, columns, column_set, reported, log_func))
+            if len(batch) == CSV_BATCH_SIZE:
+                writer.writerows(batch)
+                batch.clear()
+        writer.writerows(batch)
+    finally:
+        if spilled is not None:
+            spilled.close()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Parquet and Arrow output require the pyarrow package (pip install pyarrow) which is not installed")
+    return pyarrow
+
+
+def check_table_formats(table_formats: colabc.Iterable[str]) -> None:
+    """
+    Checks that the table formats are supported, and that anything they need is installed, raising a ValueError or
+    ImportError if not; allows the problem to be reported before any processing starts.
+    """
+    for table_format in table_formats:
+        if table_format not in TABLE_FORMATS:
+            raise ValueError(f"Unsupported table format: {table_format}")
+        if table_format in _COLUMNAR_FORMATS:
+            _import_pyarrow()
+        if JSONL_FORMATS.get(table_format) == "zstd":
+            _import_zstd()
+
+
+# the kinds of value which columnar output distinguishes when choosing a column's type
+_KIND_BOOL = "bool"
+_KIND_INT = "int"
+_KIND_FLOAT = "float"
+_KIND_TEXT = "text"
+_KIND_BYTES = "bytes"
+_KIND_NAIVE_DATETIME = "naive_datetime"
+_KIND_AWARE_DATETIME = "aware_datetime"
+_KIND_LOCATION = "location"
+_KIND_OTHER = "other"  # anything else (including lists and dicts, or a mix of kinds) is written as text
+
+_INT64_MIN = -(2 ** 63)
+_INT64_MAX = 2 ** 63 - 1
+
+def _resolve_value_kind(value: typing.Any) -> str:
+    if isinstance(value, bool):
+        return _KIND_BOOL
+    if isinstance(value, int):
+        return _KIND_INT
+    if isinstance(value, float):
+        return _KIND_FLOAT
+    if isinstance(value, str):
+        return _KIND_TEXT
+    if isinstance(value, (bytes, bytearray)):
+        return _KIND_BYTES
+    if isinstance(value, datetime.datetime):
+        return _KIND_NAIVE_DATETIME
+    if json_converters.get(value) is location_to_string:
+        return _KIND_LOCATION
+    return _KIND_OTHER
+
+
+# value -> kind of value, by type (datetimes and ints are checked again, as their kind also depends on the value)
+_value_kinds = TypeDispatcher(_resolve_value_kind)
+
+
+def _get_value_kind(value: typing.Any) -> str:
+    kind = _value_kinds.get(value)
+    if kind == _KIND_NAIVE_DATETIME and value.tzinfo is not None:
+        return _KIND_AWARE_DATETIME
+    if kind == _KIND_INT and not _INT64_MIN <= value <= _INT64_MAX:
+        return _KIND_OTHER
+    return kind
+
+
+def _resolve_column_kind(kinds: set[str]) -> str:
+    # a column whose values are all of one kind keeps that kind; ints and floats together make floats; any other mix
+    # is converted to text (and a column with no values at all is an empty text column)
+    if not kinds:
+        return _KIND_TEXT
+    if len(kinds) == 1:
+        return next(iter(kinds))
+    if kinds == {_KIND_INT, _KIND_FLOAT}:
+        return _KIND_FLOAT
+    return _KIND_OTHER
+
+
+def _to_text(value: typing.Any) -> typing.Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    converter = json_converters.get(value)
+    if converter is not None:
+        value = converter(value)
+        if isinstance(value, str):
+            return value
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, cls=ExtendedEncoder)
+    return str(value)
+
+
+def _to_utc_naive(value: typing.Optional[datetime.datetime]) -> typing.Optional[datetime.datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _discover_column_kinds(
+        rows: colabc.Iterable[dict], columns: typing.Optional[tuple[str, ...]],
+        log_func: typing.Optional[LogFunction]=None) -> dict[str, str]:
+    # column -> kinds of the (non-None) values seen in it, in the order the columns are first seen
+    seen_kinds: dict[str, set[str]] = {column: set() for column in columns} if columns is not None else {}
+    column_set = frozenset(columns) if columns is not None else None
+    reported: set[str] = set()
+    for row in rows:
+        undeclared = column_set is not None and not row.keys() <= column_set
+        if undeclared:
+            _report_undeclared_fields(row, column_set, reported, log_func)
+        for key, value in row.items():
+            kinds = seen_kinds.get(key)
+            if kinds is None:
+                if undeclared and key not in column_set:
+                    continue
+                kinds = seen_kinds[key] = set()
+            if value is not None:
+                kinds.add(_get_value_kind(value))
+    return {column: _resolve_column_kind(kinds) for column, kinds in seen_kinds.items()}
+
+
+class _ColumnarSchema:
+    """
+    The arrow schema for a table result, along with the functions which convert each column's values to fit it.
+    Timestamps are written as timestamps (in UTC if the values are timezone aware) and locations as their friendly
+    strings.
+    """
+    def __init__(self, column_kinds: dict[str, str]):
+        pa = _import_pyarrow()
+        kind_types = {
+            _KIND_BOOL: pa.bool_(),
+            _KIND_INT: pa.int64(),
+            _KIND_FLOAT: pa.float64(),
+            _KIND_TEXT: pa.string(),
+            _KIND_BYTES: pa.binary(),
+            _KIND_NAIVE_DATETIME: pa.timestamp("us"),
+            _KIND_AWARE_DATETIME: pa.timestamp("us", tz="UTC"),
+            _KIND_LOCATION: pa.string(),
+            _KIND_OTHER: pa.string(),
+        }
+        kind_converters = {
+            _KIND_LOCATION: location_to_string,
+            _KIND_OTHER: _to_text,
+            _KIND_AWARE_DATETIME: _to_utc_naive,
+        }
+        self.columns = tuple(column_kinds)
+        self.schema = pa.schema([pa.field(column, kind_types[kind]) for column, kind in column_kinds.items()])
+        self.converters = tuple(kind_converters.get(kind) for kind in column_kinds.values())
+
+    def make_batch(self, rows: list[dict]):
+        pa = _import_pyarrow()
+        arrays = []
+        for column, converter, field in zip(self.columns, self.converters, self.schema):
+            values = [row.get(column) for row in rows]
+            if converter is not None:
+                values = [converter(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def write_columnar_result(
+        out_path: pathlib.Path,
+        table_format: str,
+        rows: colabc.Iterable[dict],
+        columns: typing.Optional[colabc.Sequence[str]]=None,
+        spool_folder: typing.Optional[pathlib.Path]=None,
+        batch_size: int=COLUMNAR_BATCH_SIZE,
+        log_func: typing.Optional[LogFunction]=None) -> None:
+    """
+    Writes the rows of a table result with typed columns as a parquet file or an arrow (IPC) file, which needs
+    pyarrow. The rows are read twice: once to work out the type of each column (and the columns, if they aren't
+    declared) and then again to write them, a row group (or record batch) at a time. Lists and RowSpools are simply
+    iterated again, anything else is spilled to a temporary RowSpool first. If the columns are declared, fields which
+    aren't in them are skipped (and logged).
+
+    :param out_path: the path of the file to write
+    :param table_format: "parquet" or "arrow"
+    :param rows: the rows
+    :param columns: the declared columns, if any
+    :param spool_folder: folder for any temporary spool file; defaults to the system's temporary folder
+    :param batch_size: the number of rows in each row group or record batch
+    :param log_func: function to log any skipped fields with
+    """
+    pa = _import_pyarrow()
+    spilled = None
+    try:
+        if not isinstance(rows, (colabc.Sequence, RowSpool)):
+            rows = spilled = RowSpool.spool(rows, spool_folder)
+        schema = _ColumnarSchema(
+            _discover_column_kinds(rows, tuple(columns) if columns is not None else None, log_func))
+
+        match table_format:
+            case "parquet":
+                writer = pa.parquet.ParquetWriter(out_path, schema.schema)
+            case "arrow":
+                writer = pa.ipc.new_file(out_path, schema.schema)
+            case _:
+                raise ValueError(f"Unsupported columnar format: {table_format}")
+
+        with writer:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    writer.write_batch(schema.make_batch(batch))
+                    batch.clear()
+            if batch:
+                writer.write_batch(schema.make_batch(batch))
+    finally:
+        if spilled is not None:
+            spilled.close()
+
+
+CASE_DATABASE_FILE_NAME = "case.sqlite"
+# the table in the case database listing the artifacts (and the tables holding their rows)
+CASE_DATABASE_ARTIFACTS_TABLE = "_artifacts"
+_CASE_DATABASE_LOCK_TIMEOUT_SECONDS = 600
+# the kinds of value whose columns are indexed in the case database once the rows are loaded
+_INDEXED_KINDS = frozenset((_KIND_NAIVE_DATETIME, _KIND_AWARE_DATETIME, _KIND_LOCATION))
+
+# kind -> function converting values of that kind to something sqlite can store (None where it stores them as is)
+_sqlite_converters: dict[str, typing.Optional[colabc.Callable[[typing.Any], typing.Any]]] = {
+    _KIND_NAIVE_DATETIME: datetime.datetime.isoformat,
+    _KIND_AWARE_DATETIME: datetime.datetime.isoformat,
+    _KIND_LOCATION: location_to_string,
+    _KIND_OTHER: _to_text,
+}
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sqlite_column_names(columns: colabc.Sequence[str]) -> tuple[str, ...]:
+    # sqlite's column names are case-insensitive, so columns which only differ by case (e.g., "URL" and "url") are
+    # given a numbered suffix to keep them distinct
+    used = set()
+    names = []
+    for column in columns:
+        name = column
+        suffix = 1
+        while name.lower() in used:
+            suffix += 1
+            name = f"{column}_{suffix}"
+        used.add(name.lower())
+        names.append(name)
+    return tuple(names)
+
+
+class CaseDatabase:
+    """
+    A SQLite database holding the rows of every table artifact in a run: one table per artifact (named after the
+    artifact) plus a table listing the artifacts. Rows are loaded with batched inserts inside a single transaction
+    per artifact, and the artifact's timestamp and location columns are indexed once its rows are loaded.
+    Timestamps are stored as ISO 8601 text and locations as their friendly strings.
+    """
+    def __init__(self, db_path: pathlib.Path):
+        self._db_path = db_path
+        # artifacts' rows may be written by more than one thread, each of which waits for the others' loads to finish
+        self._db = sqlite3.connect(db_path, timeout=_CASE_DATABASE_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {_quote_identifier(CASE_DATABASE_ARTIFACTS_TABLE)} ("
+            f"table_name TEXT PRIMARY KEY, artifact_service TEXT, artifact_name TEXT, artifact_version TEXT, "
+            f"artifact_description TEXT, row_count INTEGER)")
+
+    def _insert_rows(
+            self, table: str, rows: colabc.Iterable[dict], columns: tuple[str, ...],
+            column_kinds: list[set[str]], log_func: typing.Optional[LogFunction]) -> int:
+        column_set = frozenset(columns)
+        reported: set[str] = set()
+        insert = (f"INSERT INTO {_quote_identifier(table)} VALUES "
+                  f"({', '.join('?' * len(columns))})")
+        row_count = 0
+        batch = []
+        for row in rows:
+            if not row.keys() <= column_set:
+                _report_undeclared_fields(row, column_set, reported, log_func)
+            values = []
+            for column, kinds in zip(columns, column_kinds):
+                value = row.get(column)
+                if value is not None:
+                    kind = _get_value_kind(value)
+                    kinds.add(kind)
+                    converter = _sqlite_converters.get(kind)
+                    if converter is not None:
+                        value = converter(value)
+                values.append(value)
+            batch.append(values)
+            if len(batch) == _SQLITE_BATCH_SIZE:
+                self._db.executemany(insert, batch)
+                row_count += len(batch)
+                batch.clear()
+        self._db.executemany(insert, batch)
+        return row_count + len(batch)
+
+    def add_table(
+            self, envelope: dict, columns: typing.Optional[colabc.Sequence[str]]=None,
+            spool_folder: typing.Optional[pathlib.Path]=None,
+            log_func: typing.Optional[LogFunction]=None) -> str:
+        """
+        Loads the rows of a table result into a new table named after the artifact.
+
+        If the columns are declared, the rows are loaded in a single pass (and fields which aren't in the columns are
+        skipped, and logged). Otherwise the columns are discovered from the rows first, so the rows are read twice:
+        lists and RowSpools are simply iterated again, anything else is spilled to a temporary RowSpool first.
+
+        :param envelope: the artifact's result envelope
+        :param columns: the declared columns, if any
+        :param spool_folder: folder for any temporary spool file; defaults to the system's temporary folder
+        :param log_func: function to log any skipped fields with
+        :return: the name of the table
+        """
+        table = envelope["artifact_name"]
+        rows = envelope["result"]
+        spilled = None
+        try:
+            if columns is None:
+                if not isinstance(rows, (colabc.Sequence, RowSpool)):
+                    rows = spilled = RowSpool.spool(rows, spool_folder)
+                columns = _discover_columns(rows)
+            columns = tuple(columns)
+            column_names = _sqlite_column_names(columns)
+            column_kinds = [set() for _ in columns]
+
+            # IMMEDIATE takes the write lock up front, so a writer waits (within the timeout) for other loads to
+            # finish, rather than starting on a snapshot that another writer's commit makes stale, which fails
+            # with SQLITE_BUSY without waiting
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    f"CREATE TABLE {_quote_identifier(table)} "
+                    f"({', '.join(_quote_identifier(name) for name in column_names)})")
+                row_count = self._insert_rows(table, rows, columns, column_kinds, log_func)
+                # indexing after the load is much quicker than keeping the indexes up to date with every insert
+                for idx, (name, kinds) in enumerate(zip(column_names, column_kinds)):
+                    if kinds & _INDEXED_KINDS:
+                        self._db.execute(
+                            f"CREATE INDEX {_quote_identifier(f'{table}_{idx}_idx')} "
+                            f"ON {_quote_identifier(table)} ({_quote_identifier(name)})")
+                self._db.execute(
+                    f"INSERT INTO {_quote_identifier(CASE_DATABASE_ARTIFACTS_TABLE)} VALUES (?, ?, ?, ?, ?, ?)",
+                    (table, envelope.get("artifact_service"), envelope.get("artifact_name"),
+                     envelope.get("artifact_version"), envelope.get("artifact_description"), row_count))
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        finally:
+            if spilled is not None:
+                spilled.close()
+
+        return table
+
+    @property
+    def db_path(self) -> pathlib.Path:
+        return self._db_path
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> "CaseDatabase":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "zstd compressed output requires the zstandard package (pip install zstandard) which is not installed")
+    return zstandard
+
+
+def _open_compressed(path: pathlib.Path, compression: typing.Optional[str]) -> typing.BinaryIO:
+    match compression:
+        case None:
+            return path.open("xb")
+        case "gzip":
+            return gzip.open(path, "xb")
+        case "zstd":
+            return _import_zstd().ZstdCompressor().stream_writer(path.open("xb"))
+        case _:
+            raise ValueError(f"Unsupported compression: {compression}")
+
+
+def write_jsonl_result(
+        out_folder: pathlib.Path,
+        stem: str,
+        envelope: dict,
+        table_format: str="jsonl",
+        shard_rows: typing.Optional[int]=None,
+        buffer_size: int=WRITE_BUFFER_SIZE) -> pathlib.Path:
+    """
+    Writes a table result as json lines: a header file holding the envelope (without the rows) and a list of the
+    files holding the rows, and the rows themselves, one json object per line, encoded the same way as in the json
+    output. The row files are compressed as the format says (gzip for "jsonl.gz", zstd for "jsonl.zst", which
+    needs zstandard) and, if shard_rows is given, split into numbered shards of (at most) that many rows, which can
+    be processed in parallel.
+
+    :param out_folder: the folder to write the files in
+    :param stem: the start of the files' names: the rows are in "<stem>.<format>" (or "<stem>.00000.<format>",
+           "<stem>.00001.<format>"... when sharded) and the header in "<stem>.<format>.header.json"
+    :param envelope: the result envelope
+    :param table_format: one of the JSONL_FORMATS
+    :param shard_rows: the maximum number of rows per file; if None, the rows all go in one file
+    :param buffer_size: size of the chunks in which the rows are written
+    :return: the path of the header file
+    """
+    if table_format not in JSONL_FORMATS:
+        raise ValueError(f"Unsupported json lines format: {table_format}")
+    if shard_rows is not None and shard_rows < 1:
+        raise ValueError("shard_rows must be at least 1")
+    compression = JSONL_FORMATS[table_format]
+    encode = ExtendedEncoder().encode
+
+    shards = []
+    out = None
+    buffer: list[str] = []
+    buffered = 0
+
+    def flush():
+        nonlocal buffered
+        if buffer:
+            out.write("".join(buffer).encode("utf-8"))
+            buffer.clear()
+            buffered = 0
+
+    try:
+        for row in envelope["result"]:
+            if out is None or (shard_rows is not None and shards[-1]["row_count"] == shard_rows):
+                if out is not None:
+                    flush()
+                    out.close()
+                if shard_rows is None:
+                    file_name = f"{stem}.{table_format}"
+                else:
+                    file_name = f"{stem}.{len(shards):05}.{table_format}"
+                out = _open_compressed(out_folder / file_name, compression)
+                shards.append({"file": file_name, "row_count": 0})
+            line = encode(prepare_row(row)) + "\n"
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= buffer_size:
+                flush()
+            shards[-1]["row_count"] += 1
+        if out is not None:
+            flush()
+    finally:
+        if out is not None:
+            out.close()
+
+    header = {key: value for key, value in envelope.items() if key != "result"}
+    header["format"] = "jsonl"
+    header["compression"] = compression
+    header["row_count"] = sum(shard["row_count"] for shard in shards)
+    header["files"] = shards
+    header_path = out_folder / f"{stem}.{table_format}.header.json"
+    with header_path.open("xt", encoding="utf-8") as f:
+        json.dump(header, f, cls=ExtendedEncoder, indent=2)
+    return header_path
@@ -0,0 +1,150 @@
+import csv
+import datetime
+import heapq
+import pathlib
+import typing
+import collections.abc as colabc
+
+from .util.artifact_utils import ArtifactSpec, ReportPresentation
+from .util.row_spool import RowSpool
+from .result_writers import ExtendedEncoder, CSV_BATCH_SIZE, prepare_row
+
+TIMELINE_FILE_NAME = "timeline.csv"
+TIMELINE_COLUMNS = ("timestamp", "timestamp field", "service", "artifact", "details")
+# the number of events held in memory before they are sorted and spilled to disk as a run
+TIMELINE_MEMORY_EVENTS = 200000
+
+# (sort key, sequence number, timestamp as written, timestamp field, service, artifact, details); the sequence number
+# is unique, so events never compare beyond it, and it keeps events with the same timestamp in the order they were
+# added
+TimelineEvent = tuple[datetime.datetime, int, str, str, str, str, str]
+
+
+def _timeline_timestamp(value: typing.Any) -> typing.Optional[datetime.datetime]:
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime.datetime):
+        return None
+    return value
+
+
+def _sort_key(timestamp: datetime.datetime) -> datetime.datetime:
+    # naive timestamps are taken to be UTC (as they are throughout the profile readers), so that they can be
+    # ordered alongside timezone aware ones
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def is_timeline_artifact(spec: ArtifactSpec) -> bool:
+    """
+    Returns True if the artifact's rows go in the timeline: table artifacts which declare timestamp fields.
+    """
+    return spec.presentation == ReportPresentation.table and bool(spec.timestamp_field_names)
+
+
+class TimelineBuilder:
+    """
+    Builds a single timeline from the rows of every timestamped table artifact (see is_timeline_artifact): each
+    timestamp field of each row becomes an event. Events are gathered in memory and, once there are too many, sorted
+    and spilled to disk as a sorted run; the timeline is written by k-way merging the runs, so it is streamed rather
+    than ever being held in memory as a whole. Artifacts' rows are usually already in time order, so sorting them is
+    cheap.
+    """
+    def __init__(
+            self, spool_folder: typing.Optional[pathlib.Path]=None, memory_events: int=TIMELINE_MEMORY_EVENTS):
+        """
+        Constructor
+
+        :param spool_folder: folder for the spilled runs; defaults to the system's temporary folder
+        :param memory_events: the number of events to hold in memory before spilling them
+        """
+        self._spool_folder = spool_folder
+        self._memory_events = memory_events
+        self._events: list[TimelineEvent] = []
+        self._runs: list[RowSpool] = []
+        self._event_count = 0
+
+    def _spill(self) -> None:
+        self._events.sort()
+        self._runs.append(RowSpool.spool(self._events, self._spool_folder))
+        self._events = []
+
+    def add_artifact(self, spec: ArtifactSpec, rows: colabc.Iterable[dict]) -> int:
+        """
+        Adds the events from an artifact's rows to the timeline.
+
+        :param spec: the artifact's spec; its timestamp_field_names say which fields hold the timestamps
+        :param rows: the artifact's rows
+        :return: the number of events added
+        """
+        encode = ExtendedEncoder().encode
+        added = 0
+        for row in rows:
+            details = None
+            for field in spec.timestamp_field_names:
+                timestamp = _timeline_timestamp(row.get(field))
+                if timestamp is None:
+                    continue
+                if details is None:
+                    details = encode(prepare_row(row))
+                self._events.append((
+                    _sort_key(timestamp), self._event_count, timestamp.isoformat(),
+                    field, spec.service, spec.name, details))
+                self._event_count += 1
+                added += 1
+                if len(self._events) >= self._memory_events:
+                    self._spill()
+        return added
+
+    def iter_events(self) -> colabc.Iterable[TimelineEvent]:
+        """
+        Yields the events in time order.
+        """
+        self._events.sort()
+        if not self._runs:
+            yield from self._events
+        else:
+            yield from heapq.merge(*self._runs, self._events)
+
+    def write_csv(self, out: typing.TextIO) -> int:
+        """
+        Writes the timeline as csv (the columns are TIMELINE_COLUMNS; details holds the whole row as json).
+
+        :param out: the text stream to write to (opened with newline="")
+        :return: the number of events written
+        """
+        writer = csv.writer(out)
+        writer.writerow(TIMELINE_COLUMNS)
+        written = 0
+        batch = []
+        for event in self.iter_events():
+            batch.append(event[2:])
+            if len(batch) == CSV_BATCH_SIZE:
+                writer.writerows(batch)
+                written += len(batch)
+                batch.clear()
+        writer.writerows(batch)
+        return written + len(batch)
+
+    @property
+    def event_count(self) -> int:
+        return self._event_count
+
+    def close(self) -> None:
+        """
+        Deletes any spilled runs.
+        """
+        for run in self._runs:
+            run.close()
+        self._runs.clear()
+        self._events.clear()
+
+    def __enter__(self) -> "TimelineBuilder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,6 +1,13 @@
 from .artifact_utils import ArtifactSpec
 from .artifact_utils import ArtifactResult
+from .artifact_utils import StreamingArtifactResult
+from .artifact_utils import RowSchema
+from .artifact_utils import TableRow
+from .artifact_utils import CacheSubscription
+from .artifact_utils import HistorySubscription
 from .artifact_utils import ArtifactStorage
 from .artifact_utils import LogFunction
 from .artifact_utils import ArtifactStorageTextStream
 from .artifact_utils import ArtifactStorageBinaryStream
+from .spillable import SpillableCollection
+from .value_encoding import stringify_locations
@@ -1,16 +1,22 @@
 import datetime
+import itertools
 import typing
 import enum
 import abc
 
 from dataclasses import dataclass
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Mapping
 from .profile_folder_protocols import BrowserProfileProtocol
+from .common import KeySearch
 
 
 JsonableType = typing.Union[
     None, int, float, str, bool, datetime.datetime, list["JsonableType"], dict[str, "JsonableType"]]
 LogFunction = Callable[[str], None]
+# bytes-like data which can be written to a binary stream (e.g., bytes, bytearray or a memoryview)
+BinaryData = typing.Union[bytes, bytearray, memoryview]
+# the size of the chunks which data is copied into streams in
+COPY_CHUNK_SIZE = 0x100000
 ArtifactFunction = Callable[[BrowserProfileProtocol, LogFunction, "ArtifactStorage"], "ArtifactResult"]
 
 
@@ -32,6 +38,142 @@ class ArtifactResult:
     result: JsonableType
 
 
+@dataclass(frozen=True)
+class StreamingArtifactResult(ArtifactResult):
+    """
+    An ArtifactResult for table artifacts which produce a large number of rows: result is an iterable of rows
+    (usually a generator) rather than a list. The host consumes the rows as they are produced and spools them to
+    disk, so they are never all held in memory at once. The rows are consumed while the profile is still open, so a
+    generator is free to keep reading from the profile.
+    """
+    result: Iterable[JsonableType]
+
+
+class RowSchema:
+    """
+    The fixed columns of the rows of a table artifact, which makes TableRows for them. Declare the artifact's
+    columns in its ArtifactSpec as schema.columns.
+    """
+    __slots__ = ("columns", "_indexes")
+
+    def __init__(self, columns: Iterable[str]):
+        self.columns: tuple[str, ...] = tuple(columns)
+        self._indexes = {column: idx for idx, column in enumerate(self.columns)}
+        if len(self._indexes) != len(self.columns):
+            raise ValueError("Columns must be unique")
+
+    def row(self, *values: typing.Any) -> "TableRow":
+        """
+        Makes a row from its values, one for each column in order.
+        """
+        if len(values) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} values, got {len(values)}")
+        return TableRow(self, list(values))
+
+    def row_from_dict(self, fields: Mapping[str, typing.Any]) -> "TableRow":
+        """
+        Makes a row from a dict of fields; columns missing from the dict are None.
+        """
+        if not fields.keys() <= self._indexes.keys():
+            extras = [key for key in fields if key not in self._indexes]
+            raise ValueError(f"Fields which aren't in the columns: {extras}")
+        return TableRow(self, [fields.get(column) for column in self.columns])
+
+    def __repr__(self):
+        return f"RowSchema({self.columns!r})"
+
+
+class TableRow(Mapping):
+    """
+    A row of a table result with the columns of a RowSchema. The values are held in a list in column order, rather
+    than in a dict per row with the same keys repeated, so a row takes several times less memory. A TableRow reads
+    like a dict with every column present (and can be used anywhere the host accepts a dict row); values can be
+    updated by column, but columns can't be added or removed.
+    """
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema: RowSchema, values: list):
+        """
+        Constructor. Usually created with RowSchema.row or RowSchema.row_from_dict rather than directly.
+        """
+        self._schema = schema
+        self._values = values
+
+    def __getitem__(self, column: str) -> typing.Any:
+        return self._values[self._schema._indexes[column]]
+
+    def __setitem__(self, column: str, value: typing.Any) -> None:
+        self._values[self._schema._indexes[column]] = value
+
+    def get(self, column: str, default: typing.Any=None) -> typing.Any:
+        idx = self._schema._indexes.get(column)
+        return default if idx is None else self._values[idx]
+
+    def __contains__(self, column: object) -> bool:
+        return column in self._schema._indexes
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._schema.columns)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def schema(self) -> RowSchema:
+        return self._schema
+
+    def as_tuple(self) -> tuple:
+        """
+        Returns the values in column order.
+        """
+        return tuple(self._values)
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return dict(zip(self._schema.columns, self._values))
+
+    def __reduce__(self):
+        return TableRow, (self._schema, self._values)
+
+    def __repr__(self):
+        return f"TableRow({self.to_dict()!r})"
+
+
+@dataclass(frozen=True)
+class CacheSubscription:
+    """
+    Declares the cache records an artifact will request. The host makes a single walk of the cache for all
+    subscribed artifacts and answers calls to iterate_cache from the records collected, rather than each artifact
+    walking the cache itself.
+
+    url: the url KeySearch, which should be the same object the artifact passes to iterate_cache (None for all
+      records).
+    headers: optional header field filters, as per the keyword arguments of iterate_cache.
+    omit_cached_data: True if the artifact only needs the records' metadata, and so calls iterate_cache with
+      omit_cached_data=True; the records for such subscriptions are collected by a walk which doesn't read bodies.
+
+    Calls to iterate_cache with a url and header filters which don't match a subscription are passed through to
+    the profile as normal.
+    """
+    url: typing.Optional[KeySearch] = None
+    headers: typing.Optional[dict[str, typing.Union[bool, KeySearch]]] = None
+    omit_cached_data: bool = False
+
+
+@dataclass(frozen=True)
+class HistorySubscription:
+    """
+    Declares the history records an artifact will request. The host reads the history once for all subscribed
+    artifacts and answers calls to iterate_history_records from the records collected.
+
+    url: the url KeySearch, which should be the same object the artifact passes to iterate_history_records (None
+      for all records).
+
+    Calls to iterate_history_records with a url which doesn't match a subscription are passed through to the
+    profile as normal.
+    """
+    url: typing.Optional[KeySearch] = None
+
+
 @dataclass(frozen=True)
 class ArtifactSpec:
     service: str
@@ -43,15 +185,49 @@ class ArtifactSpec:
     citation: typing.Optional[str] = None
     media_field_names: typing.Optional[tuple[str]] = None,
     timestamp_field_names: typing.Optional[tuple[str]] = None
+    cache_subscriptions: typing.Optional[tuple[CacheSubscription, ...]] = None
+    history_subscriptions: typing.Optional[tuple[HistorySubscription, ...]] = None
+    columns: typing.Optional[tuple[str, ...]] = None
+
+
+def numbered_file_name(file_name: str, number: int) -> str:
+    """
+    Returns the file name with a number added before its extension (e.g., "a.jpg", 2 -> "a_2.jpg"), used to make
+    file names unique.
+    """
+    stem, dot, extension = file_name.rpartition(".")
+    if not stem:
+        return f"{file_name}_{number}"
+    return f"{stem}_{number}{dot}{extension}"
 
 
 class ArtifactStorageBinaryStream(abc.ABC):
     def __init__(self, source_file: str):
         self._source_file = source_file
 
-    def write(self, data: bytes) -> int:
+    def write(self, data: BinaryData) -> int:
         raise NotImplementedError()
 
+    def copy_from(self, source: typing.BinaryIO, length: typing.Optional[int]=None) -> int:
+        """
+        Copies data from the current position of a binary file into the stream in chunks, leaving the file
+        positioned after the data copied. Implementing classes may override this so that the data is copied by the
+        operating system without passing through Python.
+        :param source: the binary file to copy from
+        :param length: the number of bytes to copy; None copies to the end of the file
+        :return: the number of bytes copied
+        """
+        buffer = memoryview(bytearray(COPY_CHUNK_SIZE))
+        copied = 0
+        while length is None or copied < length:
+            wanted = len(buffer) if length is None else min(len(buffer), length - copied)
+            count = source.readinto(buffer[:wanted])
+            if not count:
+                break
+            self.write(buffer[:count])
+            copied += count
+        return copied
+
     def close(self) -> None:
         raise NotImplementedError()
 
@@ -114,3 +290,38 @@ class ArtifactStorage(abc.ABC):
         """
         raise NotImplementedError()
 
+    def put_blob(self, file_name: str, data: BinaryData, source_file: str) -> str:
+        """
+        Stores a complete file in one call, which implementing classes may write in the background, and returns its
+        file location reference. Unlike the streams, a file name which has already been used is made unique rather
+        than being an error.
+        :param file_name: the name of the file to be stored. This may be altered by the implementing class
+        :param data: the file's contents; this must not be modified afterwards, as it may be written later
+        :param source_file: path of the file that the data came from
+        :return: the final file location reference
+        """
+        candidate = file_name
+        for number in itertools.count(1):
+            try:
+                out = self.get_binary_stream(candidate, source_file)
+            except FileExistsError:
+                candidate = numbered_file_name(file_name, number)
+                continue
+            with out:
+                out.write(data)
+            return out.get_file_location_reference()
+
+    def put_many(self, blobs: Iterable[tuple[str, BinaryData, str]]) -> list[str]:
+        """
+        Stores several complete files (see put_blob).
+        :param blobs: (file name, data, source file) tuples
+        :return: the final file location references, in the same order
+        """
+        return [self.put_blob(file_name, data, source_file) for file_name, data, source_file in blobs]
+
+    def close(self) -> None:
+        """
+        Called by the host once the artifact has finished with the storage, so that anything still buffered can be
+        written out. Plugins don't need to call this.
+        """
+        pass
@@ -0,0 +1,45 @@
+import dataclasses
+import collections.abc as col_abc
+
+from .profile_folder_protocols import BrowserProfileProtocol, CacheRecordProtocol
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheRecordRef:
+    """
+    Identifies a cache record (by its url and the locations of its metadata and data) without holding the record,
+    so that it can be read back with its body later.
+    """
+    url: str
+    metadata_location: str
+    data_location: str
+
+    @classmethod
+    def of(cls, record: CacheRecordProtocol) -> "CacheRecordRef":
+        return cls(record.key.url, str(record.metadata_location), str(record.data_location))
+
+
+def load_cache_bodies(
+        profile: BrowserProfileProtocol, refs: col_abc.Sequence[CacheRecordRef],
+        decompress=True) -> list[CacheRecordProtocol]:
+    """
+    Reads the referenced records back with their bodies, in a single pass of the cache which only reads the bodies
+    of records with the refs' urls.
+
+    :param profile: the profile which the records were read from
+    :param refs: the records to read
+    :param decompress: passed to iterate_cache
+    :return: the records with their bodies, in the same order as the refs
+    :raises LookupError: if a record can no longer be found in the cache
+    """
+    if not refs:
+        return []
+    wanted: dict[CacheRecordRef, CacheRecordProtocol] = dict.fromkeys(refs)
+    for record in profile.iterate_cache(url=frozenset(ref.url for ref in refs), decompress=decompress):
+        ref = CacheRecordRef.of(record)
+        if ref in wanted:
+            wanted[ref] = record
+    for ref, record in wanted.items():
+        if record is None:
+            raise LookupError(f"The cache record for {ref.url} at {ref.data_location} could not be read back")
+    return [wanted[ref] for ref in refs]
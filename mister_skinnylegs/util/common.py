@@ -1,18 +1,216 @@
 import re
 import typing
+import operator
+import functools
 import collections.abc as col_abc
 
+try:
+    import re._parser as _sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse as _sre_parse
+
 
 KeySearch = typing.Union[str, re.Pattern, col_abc.Collection[str], col_abc.Callable[[str], bool]]
 
 def is_keysearch_hit(search: KeySearch, value: str):
+    """
+    Tests a single value against a KeySearch. When testing many values against the same search use
+    compile_keysearch (or filter_keysearch) instead, so that the search is only prepared once.
+    """
+    return compile_keysearch(search)(value)
+
+
+def compile_keysearch(search: KeySearch) -> col_abc.Callable[[str], bool]:
+    """
+    Resolves a KeySearch into a predicate, so that the type dispatch (and, for collections, building the set of
+    values) happens once rather than for every value tested.
+
+    :param search: the KeySearch
+    :return: a callable which takes a string and returns True if it is a hit for the search
+    """
     if isinstance(search, str):
-        return value == search
+        return functools.partial(operator.eq, search)
     elif isinstance(search, re.Pattern):
-        return search.search(value) is not None
+        pattern_search = search.search
+        return lambda value: pattern_search(value) is not None
     elif isinstance(search, col_abc.Collection):
-        return value in set(search)
+        return frozenset(search).__contains__
     elif isinstance(search, col_abc.Callable):
-        return search(value)
+        return search
     else:
-        raise TypeError(f"Unexpected type: {type(search)} (expects: {KeySearch})")
\ No newline at end of file
+        raise TypeError(f"Unexpected type: {type(search)} (expects: {KeySearch})")
+
+
+def filter_keysearch(search: KeySearch, values: col_abc.Iterable[str]) -> col_abc.Iterator[str]:
+    """
+    Yields the values which are a hit for the KeySearch, preparing the search once for the whole iterable.
+    """
+    return filter(compile_keysearch(search), values)
+
+
+# Shortest literal worth using to prefilter a regex
+_MIN_PREFILTER_LITERAL_LENGTH = 3
+
+
+def _required_literal(pattern: re.Pattern) -> typing.Optional[str]:
+    """
+    Returns the longest run of literal characters which must appear in any string matched by the pattern, or None
+    if one can't be established.
+    """
+    if not isinstance(pattern.pattern, str) or pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = _sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+
+    runs = []
+
+    def walk(items):
+        run = []
+        for op, av in items:
+            if op is _sre_parse.LITERAL:
+                run.append(chr(av))
+                continue
+            runs.append("".join(run))
+            run = []
+            # groups must match in full, so their literals are required too (alternations and repeats are not)
+            if op is _sre_parse.SUBPATTERN and not av[1] & _sre_parse.SRE_FLAG_IGNORECASE:
+                walk(av[-1])
+        runs.append("".join(run))
+
+    walk(parsed)
+    literal = max(runs, key=len)
+    return literal if len(literal) >= _MIN_PREFILTER_LITERAL_LENGTH else None
+
+
+class AnyKeySearch:
+    """
+    A KeySearch which is a hit if any of its component KeySearches are a hit. It can be passed anywhere a KeySearch
+    is accepted (it is a callable); a UrlMatcher will expand it into its components so they can be prefiltered
+    along with every other pattern.
+    """
+    def __init__(self, *searches: KeySearch):
+        self._searches = searches
+        self._matcher: typing.Optional[UrlMatcher] = None
+
+    @property
+    def searches(self) -> tuple[KeySearch, ...]:
+        return self._searches
+
+    def __call__(self, value: str) -> bool:
+        if self._matcher is None:
+            self._matcher = UrlMatcher({None: self._searches})
+        return self._matcher.is_hit(value)
+
+    def __repr__(self):
+        return f"AnyKeySearch{self._searches!r}"
+
+
+class UrlMatcher:
+    """
+    Matches strings (usually urls) against the KeySearches of many labelled subscribers at once, returning the set
+    of labels each string belongs to.
+
+    Exact string searches are served by a dict lookup. Regex patterns have a literal which any match must contain
+    extracted, and all of these literals are compiled into a single prefilter pattern, so that the (common) case of
+    a string that matches nothing is rejected with one search. Patterns which pass the prefilter are then only
+    tried if their own literal is present. Other callables are tried for every string.
+    """
+    def __init__(self, searches: col_abc.Mapping[col_abc.Hashable, col_abc.Iterable[typing.Optional[KeySearch]]]):
+        """
+        Constructor
+
+        :param searches: a mapping of labels to the KeySearches for that label. A KeySearch of None matches
+               every string.
+        """
+        self._match_all: set = set()
+        self._exact: dict[str, set] = {}
+        # dicts are keyed by the pattern/callable so that searches shared by several labels are only tried once
+        gated_patterns: dict[re.Pattern, tuple[str, set]] = {}
+        ungated_patterns: dict[re.Pattern, set] = {}
+        callables: dict[col_abc.Callable, set] = {}
+
+        def add(label, search):
+            if search is None:
+                self._match_all.add(label)
+            elif isinstance(search, str):
+                self._exact.setdefault(search, set()).add(label)
+            elif isinstance(search, re.Pattern):
+                literal = _required_literal(search)
+                if literal is None:
+                    ungated_patterns.setdefault(search, set()).add(label)
+                else:
+                    gated_patterns.setdefault(search, (literal, set()))[1].add(label)
+            elif isinstance(search, AnyKeySearch):
+                for component in search.searches:
+                    add(label, component)
+            elif isinstance(search, col_abc.Collection):
+                for value in search:
+                    self._exact.setdefault(value, set()).add(label)
+            elif isinstance(search, col_abc.Callable):
+                callables.setdefault(search, set()).add(label)
+            else:
+                raise TypeError(f"Unexpected type: {type(search)} (expects: {KeySearch})")
+
+        for label, label_searches in searches.items():
+            for search in label_searches:
+                add(label, search)
+
+        self._gated_patterns = tuple(
+            (literal, pattern, frozenset(labels)) for pattern, (literal, labels) in gated_patterns.items())
+        self._ungated_patterns = tuple((pattern, frozenset(labels)) for pattern, labels in ungated_patterns.items())
+        self._callables = tuple((func, frozenset(labels)) for func, labels in callables.items())
+        self._exact = {value: frozenset(labels) for value, labels in self._exact.items()}
+        self._match_all = frozenset(self._match_all)
+
+        if self._gated_patterns:
+            literals = sorted({literal for literal, _, _ in self._gated_patterns}, key=len, reverse=True)
+            self._prefilter = re.compile("|".join(re.escape(literal) for literal in literals))
+        else:
+            self._prefilter = None
+
+    @property
+    def matches_all(self) -> bool:
+        """True if any label matches every string"""
+        return bool(self._match_all)
+
+    def match(self, value: str) -> frozenset:
+        """
+        Returns the set of labels whose searches are a hit for the value.
+        """
+        hits = set(self._match_all)
+        if value in self._exact:
+            hits.update(self._exact[value])
+        if self._prefilter is not None and self._prefilter.search(value) is not None:
+            for literal, pattern, labels in self._gated_patterns:
+                if not labels <= hits and literal in value and pattern.search(value) is not None:
+                    hits.update(labels)
+        for pattern, labels in self._ungated_patterns:
+            if not labels <= hits and pattern.search(value) is not None:
+                hits.update(labels)
+        for func, labels in self._callables:
+            if not labels <= hits and func(value):
+                hits.update(labels)
+        return frozenset(hits)
+
+    def is_hit(self, value: str) -> bool:
+        """
+        Returns True if the value is a hit for any label; stops at the first hit.
+        """
+        if self._match_all or value in self._exact:
+            return True
+        if self._prefilter is not None and self._prefilter.search(value) is not None:
+            for literal, pattern, labels in self._gated_patterns:
+                if literal in value and pattern.search(value) is not None:
+                    return True
+        for pattern, labels in self._ungated_patterns:
+            if pattern.search(value) is not None:
+                return True
+        for func, labels in self._callables:
+            if func(value):
+                return True
+        return False
+
+    def __call__(self, value: str) -> bool:
+        return self.is_hit(value)
@@ -1,8 +1,37 @@
+import codecs
+import collections
+import hashlib
+import json
+import os
 import pathlib
 import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
 import typing
+import uuid
+import zipfile
+import collections.abc as col_abc
 
-from .artifact_utils import ArtifactStorage, ArtifactStorageTextStream, ArtifactStorageBinaryStream
+from .artifact_utils import (
+    ArtifactSpec, ArtifactStorage, ArtifactStorageTextStream, ArtifactStorageBinaryStream, BinaryData,
+    numbered_file_name)
+
+MEDIA_STORE_FOLDER_NAME = "_media_store"
+# blobs up to this size are held in memory until they are complete, so a duplicate is never written at all
+_MEDIA_STORE_MEMORY_LIMIT = 0x100000
+
+# the most data from put_blob which a storage holds in memory waiting to be written
+_BLOB_WRITER_MEMORY_LIMIT = 0x4000000
+
+ARCHIVE_FORMATS = ("zip", "tar")
+# the buffer size for writing archives
+_ARCHIVE_BUFFER_SIZE = 0x100000
+# tar members have to be complete before they are added; members up to this size are held in memory until then
+_TAR_MEMBER_MEMORY_LIMIT = 0x100000
 
 WINDOWS_RESERVED_NAMES = {
     "CON", "PRN", "AUX", "NUL",
@@ -23,15 +52,109 @@ def sanitize_filename(fn: str):
     return fn
 
 
+def fingerprint_paths(*paths: typing.Optional[pathlib.Path]) -> str:
+    """
+    Returns a fingerprint of the files at the paths (including every file in any folders), made by hashing the
+    relative path, size and modification time of each; if any file is added, removed or changed the fingerprint
+    changes. This is much cheaper than hashing the files' contents.
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        if path is None:
+            continue
+        path = path.resolve()
+        h.update(f"{path}\0".encode("utf-8"))
+        if path.is_file():
+            stat = path.stat()
+            h.update(f"{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+            continue
+        if not path.is_dir():
+            h.update(b"missing\n")
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = pathlib.Path(root, file_name)
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                h.update(f"{file_path.relative_to(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+# the most data which a single kernel copy call is asked for
+_KERNEL_COPY_CHUNK_SIZE = 0x8000000
+# only Linux's sendfile will write to a regular file (elsewhere the output has to be a socket)
+_SENDFILE_TO_FILE = sys.platform.startswith("linux")
+
+
+def _kernel_copy(in_fd: int, offset: int, out_fd: int, length: typing.Optional[int]) -> typing.Optional[int]:
+    """
+    Copies from in_fd (starting at offset, without using or moving its file position) to the current position of
+    out_fd inside the kernel, using copy_file_range or sendfile, stopping at the end of the input. Returns the
+    number of bytes copied, or None if the operating system can't copy between these files (or couldn't tell that
+    apart from there being nothing to copy), in which case nothing has been copied.
+    """
+    copy_funcs = []
+    if hasattr(os, "copy_file_range"):
+        copy_funcs.append(lambda count, at: os.copy_file_range(in_fd, out_fd, count, at))
+    if _SENDFILE_TO_FILE and hasattr(os, "sendfile"):
+        copy_funcs.append(lambda count, at: os.sendfile(out_fd, in_fd, at, count))
+
+    copied = 0
+    while copy_funcs and (length is None or copied < length):
+        count = _KERNEL_COPY_CHUNK_SIZE if length is None else min(_KERNEL_COPY_CHUNK_SIZE, length - copied)
+        try:
+            sent = copy_funcs[0](count, offset + copied)
+        except OSError:
+            # the errors which mean a method can't be used for these files vary by platform and filesystem, so until
+            #  the first byte is copied any error moves on to the next method (and finally to an ordinary copy)
+            if copied:
+                raise
+            copy_funcs.pop(0)
+            continue
+        if not sent:
+            if copied:
+                break
+            # some filesystems return 0 from the first call, rather than an error, where the copy isn't supported, so
+            #  the next method is tried (which will also find the end, if the input really is at it)
+            copy_funcs.pop(0)
+            continue
+        copied += sent
+    return copied if copy_funcs else None
+
+
 class ArtifactFileSystemStorageBinaryStream(ArtifactStorageBinaryStream):
     def __init__(self, concrete_path: pathlib.Path, reference_path: str, source_file: str):
         super().__init__(source_file)
         self._f = concrete_path.open("xb")
         self._reference_path = reference_path
 
-    def write(self, data: bytes) -> int:
+    def write(self, data: BinaryData) -> int:
         return self._f.write(data)
 
+    def copy_from(self, source: typing.BinaryIO, length: typing.Optional[int]=None) -> int:
+        """
+        Copies data from a binary file into the stream (see ArtifactStorageBinaryStream.copy_from); where the
+        operating system supports it, the data is copied by the kernel (copy_file_range or sendfile) rather than
+        being read into memory.
+        """
+        try:
+            in_fd = source.fileno()
+        except (AttributeError, OSError):
+            return super().copy_from(source, length)
+        # source.tell() accounts for any read-ahead buffered by the file object, unlike the descriptor's position
+        offset = source.tell()
+        self._f.flush()
+        copied = _kernel_copy(in_fd, offset, self._f.fileno(), length)
+        if copied is None:
+            return super().copy_from(source, length)
+        source.seek(offset + copied)
+        # the file object's idea of its position is stale after the kernel has written to the descriptor
+        self._f.seek(0, os.SEEK_END)
+        return copied
+
     def close(self) -> None:
         self._f.close()
 
@@ -45,6 +168,124 @@ class ArtifactFileSystemStorageBinaryStream(ArtifactStorageBinaryStream):
         self._f.close()
 
 
+class ContentAddressedStore:
+    """
+    A folder of blobs, each stored once under the SHA-256 of its contents. Blobs are added with os.link, which
+    fails rather than overwriting, so a store can be shared by several processes.
+    """
+    def __init__(self, root_path: pathlib.Path):
+        self._root_path = root_path
+        self._temp_path = root_path / "tmp"
+        self._temp_path.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, digest: str) -> pathlib.Path:
+        return self._root_path / digest[:2] / digest
+
+    def make_temp_file(self) -> tuple[typing.BinaryIO, pathlib.Path]:
+        """
+        Returns a new temporary file (open for writing) in the store, and its path, for a blob to be written to
+        before it is added.
+        """
+        path = self._temp_path / uuid.uuid4().hex
+        return path.open("xb"), path
+
+    def add_temp_file(self, temp_path: pathlib.Path, digest: str) -> pathlib.Path:
+        """
+        Adds the temporary file as the blob with the digest, unless the store already has it; either way the
+        temporary file is removed.
+
+        :return: the path of the blob
+        """
+        blob_path = self.blob_path(digest)
+        try:
+            if not blob_path.exists():
+                blob_path.parent.mkdir(exist_ok=True)
+                os.link(temp_path, blob_path)
+        except FileExistsError:
+            pass  # added by someone else in the meantime
+        finally:
+            temp_path.unlink()
+        return blob_path
+
+    def add_bytes(self, data: BinaryData, digest: str) -> pathlib.Path:
+        """
+        Adds the data as the blob with the digest, unless the store already has it.
+
+        :return: the path of the blob
+        """
+        blob_path = self.blob_path(digest)
+        if blob_path.exists():
+            return blob_path
+        f, temp_path = self.make_temp_file()
+        with f:
+            f.write(data)
+        return self.add_temp_file(temp_path, digest)
+
+    @property
+    def root_path(self) -> pathlib.Path:
+        return self._root_path
+
+
+class ArtifactDedupStorageBinaryStream(ArtifactStorageBinaryStream):
+    """
+    A binary stream whose data is hashed as it's written and stored once in a ContentAddressedStore; the file at
+    the stream's own path is then a hard link to the blob (or, where hard links aren't supported, a copy of it).
+    Small blobs are held in memory until the stream is closed, so writing a duplicate touches nothing but the link.
+    """
+    def __init__(
+            self, concrete_path: pathlib.Path, reference_path: str, source_file: str, store: ContentAddressedStore):
+        super().__init__(source_file)
+        if concrete_path.exists():
+            raise FileExistsError(f"File exists: {concrete_path}")
+        self._concrete_path = concrete_path
+        self._reference_path = reference_path
+        self._store = store
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._temp_file: typing.Optional[typing.BinaryIO] = None
+        self._temp_path: typing.Optional[pathlib.Path] = None
+        self._closed = False
+
+    def write(self, data: BinaryData) -> int:
+        self._hash.update(data)
+        if self._temp_file is None and len(self._buffer) + len(data) > _MEDIA_STORE_MEMORY_LIMIT:
+            # too big to hold in memory, so anything buffered so far and the data itself go straight to a temp file
+            self._temp_file, self._temp_path = self._store.make_temp_file()
+            self._temp_file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._temp_file is not None:
+            return self._temp_file.write(data)
+        self._buffer += data
+        return len(data)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        digest = self._hash.hexdigest()
+        if self._temp_file is not None:
+            self._temp_file.close()
+            blob_path = self._store.add_temp_file(self._temp_path, digest)
+        else:
+            blob_path = self._store.add_bytes(self._buffer, digest)
+            self._buffer = bytearray()
+        try:
+            os.link(blob_path, self._concrete_path)
+        except FileExistsError:
+            raise
+        except OSError:
+            shutil.copyfile(blob_path, self._concrete_path)
+
+    def get_file_location_reference(self) -> str:
+        return self._reference_path
+
+    def __enter__(self) -> "ArtifactStorageBinaryStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 class ArtifactFileSystemStorageTextStream(ArtifactStorageTextStream):
     def __init__(self, concrete_path: pathlib.Path, reference_path: str, source_file: str):
         super().__init__(source_file)
@@ -67,10 +308,81 @@ class ArtifactFileSystemStorageTextStream(ArtifactStorageTextStream):
         self._f.close()
 
 
+class _BackgroundBlobWriter:
+    """
+    Writes blobs on a background thread. put blocks while the blobs waiting to be written (other than the first)
+    would take up more than memory_limit bytes. If a write fails, the remaining blobs are still written and the
+    first error is raised by the next put or by close.
+    """
+    def __init__(self, write_func: col_abc.Callable[[str, BinaryData, str], None], memory_limit: int):
+        self._write_func = write_func
+        self._memory_limit = memory_limit
+        self._pending: collections.deque[tuple[str, BinaryData, str]] = collections.deque()
+        self._pending_bytes = 0
+        self._condition = threading.Condition()
+        self._error: typing.Optional[Exception] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._work, name="blob-writer", daemon=True)
+        self._thread.start()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                file_name, data, source_file = self._pending[0]
+            try:
+                self._write_func(file_name, data, source_file)
+            except Exception as ex:
+                with self._condition:
+                    self._error = self._error or ex
+            with self._condition:
+                self._pending.popleft()
+                self._pending_bytes -= memoryview(data).nbytes
+                self._condition.notify_all()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def put(self, file_name: str, data: BinaryData, source_file: str) -> None:
+        size = memoryview(data).nbytes
+        with self._condition:
+            self._raise_error()
+            while self._pending and self._pending_bytes + size > self._memory_limit:
+                self._condition.wait()
+            self._pending.append((file_name, data, source_file))
+            self._pending_bytes += size
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._raise_error()
+
+
 class ArtifactFileSystemStorage(ArtifactStorage):
-    def __init__(self, root_path: pathlib.Path, folder_name: str):
+    def __init__(
+            self, root_path: pathlib.Path, folder_name: str,
+            media_store: typing.Optional[ContentAddressedStore]=None):
+        """
+        Constructor
+
+        :param root_path: the folder the artifact's folder is created in
+        :param folder_name: the name of the artifact's folder
+        :param media_store: optional store which binary streams are de-duplicated through (see
+               ArtifactDedupStorageBinaryStream); the files in the artifact's folder are the same either way
+        """
         self._root_path = root_path
         self._folder_name = sanitize_filename(folder_name)
+        self._media_store = media_store
+        # the (case folded) names used so far, so that put_blob can make names unique without checking the disk
+        self._used_names: set[str] = set()
+        self._blob_writer: typing.Optional[_BackgroundBlobWriter] = None
 
         if self._root_path.exists() and not self._root_path.is_dir():
             raise ValueError(f"{self._root_path} already exists and isn't a directory")
@@ -79,12 +391,23 @@ class ArtifactFileSystemStorage(ArtifactStorage):
         if not isinstance(file_name, str):
             raise TypeError("file_name should be a str")
 
+        file_name = sanitize_filename(file_name)
+        if file_name.casefold() in self._used_names:
+            raise FileExistsError(f"File exists: {self._root_path / self._folder_name / file_name}")
+        self._used_names.add(file_name.casefold())
+        return self._open_stream(file_name, is_binary, source_file)
+
+    def _open_stream(self, file_name: str, is_binary: bool, source_file: str) -> typing.Union[ArtifactStorageBinaryStream, ArtifactStorageTextStream]:
         out_dir = self._root_path / self._folder_name
         if not out_dir.exists():
             out_dir.mkdir(parents=True, exist_ok=True)
 
-        file_name = sanitize_filename(file_name)
-        if is_binary:
+        if is_binary and self._media_store is not None:
+            return ArtifactDedupStorageBinaryStream(out_dir / file_name,
+                                                    str(pathlib.Path(self._folder_name, file_name)),
+                                                    source_file,
+                                                    self._media_store)
+        elif is_binary:
             return ArtifactFileSystemStorageBinaryStream(out_dir / file_name,
                                                          str(pathlib.Path(self._folder_name, file_name)),
                                                          source_file)
@@ -99,3 +422,222 @@ class ArtifactFileSystemStorage(ArtifactStorage):
     def get_text_stream(self, file_name: str, source_file: str) -> ArtifactStorageTextStream:
         return self._get_stream(file_name, is_binary=False, source_file=source_file)
 
+    def _write_blob(self, file_name: str, data: BinaryData, source_file: str) -> None:
+        # the name has already been sanitized and reserved by put_blob
+        with self._open_stream(file_name, is_binary=True, source_file=source_file) as out:
+            out.write(data)
+
+    def put_blob(self, file_name: str, data: BinaryData, source_file: str) -> str:
+        """
+        Stores a complete file, which is written on a background thread (see ArtifactStorage.put_blob). A name
+        which has already been used is numbered to make it unique.
+        """
+        if not isinstance(file_name, str):
+            raise TypeError("file_name should be a str")
+        base_name = sanitize_filename(file_name)
+        file_name = base_name
+        number = 0
+        while file_name.casefold() in self._used_names:
+            number += 1
+            file_name = numbered_file_name(base_name, number)
+        self._used_names.add(file_name.casefold())
+
+        if self._blob_writer is None:
+            self._blob_writer = _BackgroundBlobWriter(self._write_blob, _BLOB_WRITER_MEMORY_LIMIT)
+        self._blob_writer.put(file_name, data, source_file)
+        return str(pathlib.Path(self._folder_name, file_name))
+
+    def close(self) -> None:
+        """
+        Waits for any files from put_blob to be written.
+        """
+        if self._blob_writer is not None:
+            blob_writer, self._blob_writer = self._blob_writer, None
+            blob_writer.close()
+
+
+class _ArchiveMemberBinaryStream(ArtifactStorageBinaryStream):
+    def __init__(self, storage: "ArtifactArchiveStorage", member_name: str, reference_path: str, source_file: str):
+        super().__init__(source_file)
+        self._storage = storage
+        self._member_name = member_name
+        self._reference_path = reference_path
+        self._f = storage._open_member(member_name)
+
+    def write(self, data: BinaryData) -> int:
+        return self._f.write(data)
+
+    def close(self) -> None:
+        if self._f is not None:
+            f, self._f = self._f, None
+            self._storage._close_member(self._member_name, f)
+
+    def get_file_location_reference(self) -> str:
+        return self._reference_path
+
+    def __enter__(self) -> "ArtifactStorageBinaryStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _ArchiveMemberTextStream(ArtifactStorageTextStream):
+    def __init__(self, storage: "ArtifactArchiveStorage", member_name: str, reference_path: str, source_file: str):
+        super().__init__(source_file)
+        self._binary = _ArchiveMemberBinaryStream(storage, member_name, reference_path, source_file)
+        self._encoder = codecs.getincrementalencoder("utf-8")()
+        self._closed = False
+
+    def write(self, data: str) -> int:
+        self._binary.write(self._encoder.encode(data))
+        return len(data)
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._binary.write(self._encoder.encode("", final=True))
+            self._binary.close()
+
+    def get_file_location_reference(self) -> str:
+        return self._binary.get_file_location_reference()
+
+    def __enter__(self) -> "ArtifactStorageTextStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ArtifactArchiveStorage(ArtifactStorage):
+    """
+    ArtifactStorage which writes an artifact's files into a single zip or tar archive (created in root_path, named
+    after the folder the files would otherwise be written to) rather than as separate files, which avoids the
+    overhead of creating many small files. Location references are the same as for ArtifactFileSystemStorage; an
+    index (<archive>.index.json) maps each reference to its member in the archive. Streams are written one at a
+    time, and the archive is only finished (and the index written) when the storage is closed.
+    """
+    def __init__(self, root_path: pathlib.Path, folder_name: str, archive_format: str="zip"):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        self._root_path = root_path
+        self._folder_name = sanitize_filename(folder_name)
+        self._archive_format = archive_format
+        self._archive_path = root_path / f"{self._folder_name}.{archive_format}"
+        self._archive_file: typing.Optional[typing.BinaryIO] = None
+        self._archive: typing.Union[zipfile.ZipFile, tarfile.TarFile, None] = None
+        self._open_member_name: typing.Optional[str] = None
+        # reference -> (member name, source file)
+        self._index: dict[str, tuple[str, str]] = {}
+
+        if self._root_path.exists() and not self._root_path.is_dir():
+            raise ValueError(f"{self._root_path} already exists and isn't a directory")
+
+    def _open_archive(self) -> None:
+        self._root_path.mkdir(parents=True, exist_ok=True)
+        self._archive_file = open(self._archive_path, "xb", buffering=_ARCHIVE_BUFFER_SIZE)
+        if self._archive_format == "zip":
+            # the files are mostly images, which don't compress, so they're stored as they are
+            self._archive = zipfile.ZipFile(self._archive_file, "w", compression=zipfile.ZIP_STORED)
+        else:
+            self._archive = tarfile.open(fileobj=self._archive_file, mode="w", format=tarfile.PAX_FORMAT)
+
+    def _open_member(self, member_name: str) -> typing.BinaryIO:
+        if self._open_member_name is not None:
+            raise ValueError(f"Can't open {member_name} while {self._open_member_name} is still open")
+        if self._archive is None:
+            self._open_archive()
+        self._open_member_name = member_name
+        if self._archive_format == "zip":
+            info = zipfile.ZipInfo(member_name, date_time=time.localtime()[:6])
+            return self._archive.open(info, "w", force_zip64=True)
+        return tempfile.SpooledTemporaryFile(max_size=_TAR_MEMBER_MEMORY_LIMIT)
+
+    def _close_member(self, member_name: str, f: typing.BinaryIO) -> None:
+        try:
+            if self._archive_format == "tar":
+                info = tarfile.TarInfo(member_name)
+                info.size = f.tell()
+                info.mtime = int(time.time())
+                f.seek(0)
+                self._archive.addfile(info, f)
+        finally:
+            f.close()
+            self._open_member_name = None
+
+    def _get_stream(
+            self, file_name: str, is_binary: bool,
+            source_file: str) -> typing.Union[ArtifactStorageBinaryStream, ArtifactStorageTextStream]:
+        if not isinstance(file_name, str):
+            raise TypeError("file_name should be a str")
+
+        file_name = sanitize_filename(file_name)
+        reference_path = str(pathlib.Path(self._folder_name, file_name))
+        if reference_path in self._index:
+            raise FileExistsError(f"File exists: {file_name} in {self._archive_path}")
+
+        stream_type = _ArchiveMemberBinaryStream if is_binary else _ArchiveMemberTextStream
+        stream = stream_type(self, file_name, reference_path, source_file)
+        self._index[reference_path] = (file_name, source_file)
+        return stream
+
+    def get_binary_stream(self, file_name: str, source_file: str) -> ArtifactStorageBinaryStream:
+        return self._get_stream(file_name, is_binary=True, source_file=source_file)
+
+    def get_text_stream(self, file_name: str, source_file: str) -> ArtifactStorageTextStream:
+        return self._get_stream(file_name, is_binary=False, source_file=source_file)
+
+    @property
+    def archive_path(self) -> pathlib.Path:
+        return self._archive_path
+
+    def close(self) -> None:
+        """
+        Finishes the archive and writes its index. Does nothing if no files were stored.
+        """
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._archive_file.close()
+        self._archive = None
+        index = {
+            "archive": self._archive_path.name,
+            "format": self._archive_format,
+            "files": {
+                reference: {"member": member_name, "source_file": source_file}
+                for reference, (member_name, source_file) in self._index.items()}
+        }
+        with self._archive_path.with_name(self._archive_path.name + ".index.json").open("xt", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+
+
+class ArtifactFileSystemStorageMaker:
+    """
+    Callable which makes an ArtifactFileSystemStorage for an artifact under the output folder. Unlike a lambda this
+    can be pickled, so it can be passed to worker processes. If dedup_media is True, binary streams are
+    de-duplicated through a ContentAddressedStore in the output folder, shared by every artifact. If archive_format
+    is given, an ArtifactArchiveStorage is made instead, which writes each artifact's files to a single archive.
+    """
+    def __init__(
+            self, output_root: pathlib.Path, dedup_media: bool=False, archive_format: typing.Optional[str]=None):
+        if dedup_media and archive_format is not None:
+            raise ValueError("Media can't be both de-duplicated and archived")
+        if archive_format is not None and archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        self._output_root = output_root
+        self._dedup_media = dedup_media
+        self._archive_format = archive_format
+
+    def __call__(self, spec: ArtifactSpec) -> ArtifactStorage:
+        if self._archive_format is not None:
+            return ArtifactArchiveStorage(
+                self._output_root / sanitize_filename(spec.service),
+                sanitize_filename(spec.name) + "_files",
+                self._archive_format)
+        media_store = None
+        if self._dedup_media:
+            media_store = ContentAddressedStore(self._output_root / MEDIA_STORE_FOLDER_NAME)
+        return ArtifactFileSystemStorage(
+            self._output_root / sanitize_filename(spec.service),
+            sanitize_filename(spec.name) + "_files",
+            media_store)
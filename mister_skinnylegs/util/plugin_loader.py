@@ -3,6 +3,7 @@ import typing
 from collections.abc import Iterable
 import importlib.util
 from .artifact_utils import ArtifactSpec
+from .scan_dispatch import SubscriptionIndex
 
 
 class PluginLoader:
@@ -10,6 +11,8 @@ class PluginLoader:
         self._plugin_path = plugin_path
         self._artifacts: dict[str, tuple[ArtifactSpec, pathlib.Path]] = {}
         self._load_plugins()
+        # the url matchers for the artifacts' data subscriptions are compiled once, here, rather than per profile
+        self._subscriptions = SubscriptionIndex(spec for spec, path in self._artifacts.values())
 
     @staticmethod
     def load_module_lazy(path: pathlib.Path):
@@ -39,6 +42,10 @@ class PluginLoader:
     def artifacts(self) -> Iterable[tuple[ArtifactSpec, pathlib.Path]]:
         yield from self._artifacts.values()
 
+    @property
+    def subscriptions(self) -> SubscriptionIndex:
+        return self._subscriptions
+
     def __getitem__(self, item: str) -> tuple[ArtifactSpec, pathlib.Path]:
         return self._artifacts[item]
 
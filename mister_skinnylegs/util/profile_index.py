@@ -0,0 +1,202 @@
+import contextlib
+import datetime
+import hashlib
+import pathlib
+import sqlite3
+import typing
+import collections.abc as col_abc
+
+from .common import KeySearch, filter_keysearch
+from .fs_utils import sanitize_filename, fingerprint_paths
+from .profile_folder_protocols import BrowserProfileProtocol, CacheRecordProtocol, HistoryRecordProtocol
+from .profile_wrapper import ProfileWrapper
+
+INDEX_SCHEMA_VERSION = 2
+
+# building an index can block other processes sharing it for a while, so be generous
+_LOCK_TIMEOUT_SECONDS = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS cache_urls (url TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history_urls (url TEXT PRIMARY KEY) WITHOUT ROWID;
+"""
+# tables from earlier versions of the schema, dropped when an index is rebuilt
+_OLD_TABLES = ("cache_records", "history_records")
+
+
+class ProfileIndex:
+    """
+    A sidecar index of the distinct urls in a profile's cache and history, held in a SQLite database alongside (but
+    not in) the evidence. It only records which urls are present: it is used to skip queries which can't match
+    anything without reading the profile. Each section is built from a single metadata-only read of the profile the
+    first time it is needed (so the first run against a profile does more work, not less) and is then used on later
+    runs for as long as the fingerprint of the profile's files still matches. The fingerprint is taken (by stat'ing
+    every file in the profile and cache folders) each time the index is opened.
+    """
+    def __init__(self, db_path: pathlib.Path, fingerprint: str):
+        """
+        Constructor
+
+        :param db_path: path to the index database; created if it doesn't exist.
+        :param fingerprint: fingerprint of the profile's files (see fs_utils.fingerprint_paths). If the index was built
+               against a different fingerprint, it is emptied and rebuilt on demand.
+        """
+        self._db_path = db_path
+        self._fingerprint = fingerprint
+        self._db = sqlite3.connect(db_path, timeout=_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+        self._db.executescript(_SCHEMA)
+        self._urls: dict[str, frozenset[str]] = {}
+
+        with self._write_transaction():
+            if (self._get_meta("fingerprint") != fingerprint or
+                    self._get_meta("schema_version") != str(INDEX_SCHEMA_VERSION)):
+                for table in _OLD_TABLES:
+                    self._db.execute(f"DROP TABLE IF EXISTS {table}")
+                self._db.execute("DELETE FROM cache_urls")
+                self._db.execute("DELETE FROM history_urls")
+                self._db.execute("DELETE FROM meta")
+                self._set_meta("fingerprint", fingerprint)
+                self._set_meta("schema_version", str(INDEX_SCHEMA_VERSION))
+
+    @classmethod
+    def for_profile(
+            cls, index_folder: pathlib.Path, profile_path: pathlib.Path,
+            cache_folder: typing.Optional[pathlib.Path]=None) -> "ProfileIndex":
+        """
+        Opens (or creates) the index for a profile in the index folder. Each profile (and cache folder) gets its own
+        database, named after the profile folder and a hash of its full path.
+        """
+        index_folder.mkdir(parents=True, exist_ok=True)
+        source_paths = f"{profile_path.resolve()}\0{cache_folder and cache_folder.resolve()}"
+        path_hash = hashlib.sha1(source_paths.encode("utf-8"))
+        db_path = index_folder / f"{sanitize_filename(profile_path.name)}_{path_hash.hexdigest()[:16]}.sqlite"
+        return cls(db_path, fingerprint_paths(profile_path, cache_folder))
+
+    def _get_meta(self, key: str) -> typing.Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @contextlib.contextmanager
+    def _write_transaction(self):
+        # IMMEDIATE takes the write lock up front, so other processes sharing the index wait for a build to finish
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _ensure_section(self, section: str, table: str, urls: col_abc.Callable[[], col_abc.Iterable[str]]) -> None:
+        if self._get_meta(f"{section}_complete") == "1":
+            return
+        with self._write_transaction():
+            # re-checked now that the lock is held, in case another process built it while we waited
+            if self._get_meta(f"{section}_complete") == "1":
+                return
+            self._db.execute(f"DELETE FROM {table}")
+            self._db.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?)", ((url,) for url in urls()))
+            self._set_meta(f"{section}_complete", "1")
+
+    def ensure_cache(self, profile: BrowserProfileProtocol) -> None:
+        """
+        Builds the cache section of the index from the profile, if it hasn't been built already.
+        """
+        def urls():
+            rec: CacheRecordProtocol
+            for rec in profile.iterate_cache(omit_cached_data=True):
+                yield rec.key.url
+
+        self._ensure_section("cache", "cache_urls", urls)
+
+    def ensure_history(self, profile: BrowserProfileProtocol) -> None:
+        """
+        Builds the history section of the index from the profile, if it hasn't been built already.
+        """
+        def urls():
+            rec: HistoryRecordProtocol
+            for rec in profile.iterate_history_records():
+                yield rec.url
+
+        self._ensure_section("history", "history_urls", urls)
+
+    def _section_urls(self, table: str) -> frozenset[str]:
+        if table not in self._urls:
+            self._urls[table] = frozenset(row[0] for row in self._db.execute(f"SELECT url FROM {table}"))
+        return self._urls[table]
+
+    def _has_hit(self, table: str, url: KeySearch) -> bool:
+        urls = self._section_urls(table)
+        if isinstance(url, str):
+            return url in urls
+        # stops at the first hit; urls are never empty strings
+        return any(filter_keysearch(url, urls))
+
+    def has_cache_hit(self, url: KeySearch) -> bool:
+        """
+        Returns True if any url in the cache section is a hit for the KeySearch
+        """
+        return self._has_hit("cache_urls", url)
+
+    def has_history_hit(self, url: KeySearch) -> bool:
+        """
+        Returns True if any url in the history section is a hit for the KeySearch
+        """
+        return self._has_hit("history_urls", url)
+
+    @property
+    def db_path(self) -> pathlib.Path:
+        return self._db_path
+
+    @property
+    def fingerprint(self) -> str:
+        return self._fingerprint
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class IndexedProfile(ProfileWrapper):
+    """
+    Wraps a profile so that cache and history queries are first checked against a ProfileIndex: a query whose url
+    matches nothing in the index returns without touching the profile, otherwise the query is passed through to the
+    profile unchanged (the readers test a KeySearch against each record as they go, which is cheaper than testing
+    it against the whole index and then re-querying for the matching urls). Everything else is passed through to
+    the wrapped profile.
+    """
+    def __init__(self, profile: BrowserProfileProtocol, index: ProfileIndex):
+        super().__init__(profile)
+        self._index = index
+
+    def iterate_cache(
+            self,
+            url: typing.Optional[KeySearch]=None, *, decompress=True, omit_cached_data=False,
+            **kwargs: typing.Union[bool, KeySearch]) -> col_abc.Iterable[CacheRecordProtocol]:
+        if url is not None:
+            self._index.ensure_cache(self._profile)
+            if not self._index.has_cache_hit(url):
+                return
+        yield from self._profile.iterate_cache(
+            url, decompress=decompress, omit_cached_data=omit_cached_data, **kwargs)
+
+    def iterate_history_records(
+            self, url: typing.Optional[KeySearch]=None, *,
+            earliest: typing.Optional[datetime.datetime]=None,
+            latest: typing.Optional[datetime.datetime]=None) -> col_abc.Iterable[HistoryRecordProtocol]:
+        if url is not None:
+            self._index.ensure_history(self._profile)
+            if not self._index.has_history_hit(url):
+                return
+        yield from self._profile.iterate_history_records(url, earliest=earliest, latest=latest)
+
+    @property
+    def index(self) -> ProfileIndex:
+        return self._index
+
+    def close(self) -> None:
+        self._index.close()
+        self._profile.close()
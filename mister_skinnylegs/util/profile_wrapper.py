@@ -0,0 +1,19 @@
+from .profile_folder_protocols import BrowserProfileProtocol
+
+
+class ProfileWrapper:
+    """
+    Base class for objects which wrap a profile to change how some of its methods behave. Anything the subclass
+    doesn't define is passed through to the wrapped profile.
+    """
+    def __init__(self, profile: BrowserProfileProtocol):
+        self._profile = profile
+
+    @property
+    def __class__(self):
+        # plugins use isinstance() on the profile to check for browser specific features, so the wrapper reports
+        # the class of the profile it wraps (as unittest.mock does for spec'd objects).
+        return self._profile.__class__
+
+    def __getattr__(self, item):
+        return getattr(self._profile, item)
@@ -0,0 +1,275 @@
+import hashlib
+import os
+import pathlib
+import pickle
+import shutil
+import typing
+import uuid
+import collections.abc as col_abc
+
+from .artifact_utils import (
+    ArtifactSpec, ArtifactResult, ArtifactStorage, LogFunction,
+    ArtifactStorageBinaryStream, ArtifactStorageTextStream, BinaryData)
+from .fs_utils import fingerprint_paths
+from .profile_folder_protocols import BrowserProfileProtocol
+from .profile_wrapper import ProfileWrapper
+from .row_spool import RowSpool, spool_result
+
+RESULT_CACHE_FORMAT_VERSION = 2
+
+# The data sources of a profile which an artifact can touch, keyed by the profile attributes which read them.
+# Attributes which aren't listed (other than the harmless ones) are treated as touching the whole profile.
+SOURCE_ATTRIBUTES = {
+    "iterate_cache": "cache",
+    "iterate_history_records": "history",
+    "iter_downloads": "history",
+    "iter_local_storage_hosts": "local_storage",
+    "iter_local_storage": "local_storage",
+    "iter_session_storage_hosts": "session_storage",
+    "iter_session_storage": "session_storage",
+    "iter_indexeddb_hosts": "indexeddb",
+    "get_indexeddb": "indexeddb",
+    "iter_indexeddb_records": "indexeddb",
+}
+WHOLE_PROFILE_SOURCE = "profile"
+_UNTRACKED_ATTRIBUTES = {"close", "path", "browser_type"}
+
+
+def hash_file(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(0x100000):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SourceTrackingProfile(ProfileWrapper):
+    """
+    Wraps a profile and records which of its data sources (see SOURCE_ATTRIBUTES) are used through it.
+    """
+    def __init__(self, profile: BrowserProfileProtocol):
+        super().__init__(profile)
+        self._sources: set[str] = set()
+
+    def __getattr__(self, item):
+        if item not in _UNTRACKED_ATTRIBUTES:
+            self._sources.add(SOURCE_ATTRIBUTES.get(item, WHOLE_PROFILE_SOURCE))
+        return super().__getattr__(item)
+
+    @property
+    def touched_sources(self) -> frozenset[str]:
+        return frozenset(self._sources)
+
+
+class _TeeBinaryStream(ArtifactStorageBinaryStream):
+    def __init__(self, stream: ArtifactStorageBinaryStream, copy_path: pathlib.Path):
+        super().__init__(stream.source_file)
+        self._stream = stream
+        self._copy = copy_path.open("xb")
+
+    def write(self, data: BinaryData) -> int:
+        self._copy.write(data)
+        return self._stream.write(data)
+
+    def close(self) -> None:
+        self._copy.close()
+        self._stream.close()
+
+    def get_file_location_reference(self) -> str:
+        return self._stream.get_file_location_reference()
+
+    def __enter__(self) -> "ArtifactStorageBinaryStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _TeeTextStream(ArtifactStorageTextStream):
+    def __init__(self, stream: ArtifactStorageTextStream, copy_path: pathlib.Path):
+        super().__init__(stream.source_file)
+        self._stream = stream
+        self._copy = copy_path.open("xt", encoding="utf-8", errors="surrogatepass", newline="")
+
+    def write(self, data: str) -> int:
+        self._copy.write(data)
+        return self._stream.write(data)
+
+    def close(self) -> None:
+        self._copy.close()
+        self._stream.close()
+
+    def get_file_location_reference(self) -> str:
+        return self._stream.get_file_location_reference()
+
+    def __enter__(self) -> "ArtifactStorageTextStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _RecordingStorage(ArtifactStorage):
+    """
+    Passes streams through to the real storage while keeping a copy of everything written in the cache entry.
+    """
+    def __init__(self, storage: ArtifactStorage, media_folder: pathlib.Path):
+        self._storage = storage
+        self._media_folder = media_folder
+        # (file name, source file, is binary, name of the copy in the media folder)
+        self.streams: list[tuple[str, str, bool, str]] = []
+
+    def _record(self, file_name: str, source_file: str, is_binary: bool) -> pathlib.Path:
+        self._media_folder.mkdir(parents=True, exist_ok=True)
+        copy_name = str(len(self.streams))
+        self.streams.append((file_name, source_file, is_binary, copy_name))
+        return self._media_folder / copy_name
+
+    def get_binary_stream(self, file_name: str, source_file: str) -> ArtifactStorageBinaryStream:
+        stream = self._storage.get_binary_stream(file_name, source_file)
+        return _TeeBinaryStream(stream, self._record(file_name, source_file, True))
+
+    def get_text_stream(self, file_name: str, source_file: str) -> ArtifactStorageTextStream:
+        stream = self._storage.get_text_stream(file_name, source_file)
+        return _TeeTextStream(stream, self._record(file_name, source_file, False))
+
+
+class ResultCache:
+    """
+    A cache of artifact results (and the files they wrote to storage) for a profile, so that a re-run only has to
+    execute artifacts which are new or have changed. An entry is keyed by the artifact's name and version, a hash of
+    its plugin file and the profile being processed; it is only reused if the fingerprints of the profile's data
+    sources which the artifact touched when it was run are unchanged.
+    """
+    def __init__(
+            self, cache_folder: pathlib.Path, profile_identity: str,
+            source_paths: col_abc.Mapping[str, col_abc.Sequence[pathlib.Path]]):
+        """
+        Constructor
+
+        :param cache_folder: folder which the cache is kept in
+        :param profile_identity: a string identifying the profile being processed (e.g., its path and browser type)
+        :param source_paths: the paths of the files/folders for each data source in SOURCE_ATTRIBUTES and for
+               WHOLE_PROFILE_SOURCE
+        """
+        self._cache_folder = cache_folder
+        self._profile_identity = profile_identity
+        self._source_paths = source_paths
+        self._fingerprints: dict[str, str] = {}
+        self._cache_folder.mkdir(parents=True, exist_ok=True)
+
+    def _fingerprint_source(self, source: str) -> str:
+        # the profile won't change during a run, so each source is only fingerprinted once
+        if source not in self._fingerprints:
+            self._fingerprints[source] = fingerprint_paths(*self._source_paths[source])
+        return self._fingerprints[source]
+
+    def _entry_folder(self, spec: ArtifactSpec, plugin_file: pathlib.Path) -> pathlib.Path:
+        key = "\0".join(
+            (str(RESULT_CACHE_FORMAT_VERSION), spec.name, spec.version, hash_file(plugin_file), self._profile_identity))
+        return self._cache_folder / hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _load_entry(self, entry_folder: pathlib.Path) -> typing.Optional[dict]:
+        try:
+            with (entry_folder / "entry.pickle").open("rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        for source, fingerprint in entry["sources"].items():
+            if self._fingerprint_source(source) != fingerprint:
+                return None
+        return entry
+
+    def _replay(self, entry_folder: pathlib.Path, entry: dict, storage: ArtifactStorage) -> None:
+        media_folder = entry_folder / entry["media_folder"]
+        for file_name, source_file, is_binary, copy_name in entry["streams"]:
+            if is_binary:
+                with (media_folder / copy_name).open("rb") as f_in, \
+                        storage.get_binary_stream(file_name, source_file) as f_out:
+                    f_out.copy_from(f_in)
+            else:
+                with (media_folder / copy_name).open(
+                        "rt", encoding="utf-8", errors="surrogatepass", newline="") as f_in, \
+                        storage.get_text_stream(file_name, source_file) as f_out:
+                    while chunk := f_in.read(0x100000):
+                        f_out.write(chunk)
+
+    def run(
+            self, spec: ArtifactSpec, plugin_file: pathlib.Path,
+            profile_func: col_abc.Callable[[], BrowserProfileProtocol],
+            log_func: LogFunction, storage: ArtifactStorage) -> ArtifactResult:
+        """
+        Returns the artifact's result from the cache (re-creating the files it stored) if there's a valid entry,
+        otherwise runs the artifact and stores its result in the cache.
+
+        :param spec: the artifact's spec
+        :param plugin_file: path to the plugin file which the artifact was loaded from
+        :param profile_func: function returning the profile to run the artifact against; only called if the
+               artifact has to be run, so the profile needn't be opened when every result is cached
+        :param log_func: the log function to pass to the artifact
+        :param storage: the storage to pass to the artifact
+        """
+        entry_folder = self._entry_folder(spec, plugin_file)
+        entry = self._load_entry(entry_folder)
+        if entry is not None:
+            for message in entry["log_messages"]:
+                log_func(message)
+            log_func(f"Result for {spec.name} reused from the result cache")
+            self._replay(entry_folder, entry, storage)
+            if entry["rows_file"] is not None:
+                # spooled rows are read straight from the cache
+                return ArtifactResult(RowSpool(
+                    entry_folder / entry["media_folder"] / entry["rows_file"], entry["result"], owns_file=False))
+            return ArtifactResult(entry["result"])
+
+        # each run writes its media to a fresh folder, and the entry is swapped in at the end, so that a run which
+        # fails (or a concurrent run) never leaves an entry pointing to incomplete files
+        media_folder_name = uuid.uuid4().hex
+        tracked_profile = SourceTrackingProfile(profile_func())
+        recording_storage = _RecordingStorage(storage, entry_folder / media_folder_name)
+        log_messages = []
+
+        def log_and_record(message: str):
+            log_messages.append(message)
+            log_func(message)
+
+        result = spool_result(spec.function(tracked_profile, log_and_record, recording_storage))
+
+        rows_file = None
+        cached_result = result.result
+        if isinstance(result.result, RowSpool):
+            # the rows are copied in with the media, and the entry's result holds the row count
+            rows_file = "rows.spool"
+            (entry_folder / media_folder_name).mkdir(parents=True, exist_ok=True)
+            result.result.copy_to(entry_folder / media_folder_name / rows_file)
+            cached_result = len(result.result)
+
+        entry = {
+            "sources": {source: self._fingerprint_source(source) for source in tracked_profile.touched_sources},
+            "result": cached_result,
+            "rows_file": rows_file,
+            "log_messages": log_messages,
+            "media_folder": media_folder_name,
+            "streams": recording_storage.streams
+        }
+        entry_folder.mkdir(parents=True, exist_ok=True)
+        temp_path = entry_folder / f"entry.pickle.{media_folder_name}"
+        try:
+            with temp_path.open("xb") as f:
+                pickle.dump(entry, f)
+        except (pickle.PicklingError, TypeError, AttributeError) as ex:
+            log_func(f"WARNING: Result for {spec.name} could not be stored in the result cache ({ex})")
+            temp_path.unlink(missing_ok=True)
+            shutil.rmtree(entry_folder / media_folder_name, ignore_errors=True)
+            return result
+        os.replace(temp_path, entry_folder / "entry.pickle")
+
+        for old_media in entry_folder.iterdir():
+            if old_media.is_dir() and old_media.name != media_folder_name:
+                shutil.rmtree(old_media, ignore_errors=True)
+
+        return result
+
+    @property
+    def cache_folder(self) -> pathlib.Path:
+        return self._cache_folder
@@ -0,0 +1,111 @@
+import os
+import pathlib
+import pickle
+import shutil
+import tempfile
+import typing
+import collections.abc as col_abc
+
+from .artifact_utils import ArtifactResult, StreamingArtifactResult
+
+# rows are pickled in batches, which is much faster than pickling them one at a time
+_BATCH_SIZE = 1000
+
+
+class RowSpool:
+    """
+    Rows of a result spooled to a temporary file as they are produced, so that they can be written out (as many times
+    as needed) without ever being held in memory all at once. A RowSpool can be pickled, so it can be returned from
+    a worker process, and it can be iterated repeatedly.
+    """
+    def __init__(self, path: pathlib.Path, row_count: int, owns_file: bool=True):
+        """
+        Constructor. Usually created with RowSpool.spool rather than directly.
+
+        :param path: path to the spool file
+        :param row_count: the number of rows in the spool file
+        :param owns_file: if True, the file is deleted when the spool is closed
+        """
+        self._path = path
+        self._row_count = row_count
+        self._owns_file = owns_file
+
+    @classmethod
+    def spool(cls, rows: col_abc.Iterable, spool_folder: typing.Optional[pathlib.Path]=None) -> "RowSpool":
+        """
+        Consumes the rows into a new spool file.
+
+        :param rows: the rows to spool
+        :param spool_folder: the folder for the spool file; defaults to the system's temporary folder
+        """
+        handle, path = tempfile.mkstemp(suffix=".spool", prefix="mister_skinnylegs_", dir=spool_folder)
+        row_count = 0
+        try:
+            with os.fdopen(handle, "wb") as f:
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) == _BATCH_SIZE:
+                        pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        row_count += len(batch)
+                        batch = []
+                if batch:
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    row_count += len(batch)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return cls(pathlib.Path(path), row_count)
+
+    def __iter__(self) -> col_abc.Iterator:
+        with self._path.open("rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+
+    def __len__(self) -> int:
+        return self._row_count
+
+    def __bool__(self) -> bool:
+        return self._row_count > 0
+
+    def copy_to(self, path: pathlib.Path) -> "RowSpool":
+        """
+        Copies the spool file to the path, returning a RowSpool for the copy which doesn't own (and so won't delete)
+        it.
+        """
+        shutil.copyfile(self._path, path)
+        return RowSpool(path, self._row_count, owns_file=False)
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self._path
+
+    def close(self) -> None:
+        """
+        Deletes the spool file, if this spool owns it.
+        """
+        if self._owns_file:
+            self._path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "RowSpool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f"<RowSpool {self._path} ({self._row_count} rows)>"
+
+
+def spool_result(result: ArtifactResult, spool_folder: typing.Optional[pathlib.Path]=None) -> ArtifactResult:
+    """
+    If the result is a StreamingArtifactResult, consumes its rows into a RowSpool and returns an ArtifactResult
+    holding the spool; other results are returned as they are.
+    """
+    if isinstance(result, StreamingArtifactResult):
+        return ArtifactResult(RowSpool.spool(result.result, spool_folder))
+    return result
@@ -0,0 +1,279 @@
+import datetime
+import typing
+import collections.abc as col_abc
+
+from .common import KeySearch, UrlMatcher, compile_keysearch
+from .artifact_utils import ArtifactSpec, CacheSubscription, HistorySubscription
+from .profile_folder_protocols import BrowserProfileProtocol, CacheRecordProtocol, HistoryRecordProtocol
+from .cache_utils import CacheRecordRef, load_cache_bodies
+from .profile_wrapper import ProfileWrapper
+
+
+SubscriptionLabel = tuple[str, int]  # (artifact name, index of the subscription in the spec)
+
+# the most body data which a ScanDispatcher holds from its cache walk; records whose bodies don't fit are only
+#  referenced, and read back when their artifact asks for them
+SUBSCRIBED_BODY_MEMORY_LIMIT = 0x10000000
+
+
+def compile_header_filter(
+        headers: typing.Optional[col_abc.Mapping[str, typing.Union[bool, KeySearch]]]
+) -> col_abc.Callable[[CacheRecordProtocol], bool]:
+    """
+    Prepares a predicate which tests a cache record's header fields using the same rules as the keyword arguments
+    for iterate_cache: the keyword is the header field name with underscores replacing hyphens; a bool tests for
+    the presence of the field; otherwise any of the field's values must be a hit for the KeySearch.
+    """
+    if not headers:
+        return lambda record: True
+
+    tests = tuple(
+        (header_name.replace("_", "-"), search if isinstance(search, bool) else compile_keysearch(search))
+        for header_name, search in headers.items())
+
+    def is_hit(record: CacheRecordProtocol) -> bool:
+        if record.metadata is None:
+            return False
+        for header_name, test in tests:
+            values = record.metadata.get_attribute(header_name)
+            if isinstance(test, bool):
+                if bool(values) != test:
+                    return False
+            elif not any(map(test, values)):
+                return False
+        return True
+
+    return is_hit
+
+
+class SubscriptionIndex:
+    """
+    The cache and history subscriptions of a set of artifacts, with a UrlMatcher compiled from the urls of each
+    so that every url is matched against all of the subscriptions at once. This is built once, when the plugins
+    are loaded, and shared by every ScanDispatcher.
+    """
+    def __init__(self, specs: col_abc.Iterable[ArtifactSpec]):
+        self._cache_subscriptions: dict[SubscriptionLabel, CacheSubscription] = {}
+        self._history_subscriptions: dict[SubscriptionLabel, HistorySubscription] = {}
+        for spec in specs:
+            for idx, subscription in enumerate(spec.cache_subscriptions or ()):
+                self._cache_subscriptions[(spec.name, idx)] = subscription
+            for idx, subscription in enumerate(spec.history_subscriptions or ()):
+                self._history_subscriptions[(spec.name, idx)] = subscription
+
+        self._cache_header_filters = {
+            label: compile_header_filter(sub.headers) for label, sub in self._cache_subscriptions.items()}
+        # metadata-only subscriptions are collected by a separate walk which doesn't read bodies
+        self._cache_matchers = {
+            omit_cached_data: UrlMatcher({
+                label: (sub.url,) for label, sub in self._cache_subscriptions.items()
+                if sub.omit_cached_data == omit_cached_data})
+            for omit_cached_data in (False, True)}
+        self._history_matcher = UrlMatcher(
+            {label: (sub.url,) for label, sub in self._history_subscriptions.items()})
+
+    @property
+    def cache_subscriptions(self) -> col_abc.Mapping[SubscriptionLabel, CacheSubscription]:
+        return self._cache_subscriptions
+
+    @property
+    def history_subscriptions(self) -> col_abc.Mapping[SubscriptionLabel, HistorySubscription]:
+        return self._history_subscriptions
+
+    @property
+    def cache_header_filters(self) -> col_abc.Mapping[SubscriptionLabel, col_abc.Callable[[CacheRecordProtocol], bool]]:
+        return self._cache_header_filters
+
+    def cache_matcher(self, omit_cached_data: bool) -> UrlMatcher:
+        """
+        Returns the matcher for the subscriptions which do (omit_cached_data=False) or don't need bodies
+        """
+        return self._cache_matchers[omit_cached_data]
+
+    @property
+    def history_matcher(self) -> UrlMatcher:
+        return self._history_matcher
+
+    def find_cache_subscription(
+            self, artifact_name: str, url: typing.Optional[KeySearch],
+            headers: col_abc.Mapping[str, typing.Union[bool, KeySearch]],
+            omit_cached_data=False) -> typing.Optional[SubscriptionLabel]:
+        """
+        Returns the label of the artifact's subscription which exactly covers the query, or None if the query
+        isn't covered by any of the artifact's subscriptions.
+        """
+        for label, subscription in self._cache_subscriptions.items():
+            if label[0] != artifact_name or subscription.omit_cached_data != omit_cached_data:
+                continue
+            if (subscription.url is url or subscription.url == url) and dict(subscription.headers or {}) == headers:
+                return label
+        return None
+
+    def find_history_subscription(
+            self, artifact_name: str, url: typing.Optional[KeySearch]) -> typing.Optional[SubscriptionLabel]:
+        """
+        Returns the label of the artifact's history subscription for the url, or None if the query isn't covered
+        by any of the artifact's subscriptions.
+        """
+        for label, subscription in self._history_subscriptions.items():
+            if label[0] == artifact_name and (subscription.url is url or subscription.url == url):
+                return label
+        return None
+
+
+class _MemoisedMatcher:
+    """
+    Used as the url filter for a scan: the reader calls it for each url and then yields the record(s) for that
+    url, so the labels for the last url are kept to save matching it again when the record is fanned out.
+    """
+    def __init__(self, matcher: UrlMatcher):
+        self._matcher = matcher
+        self._last_url = None
+        self._last_labels = frozenset()
+
+    def match(self, url: str) -> frozenset:
+        if url != self._last_url:
+            self._last_url = url
+            self._last_labels = self._matcher.match(url)
+        return self._last_labels
+
+    def __call__(self, url: str) -> bool:
+        return bool(self.match(url))
+
+
+class ScanDispatcher:
+    """
+    Makes a single walk of a profile's cache, and a single read of its history, on behalf of every artifact which
+    declares subscriptions, fanning each matching record out to the subscriptions it satisfies. Each scan happens
+    the first time any subscribed artifact asks for records of that type.
+
+    The cache walk reads the records' bodies along with them. Only body_memory_limit bytes of bodies are held: the
+    records whose bodies don't fit are referenced instead, and are read back (in one pass for the subscription) when
+    their artifact asks for them. Subscriptions which only need metadata are collected by a second walk which
+    doesn't read bodies, made only if one of them is asked for. Records are dropped as each artifact is released.
+    """
+    def __init__(
+            self, profile: BrowserProfileProtocol, subscriptions: SubscriptionIndex,
+            body_memory_limit: int=SUBSCRIBED_BODY_MEMORY_LIMIT):
+        self._profile = profile
+        self._subscriptions = subscriptions
+        self._body_memory_limit = body_memory_limit
+        # the records for each subscription, or refs to them where their bodies weren't held
+        self._cache_records: dict[SubscriptionLabel, tuple[typing.Union[CacheRecordProtocol, CacheRecordRef], ...]] = {}
+        # the walks made so far, by their omit_cached_data
+        self._cache_walks: set[bool] = set()
+        self._history_records: typing.Optional[dict[SubscriptionLabel, tuple[HistoryRecordProtocol, ...]]] = None
+
+    @property
+    def subscriptions(self) -> SubscriptionIndex:
+        return self._subscriptions
+
+    def _walk_cache(self, omit_cached_data: bool) -> None:
+        header_filters = self._subscriptions.cache_header_filters
+        records: dict[SubscriptionLabel, list[typing.Union[CacheRecordProtocol, CacheRecordRef]]] = {
+            label: [] for label, sub in self._subscriptions.cache_subscriptions.items()
+            if sub.omit_cached_data == omit_cached_data}
+        cache_matcher = self._subscriptions.cache_matcher(omit_cached_data)
+        matcher = _MemoisedMatcher(cache_matcher)
+        url_filter = None if cache_matcher.matches_all else matcher
+
+        held = 0
+        for record in self._profile.iterate_cache(url=url_filter, omit_cached_data=omit_cached_data):
+            labels = [label for label in matcher.match(record.key.url) if header_filters[label](record)]
+            if not labels:
+                continue
+            entry = record
+            if record.data:
+                if held + len(record.data) > self._body_memory_limit:
+                    entry = CacheRecordRef.of(record)
+                else:
+                    held += len(record.data)
+            for label in labels:
+                records[label].append(entry)
+
+        self._cache_records.update((label, tuple(recs)) for label, recs in records.items())
+        self._cache_walks.add(omit_cached_data)
+
+    def _read_history(self) -> None:
+        # the records are shared between subscriptions, so are held in immutable tuples
+        records: dict[SubscriptionLabel, list[HistoryRecordProtocol]] = {
+            label: [] for label in self._subscriptions.history_subscriptions}
+        matcher = _MemoisedMatcher(self._subscriptions.history_matcher)
+        url_filter = None if self._subscriptions.history_matcher.matches_all else matcher
+
+        for record in self._profile.iterate_history_records(url=url_filter):
+            for label in matcher.match(record.url):
+                records[label].append(record)
+
+        self._history_records = {label: tuple(recs) for label, recs in records.items()}
+
+    def get_cache_records(self, label: SubscriptionLabel) -> col_abc.Sequence[CacheRecordProtocol]:
+        """
+        Returns the records for the subscription (with their bodies, unless it only needs metadata).
+        """
+        omit_cached_data = self._subscriptions.cache_subscriptions[label].omit_cached_data
+        if omit_cached_data not in self._cache_walks:
+            self._walk_cache(omit_cached_data)
+        entries = self._cache_records[label]
+        refs = [entry for entry in entries if isinstance(entry, CacheRecordRef)]
+        if not refs:
+            return entries
+        loaded = iter(load_cache_bodies(self._profile, refs))
+        return [next(loaded) if isinstance(entry, CacheRecordRef) else entry for entry in entries]
+
+    def get_history_records(self, label: SubscriptionLabel) -> tuple[HistoryRecordProtocol, ...]:
+        if self._history_records is None:
+            self._read_history()
+        return self._history_records[label]
+
+    def release(self, artifact_name: str) -> None:
+        """
+        Drops the records held for an artifact once it has finished with them.
+        """
+        for records in (self._cache_records, self._history_records):
+            if not records:
+                continue
+            for label in records:
+                if label[0] == artifact_name:
+                    records[label] = ()
+
+
+class DispatchedProfile(ProfileWrapper):
+    """
+    Wraps a profile for a single artifact so that its subscribed cache and history queries are answered by the
+    ScanDispatcher. Everything else is passed through to the wrapped profile.
+    """
+    def __init__(self, profile: BrowserProfileProtocol, dispatcher: ScanDispatcher, artifact_name: str):
+        super().__init__(profile)
+        self._dispatcher = dispatcher
+        self._artifact_name = artifact_name
+
+    def iterate_cache(
+            self,
+            url: typing.Optional[KeySearch]=None, *, decompress=True, omit_cached_data=False,
+            **kwargs: typing.Union[bool, KeySearch]) -> col_abc.Iterable[CacheRecordProtocol]:
+        label = None
+        if decompress:
+            label = self._dispatcher.subscriptions.find_cache_subscription(
+                self._artifact_name, url, kwargs, omit_cached_data)
+        if label is None:
+            yield from self._profile.iterate_cache(
+                url, decompress=decompress, omit_cached_data=omit_cached_data, **kwargs)
+        else:
+            yield from self._dispatcher.get_cache_records(label)
+
+    def iterate_history_records(
+            self, url: typing.Optional[KeySearch]=None, *,
+            earliest: typing.Optional[datetime.datetime]=None,
+            latest: typing.Optional[datetime.datetime]=None) -> col_abc.Iterable[HistoryRecordProtocol]:
+        label = self._dispatcher.subscriptions.find_history_subscription(self._artifact_name, url)
+        if label is None:
+            yield from self._profile.iterate_history_records(url, earliest=earliest, latest=latest)
+            return
+
+        for record in self._dispatcher.get_history_records(label):
+            if earliest is not None and record.visit_time < earliest:
+                continue
+            if latest is not None and record.visit_time > latest:
+                continue
+            yield record
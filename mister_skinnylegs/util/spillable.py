@@ -0,0 +1,128 @@
+import heapq
+import itertools
+import pathlib
+import typing
+import collections.abc as col_abc
+
+from .row_spool import RowSpool
+
+# the number of items a SpillableCollection holds in memory before spilling them to disk, by default
+SPILL_MEMORY_ITEMS = 100000
+
+
+class SpillableCollection:
+    """
+    A collection for artifacts which gather more items (usually rows) than should be held in memory before they can
+    be returned. Items are appended to a buffer in memory; once the buffer holds memory_items items, it is sorted
+    (if there's a sort key) and spilled to a temporary file as a run. Iterating the collection merges the runs and
+    the buffer, so the items are only ever streamed from disk.
+
+    With a sort_key, items are yielded in order of their keys, and items with equal keys in the order they were
+    appended (i.e., the sort is stable). Without one, items are yielded in the order they were appended.
+
+    With a dedupe_key, only one item is yielded for each key: the last one appended, in the place of the first (as
+    when items are put in a dict). Duplicates are found among items with equal sort keys, so a dedupe_key needs a
+    sort_key, and items with the same dedupe key must have the same sort key (e.g., the dedupe key includes the
+    sort key).
+
+    Items and sort keys must be picklable; dedupe keys must be hashable.
+    """
+    def __init__(
+            self,
+            sort_key: typing.Optional[col_abc.Callable[[typing.Any], typing.Any]]=None,
+            dedupe_key: typing.Optional[col_abc.Callable[[typing.Any], col_abc.Hashable]]=None,
+            memory_items: int=SPILL_MEMORY_ITEMS,
+            spool_folder: typing.Optional[pathlib.Path]=None):
+        """
+        Constructor
+
+        :param sort_key: optional function returning the key which items are sorted by
+        :param dedupe_key: optional function returning the key which identifies duplicate items; requires sort_key
+        :param memory_items: the number of items to hold in memory before spilling them to disk
+        :param spool_folder: folder for the spilled runs; defaults to the system's temporary folder
+        """
+        if dedupe_key is not None and sort_key is None:
+            raise ValueError("dedupe_key requires a sort_key")
+        if memory_items < 1:
+            raise ValueError("memory_items must be at least 1")
+        self._sort_key = sort_key
+        self._dedupe_key = dedupe_key
+        self._memory_items = memory_items
+        self._spool_folder = spool_folder
+        # with a sort key, the buffer holds (sort key, sequence number, item) so that the sort is stable and never
+        # compares the items themselves
+        self._buffer: list = []
+        self._runs: list[RowSpool] = []
+        self._count = 0
+
+    def _spill(self) -> None:
+        if self._sort_key is not None:
+            self._buffer.sort()
+        self._runs.append(RowSpool.spool(self._buffer, self._spool_folder))
+        self._buffer = []
+
+    def append(self, item: typing.Any) -> None:
+        if self._sort_key is not None:
+            self._buffer.append((self._sort_key(item), self._count, item))
+        else:
+            self._buffer.append(item)
+        self._count += 1
+        if len(self._buffer) >= self._memory_items:
+            self._spill()
+
+    def extend(self, items: col_abc.Iterable) -> None:
+        for item in items:
+            self.append(item)
+
+    def _iter_sorted(self) -> col_abc.Iterator[tuple[typing.Any, int, typing.Any]]:
+        self._buffer.sort()
+        if not self._runs:
+            return iter(self._buffer)
+        return heapq.merge(*self._runs, self._buffer)
+
+    def _iter_deduped(self) -> col_abc.Iterator:
+        # duplicates share a sort key, so each group of equal sort keys is de-duplicated on its own
+        group: dict[col_abc.Hashable, typing.Any] = {}
+        group_key = None
+        for sort_key, _, item in self._iter_sorted():
+            if group and sort_key != group_key:
+                yield from group.values()
+                group.clear()
+            group_key = sort_key
+            group[self._dedupe_key(item)] = item
+        yield from group.values()
+
+    def __iter__(self) -> col_abc.Iterator:
+        if self._dedupe_key is not None:
+            return self._iter_deduped()
+        if self._sort_key is not None:
+            return (item for _, _, item in self._iter_sorted())
+        if not self._runs:
+            return iter(self._buffer)
+        return itertools.chain(*self._runs, self._buffer)
+
+    def __len__(self) -> int:
+        """
+        The number of items appended (before any de-duplication).
+        """
+        return self._count
+
+    @property
+    def spilled(self) -> bool:
+        return bool(self._runs)
+
+    def close(self) -> None:
+        """
+        Deletes any spilled runs and empties the collection.
+        """
+        for run in self._runs:
+            run.close()
+        self._runs.clear()
+        self._buffer = []
+        self._count = 0
+
+    def __enter__(self) -> "SpillableCollection":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
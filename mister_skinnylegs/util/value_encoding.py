@@ -0,0 +1,103 @@
+import datetime
+import enum
+import typing
+import collections.abc as col_abc
+
+from .artifact_utils import TableRow
+from .profile_folder_protocols import ArtifactLocationProtocol
+
+Converter = col_abc.Callable[[typing.Any], typing.Any]
+
+# types which the json encoder handles itself (including subclasses, e.g., bools, IntEnums and StrEnums)
+JSON_NATIVE_TYPES = (str, int, float, list, tuple, dict, type(None))
+
+
+class TypeDispatcher:
+    """
+    Maps values to something decided by their type (usually a function to convert them with), resolving each type
+    the first time a value of it is seen and caching the result by type. The checks which resolve a type can then
+    be as slow as they need to be (isinstance against a runtime checkable protocol is a structural check, for
+    example), as they aren't repeated for every value.
+    """
+    __slots__ = ("_resolve", "_cache")
+
+    def __init__(self, resolve: col_abc.Callable[[typing.Any], typing.Any]):
+        """
+        Constructor
+
+        :param resolve: function which is given the first value seen of each type and returns the result for the
+               type; it must only depend on the value's type
+        """
+        self._resolve = resolve
+        self._cache: dict[type, typing.Any] = {}
+
+    def get(self, value: typing.Any) -> typing.Any:
+        value_type = type(value)
+        try:
+            return self._cache[value_type]
+        except KeyError:
+            result = self._cache[value_type] = self._resolve(value)
+            return result
+
+
+def location_to_string(location: ArtifactLocationProtocol) -> str:
+    return location.friendly_string
+
+
+def _enum_name(value: enum.Enum) -> str:
+    return value.name
+
+
+def _to_hex(value: typing.Union[bytes, bytearray, memoryview]) -> str:
+    return value.hex()
+
+
+def _resolve_json_converter(value: typing.Any) -> typing.Optional[Converter]:
+    if isinstance(value, JSON_NATIVE_TYPES):
+        return None
+    if isinstance(value, datetime.datetime):
+        return type(value).isoformat
+    if isinstance(value, TableRow):
+        return TableRow.to_dict
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _to_hex
+    if isinstance(value, enum.Enum):
+        return _enum_name
+    if isinstance(value, ArtifactLocationProtocol):
+        return location_to_string
+    return None  # left for the encoder (and so raises the usual TypeError)
+
+
+def _resolve_csv_converter(value: typing.Any) -> typing.Optional[Converter]:
+    # only values which the csv writer's own conversion (str) gets wrong are converted, so that datetimes, bytes, etc.
+    # are written as they always have been
+    if isinstance(value, (str, int, float, type(None))):
+        return None
+    if isinstance(value, enum.Enum):
+        return _enum_name
+    if isinstance(value, ArtifactLocationProtocol):
+        return location_to_string
+    return None
+
+
+# value -> function converting it into something the json encoder handles (None for values which need no converting)
+json_converters = TypeDispatcher(_resolve_json_converter)
+# value -> function converting it for csv output (None for values which the csv writer converts itself)
+csv_converters = TypeDispatcher(_resolve_csv_converter)
+
+
+RowType = typing.Union[dict[str, typing.Any], TableRow]
+
+
+def stringify_locations(row: RowType) -> RowType:
+    """
+    Replaces the location values in a row (a dict or TableRow) with their friendly strings, in place, and returns
+    the row. Artifacts producing a very large number of rows can call this as each row is produced, so that the
+    locations are spooled and written as plain strings rather than objects. The json and csv output is the same
+    either way, but the columnar formats and the case database then see the locations as plain text (so, e.g., they
+    aren't indexed).
+    """
+    for key, value in row.items():
+        if json_converters.get(value) is location_to_string:
+            row[key] = value.friendly_string
+    return row
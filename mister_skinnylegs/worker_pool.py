@@ -0,0 +1,95 @@
+import dataclasses
+import multiprocessing.util
+import pathlib
+import typing
+import collections.abc as colabc
+
+from .util.plugin_loader import PluginLoader
+from .util.artifact_utils import ArtifactSpec, ArtifactStorage
+from .profile_session import BrowserType, ProfileSession
+
+
+# the number of profile sessions each worker keeps open between jobs
+MAX_WARM_SESSIONS = 2
+
+
+@dataclasses.dataclass(frozen=True)
+class ArtifactJob:
+    """
+    A unit of work for a worker process: one artifact run against one profile. Everything in the job must be
+    picklable, so artifacts are referred to by name and resolved against the worker's own plugin loader.
+    """
+    artifact_name: str
+    profile_path: pathlib.Path
+    browser_type: BrowserType
+    cache_folder: typing.Optional[pathlib.Path]
+    storage_maker_func: colabc.Callable[[ArtifactSpec], ArtifactStorage]
+    index_folder: typing.Optional[pathlib.Path] = None
+    result_cache_folder: typing.Optional[pathlib.Path] = None
+
+
+def make_result_envelope(spec: ArtifactSpec, result: typing.Any) -> dict:
+    return {
+        "artifact_service": spec.service,
+        "artifact_name": spec.name,
+        "artifact_version": spec.version,
+        "artifact_description": spec.description,
+        "result": result}
+
+
+class _WorkerState:
+    def __init__(self, plugin_path: pathlib.Path):
+        self.plugin_loader = PluginLoader(plugin_path)
+        self.sessions: dict[tuple, ProfileSession] = {}
+
+    def get_session(self, job: ArtifactJob) -> ProfileSession:
+        # sessions are kept warm between jobs, so later jobs against the same profile don't have to
+        # re-open it
+        key = (job.profile_path, job.browser_type, job.cache_folder, job.index_folder, job.result_cache_folder)
+        if key in self.sessions:
+            self.sessions[key] = self.sessions.pop(key)  # move to the end, as the most recently used
+        else:
+            # in batches a worker moves across many profiles, so only the most recently used are kept open
+            while len(self.sessions) >= MAX_WARM_SESSIONS:
+                self.sessions.pop(next(iter(self.sessions))).close()
+            # the worker only runs some of the artifacts, so each artifact's subscriptions are scanned on its own
+            #  rather than holding records for artifacts which run in other workers
+            self.sessions[key] = ProfileSession(
+                job.profile_path, job.browser_type, job.cache_folder,
+                index_folder=job.index_folder, result_cache_folder=job.result_cache_folder, shared_scans=False)
+        return self.sessions[key]
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+
+_worker_state: typing.Optional[_WorkerState] = None
+
+
+def init_worker(plugin_path: pathlib.Path) -> None:
+    """
+    Initializer for worker processes; loads the plugins and prepares the (per process) profile session cache.
+    """
+    global _worker_state
+    _worker_state = _WorkerState(plugin_path)
+    # ProcessPoolExecutor workers don't run atexit handlers, but they do run multiprocessing finalizers
+    multiprocessing.util.Finalize(None, _worker_state.close, exitpriority=10)
+
+
+def run_artifact_job(job: ArtifactJob) -> tuple[str, dict, list[str]]:
+    """
+    Runs a single artifact in a worker process. Log messages are buffered and returned with the result so that
+    the host can pass them on to its own log callback.
+
+    :return: a tuple of: the artifact name; the result envelope; the log messages generated.
+    """
+    if _worker_state is None:
+        raise RuntimeError("Worker has not been initialised (init_worker must be the pool initializer)")
+
+    log_messages = []
+    spec, path = _worker_state.plugin_loader[job.artifact_name]
+    session = _worker_state.get_session(job)
+    result = session.run_artifact(spec, path, log_messages.append, job.storage_maker_func(spec))
+    return spec.name, make_result_envelope(spec, result.result), log_messages
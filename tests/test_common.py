@@ -0,0 +1,87 @@
+import re
+
+import pytest
+
+from mister_skinnylegs.util.common import UrlMatcher, AnyKeySearch, compile_keysearch
+
+
+PATTERNS = (
+    re.compile(r"https?://(www\.)?google\.[a-z.]+/search\?"),
+    re.compile(r"^https://outlook\.office(365)?\.com/owa/"),
+    re.compile(r"reddit\.com/r/[^/]+/comments/"),
+    re.compile(r"(?:mail|calendar)\.example\.org"),
+    re.compile(r"\.example\.org/inbox$"),
+    re.compile(r"[0-9]{3}-[0-9]{4}"),
+    re.compile(r"api\\v1"),
+    re.compile(r"(?i)YOUTUBE\.com/watch"),
+    re.compile(r"facebook\.com/(?i:messages)"),
+    re.compile(r"tiktok\.com", re.IGNORECASE),
+    re.compile(r"a+b*c?"),
+    re.compile(r"x.y.z"),
+    re.compile(r"\bdrive\b"),
+)
+
+URLS = (
+    "https://www.google.com/search?q=test",
+    "http://google.co.uk/search?q=test",
+    "https://google.com/maps",
+    "https://outlook.office365.com/owa/service.svc",
+    "https://outlook.office.com/owa/",
+    "https://example.com/?u=https://outlook.office.com/owa/",
+    "https://old.reddit.com/r/python/comments/abc/",
+    "https://reddit.com/r//comments/",
+    "https://calendar.example.org/inbox",
+    "https://mail.example.org/outbox",
+    "https://www.example.org/inbox",
+    "tel:555-1234",
+    "https://host/api\\v1/x",
+    "https://www.youtube.com/watch?v=1",
+    "https://www.YouTube.com/WATCH?v=1",
+    "https://www.facebook.com/Messages/t/1",
+    "https://www.facebook.com/MESSAGES",
+    "https://www.TIKTOK.com/@user",
+    "https://drive.example.com/",
+    "https://googledrive.example.com/",
+    "xyz", "x-y-z", "bc", "",
+)
+
+
+def _reference(searches, value):
+    return frozenset(
+        label for label, label_searches in searches.items()
+        if any(search is None or compile_keysearch(search)(value) for search in label_searches))
+
+
+def _check(searches):
+    matcher = UrlMatcher(searches)
+    for url in URLS:
+        expected = _reference(searches, url)
+        assert matcher.match(url) == expected, url
+        assert matcher.is_hit(url) == bool(expected), url
+
+
+@pytest.mark.parametrize("pattern", PATTERNS, ids=lambda p: p.pattern)
+def test_single_pattern_matches_re_search(pattern):
+    _check({"label": [pattern]})
+
+
+def test_many_labels_match_re_search():
+    _check({index: [pattern] for index, pattern in enumerate(PATTERNS)})
+
+
+def test_shared_patterns_and_mixed_searches_match_reference():
+    searches = {
+        "a": [PATTERNS[0], "https://www.example.org/inbox"],
+        "b": [PATTERNS[0], PATTERNS[3]],
+        "c": [{"xyz", "bc"}, lambda url: url.endswith("/")],
+        "d": [AnyKeySearch(PATTERNS[5], PATTERNS[12], "tel:555-1234")],
+        "e": [PATTERNS[7], PATTERNS[9]],
+    }
+    _check(searches)
+    _check({**searches, "all": [None]})
+
+
+def test_any_key_search_matches_its_components():
+    search = AnyKeySearch(PATTERNS[1], PATTERNS[2], "xyz")
+    for url in URLS:
+        assert search(url) == any(compile_keysearch(component)(url) for component in search.searches), url
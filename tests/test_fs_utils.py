@@ -0,0 +1,32 @@
+import os
+import errno
+
+import pytest
+
+from mister_skinnylegs.util import fs_utils
+
+
+def _refuse(*args):
+    raise OSError(errno.ENOTSOCK, os.strerror(errno.ENOTSOCK))
+
+
+@pytest.mark.parametrize("refused", [(), ("copy_file_range",), ("copy_file_range", "sendfile")],
+                         ids=["kernel", "sendfile", "fallback"])
+def test_copy_from(tmp_path, monkeypatch, refused):
+    for name in refused:
+        monkeypatch.setattr(os, name, _refuse, raising=False)
+    # a small chunk size, so that each copy takes several calls
+    monkeypatch.setattr(fs_utils, "_KERNEL_COPY_CHUNK_SIZE", 0x1000)
+    data = os.urandom(100000)
+    source_path = tmp_path / "source"
+    source_path.write_bytes(data)
+    out_path = tmp_path / "out"
+    with fs_utils.ArtifactFileSystemStorageBinaryStream(out_path, "out", "source") as stream, \
+            source_path.open("rb") as source:
+        source.read(10)
+        stream.write(b"head")
+        assert stream.copy_from(source, 50000) == 50000
+        assert source.tell() == 50010
+        stream.write(b"tail")
+        assert stream.copy_from(source) == len(data) - 50010
+    assert out_path.read_bytes() == b"head" + data[10:50010] + b"tail" + data[50010:]
@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import sqlite3
+import threading
+import datetime
+import dataclasses
+
+import pytest
+
+from mister_skinnylegs.result_writers import JsonResultWriter, write_json_result, write_csv_result, CaseDatabase
+from mister_skinnylegs.util.artifact_utils import RowSchema
+from mister_skinnylegs.util.profile_folder_protocols import ArtifactLocationProtocol
+from mister_skinnylegs.util.row_spool import RowSpool
+
+
+@dataclasses.dataclass(frozen=True)
+class Location:
+    source_file: str
+    offset: int
+
+    @property
+    def friendly_string(self) -> str:
+        return f"{self.source_file} @ {self.offset}"
+
+
+class BaselineEncoder(json.JSONEncoder):
+    # the encoder the json output was written with before it was streamed
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            return obj.isoformat()
+        if isinstance(obj, ArtifactLocationProtocol):
+            return obj.friendly_string
+        return super().default(obj)
+
+
+NAIVE = datetime.datetime(2024, 2, 29, 23, 59, 59, 123456)
+AWARE = datetime.datetime(2024, 3, 1, 1, 2, 3, tzinfo=datetime.timezone(datetime.timedelta(hours=-5)))
+
+ROWS = [
+    {"url": "https://example.com/", "timestamp": NAIVE, "location": Location("History", 1)},
+    {"url": "https://example.com/é漢\U0001f600\"\\\n", "timestamp": AWARE, "count": 3, "ratio": 0.1},
+    {"nested": {"when": [NAIVE, AWARE], "where": (Location("Cache", 2), None)}, "flag": True},
+    {},
+]
+
+
+def _baseline_json(envelope: dict) -> str:
+    out = io.StringIO()
+    json.dump(envelope, out, cls=BaselineEncoder)
+    return out.getvalue()
+
+
+def _written_json(envelope: dict, buffer_size: int) -> str:
+    out = io.StringIO()
+    JsonResultWriter(out, buffer_size).write_envelope(envelope)
+    return out.getvalue()
+
+
+ENVELOPES = [
+    {"artifact_service": "Example", "artifact_name": "Rows", "artifact_version": "0.1", "result": ROWS},
+    {"artifact_name": "Empty", "result": []},
+    {"result": ROWS},
+    {"artifact_name": "Not last", "result": ROWS, "extra": NAIVE},
+    {"artifact_name": "Dict result", "result": {"when": AWARE, "where": Location("Cookies", 3), "rows": ROWS}},
+    {"artifact_name": "Scalar result", "result": "text"},
+    {},
+]
+
+
+@pytest.mark.parametrize("buffer_size", [1, 7, 0x40000])
+@pytest.mark.parametrize("envelope", ENVELOPES)
+def test_json_matches_json_dump(envelope, buffer_size):
+    assert _written_json(envelope, buffer_size) == _baseline_json(envelope)
+
+
+def test_json_table_rows_match_dict_rows():
+    schema = RowSchema(("url", "timestamp", "location", "count"))
+    table_rows = [schema.row_from_dict(row) for row in ROWS if row.keys() <= set(schema.columns)]
+    dict_rows = [row.to_dict() for row in table_rows]
+    out = io.StringIO()
+    write_json_result(out, {"artifact_name": "Rows", "result": table_rows})
+    assert out.getvalue() == _baseline_json({"artifact_name": "Rows", "result": dict_rows})
+
+
+def test_json_spooled_rows_match_list(tmp_path):
+    envelope = {"artifact_name": "Rows", "result": ROWS}
+    with RowSpool.spool(ROWS, tmp_path) as spool:
+        out = io.StringIO()
+        write_json_result(out, {"artifact_name": "Rows", "result": spool})
+    assert out.getvalue() == _baseline_json(envelope)
+
+
+def _baseline_csv(rows: list, fields=None) -> str:
+    # the csv writer before columns could be declared: the fields are discovered in the order they're first seen
+    if fields is None:
+        fields = []
+        for rec in rows:
+            for k in rec.keys():
+                if k not in fields:
+                    fields.append(k)
+    out = io.StringIO(newline="")
+    writer = csv.DictWriter(out, fields)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(
+            {k: (v.friendly_string if isinstance(v, ArtifactLocationProtocol) else v) for k, v in row.items()})
+    return out.getvalue()
+
+
+def _written_csv(rows, columns=None, **kwargs) -> str:
+    out = io.StringIO(newline="")
+    write_csv_result(out, rows, columns, **kwargs)
+    return out.getvalue()
+
+
+def test_csv_matches_dict_writer():
+    assert _written_csv(ROWS) == _baseline_csv(ROWS)
+
+
+def test_csv_from_generator_matches_dict_writer(tmp_path):
+    assert _written_csv((row for row in ROWS), spool_folder=tmp_path) == _baseline_csv(ROWS)
+    assert not list(tmp_path.iterdir())
+
+
+def test_csv_declared_columns_match_dict_writer():
+    columns = ("flag", "url", "timestamp", "location", "count", "ratio", "nested", "unused")
+    assert _written_csv(ROWS, columns) == _baseline_csv(ROWS, columns)
+    assert _written_csv(iter(ROWS), columns) == _baseline_csv(ROWS, columns)
+
+
+def test_csv_table_rows_match_dict_rows():
+    schema = RowSchema(("url", "timestamp", "location", "count"))
+    table_rows = [schema.row_from_dict(row) for row in ROWS if row.keys() <= set(schema.columns)]
+    dict_rows = [row.to_dict() for row in table_rows]
+    assert _written_csv(table_rows, schema.columns) == _baseline_csv(dict_rows, schema.columns)
+    assert _written_csv(table_rows) == _baseline_csv(dict_rows)
+
+
+def test_csv_skips_and_logs_undeclared_fields():
+    logged = []
+    columns = ("url", "count")
+    written = _written_csv(ROWS, columns, log_func=logged.append)
+    assert written == _baseline_csv([{k: row[k] for k in columns if k in row} for row in ROWS], columns)
+    # each skipped field is logged once, the first time it's seen
+    assert logged == [
+        "Skipping fields which aren't in the declared columns: ['timestamp', 'location']",
+        "Skipping fields which aren't in the declared columns: ['ratio']",
+        "Skipping fields which aren't in the declared columns: ['nested', 'flag']",
+    ]
+
+
+def test_case_database_loads_from_several_writers(tmp_path):
+    db_path = tmp_path / "case.sqlite"
+    rows = [{"n": n, "timestamp": NAIVE, "location": Location("History", n)} for n in range(2000)]
+    errors = []
+
+    def load(names):
+        try:
+            with CaseDatabase(db_path) as case_db:
+                for name in names:
+                    case_db.add_table({"artifact_name": name, "result": rows})
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=load, args=([f"t{t}_{n}" for n in range(5)],)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with sqlite3.connect(db_path) as db:
+        assert db.execute("SELECT count(*), sum(row_count) FROM _artifacts").fetchone() == (20, 20 * len(rows))
@@ -0,0 +1,68 @@
+import random
+import operator
+
+import pytest
+
+from mister_skinnylegs.util.spillable import SpillableCollection
+
+
+def _items() -> list[dict]:
+    rng = random.Random(23)
+    # few distinct sort keys and ids, so there are many ties and duplicates, spread across the spilled runs
+    return [
+        {"timestamp": rng.randrange(20), "id": rng.randrange(10), "n": n}
+        for n in range(500)]
+
+
+def _sort_key(item):
+    return item["timestamp"]
+
+
+def _dedupe_key(item):
+    return item["timestamp"], item["id"]
+
+
+MEMORY_ITEMS = [1, 7, 64, 1000]
+
+
+@pytest.mark.parametrize("memory_items", MEMORY_ITEMS)
+def test_unsorted_keeps_append_order(tmp_path, memory_items):
+    items = _items()
+    with SpillableCollection(memory_items=memory_items, spool_folder=tmp_path) as collection:
+        collection.extend(items)
+        assert collection.spilled == (memory_items <= len(items))
+        assert len(collection) == len(items)
+        assert list(collection) == items
+        # the collection can be iterated more than once
+        assert list(collection) == items
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("memory_items", MEMORY_ITEMS)
+def test_sorted_matches_stable_sort(tmp_path, memory_items):
+    items = _items()
+    with SpillableCollection(_sort_key, memory_items=memory_items, spool_folder=tmp_path) as collection:
+        collection.extend(items)
+        assert list(collection) == sorted(items, key=_sort_key)
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("memory_items", MEMORY_ITEMS)
+def test_deduped_matches_dict(tmp_path, memory_items):
+    items = _items()
+    # as when the items are put in a dict: the last item for each key, in the place of the first
+    deduped = {}
+    for item in items:
+        deduped[_dedupe_key(item)] = item
+    expected = sorted(deduped.values(), key=_sort_key)
+
+    with SpillableCollection(_sort_key, _dedupe_key, memory_items, tmp_path) as collection:
+        collection.extend(items)
+        assert len(collection) == len(items)
+        assert list(collection) == expected
+    assert not list(tmp_path.iterdir())
+
+
+def test_dedupe_key_requires_sort_key():
+    with pytest.raises(ValueError):
+        SpillableCollection(dedupe_key=operator.itemgetter("id"))
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+import random
+import datetime
+
+import pytest
+
+from mister_skinnylegs.timeline import TimelineBuilder, TIMELINE_COLUMNS
+from mister_skinnylegs.util.artifact_utils import ArtifactSpec, ReportPresentation
+
+UTC = datetime.timezone.utc
+PLUS_TWO = datetime.timezone(datetime.timedelta(hours=2))
+MINUS_FIVE = datetime.timezone(datetime.timedelta(hours=-5))
+
+
+def _spec(name: str, *timestamp_fields: str) -> ArtifactSpec:
+    return ArtifactSpec(
+        "Service", name, "", "0.1", lambda *args: None, ReportPresentation.table,
+        timestamp_field_names=timestamp_fields)
+
+
+def _instant(value) -> datetime.datetime:
+    # naive timestamps are UTC
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value if value.tzinfo is not None else value.replace(tzinfo=UTC)
+
+
+def _artifacts() -> list[tuple[ArtifactSpec, list[dict]]]:
+    rng = random.Random(17)
+    base = datetime.datetime(2024, 1, 1, 12)
+    artifacts = []
+    for index, zone in enumerate((None, UTC, PLUS_TWO, MINUS_FIVE)):
+        rows = []
+        for n in range(60):
+            # a coarse grid, so that many events from different artifacts and zones fall on the same instant
+            when = base + datetime.timedelta(hours=rng.randrange(-6, 7))
+            if zone is not None:
+                when = when.replace(tzinfo=UTC).astimezone(zone)
+            rows.append({
+                "n": n,
+                "visited": when,
+                "modified": when.isoformat() if n % 3 else None,
+                "other": "not a timestamp",
+            })
+        artifacts.append((_spec(f"Artifact {index}", "visited", "modified"), rows))
+    artifacts.append((_spec("Strings", "when"), [{"when": "2024-01-01T10:00:00+00:00"}, {"when": "nonsense"}]))
+    return artifacts
+
+
+def _reference(artifacts) -> list[tuple[str, str, str, str]]:
+    # every timestamp field of every row, in the order added, sorted (stably) by the instant it refers to
+    events = []
+    for spec, rows in artifacts:
+        for row in rows:
+            for field in spec.timestamp_field_names:
+                value = row.get(field)
+                try:
+                    instant = _instant(value)
+                except (TypeError, ValueError, AttributeError):
+                    continue
+                events.append((instant, value if isinstance(value, str) else value.isoformat(), field, spec.name))
+    events.sort(key=lambda event: event[0])
+    return [event[1:] for event in events]
+
+
+@pytest.mark.parametrize("memory_events", [7, 100, 1000000])
+def test_timeline_order_matches_sort(tmp_path, memory_events):
+    artifacts = _artifacts()
+    with TimelineBuilder(tmp_path, memory_events) as timeline:
+        added = sum(timeline.add_artifact(spec, rows) for spec, rows in artifacts)
+        events = [(event[2], event[3], event[5]) for event in timeline.iter_events()]
+    expected = _reference(artifacts)
+    assert added == len(expected)
+    assert events == [(timestamp, field, name) for timestamp, field, name in expected]
+    assert not list(tmp_path.iterdir())
+
+
+def test_timeline_csv(tmp_path):
+    artifacts = _artifacts()
+    out = io.StringIO(newline="")
+    with TimelineBuilder(tmp_path, 11) as timeline:
+        for spec, rows in artifacts:
+            timeline.add_artifact(spec, rows)
+        written = timeline.write_csv(out)
+    out.seek(0)
+    reader = csv.reader(out)
+    assert tuple(next(reader)) == TIMELINE_COLUMNS
+    lines = list(reader)
+    assert written == len(lines)
+    assert [tuple(line[:2]) + (line[3],) for line in lines] == _reference(artifacts)
+    assert all(line[2] == "Service" for line in lines)
+    first = json.loads(lines[0][4])
+    assert _instant(first[lines[0][1]]) == _instant(lines[0][0])
@@ -0,0 +1,113 @@
+import csv
+import io
+import enum
+import json
+import datetime
+import dataclasses
+
+import pytest
+
+from mister_skinnylegs.result_writers import ExtendedEncoder
+from mister_skinnylegs.util import stringify_locations
+from mister_skinnylegs.util.artifact_utils import RowSchema
+from mister_skinnylegs.util.profile_folder_protocols import ArtifactLocationProtocol
+from mister_skinnylegs.util.value_encoding import TypeDispatcher, json_converters, csv_converters
+
+
+@dataclasses.dataclass(frozen=True)
+class Location:
+    source_file: str
+    offset: int
+
+    @property
+    def friendly_string(self) -> str:
+        return f"{self.source_file} @ {self.offset}"
+
+
+class Colour(enum.Enum):
+    RED = 1
+
+
+class Size(enum.IntEnum):
+    LARGE = 3
+
+
+class Timestamp(datetime.datetime):
+    pass
+
+
+class BaselineEncoder(json.JSONEncoder):
+    # the encoder before values were dispatched by type
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            return obj.isoformat()
+        if isinstance(obj, ArtifactLocationProtocol):
+            return obj.friendly_string
+        return super().default(obj)
+
+
+NAIVE = datetime.datetime(2024, 2, 29, 23, 59, 59, 123456)
+AWARE = datetime.datetime(2024, 3, 1, 1, 2, 3, tzinfo=datetime.timezone(datetime.timedelta(hours=5, minutes=30)))
+
+# values which both encoders handle
+BASELINE_VALUES = [
+    NAIVE, AWARE, Timestamp(2020, 1, 1), Location("History", 12), "text", 1, 1.5, True, None, Size.LARGE,
+    [NAIVE, {"where": Location("Cache", 0), "when": (AWARE, None)}], {"nested": {"deeper": [Location("a", 1)]}},
+]
+
+
+def test_type_dispatcher_resolves_each_type_once():
+    resolved = []
+
+    def resolve(value):
+        resolved.append(value)
+        return type(value).__name__
+
+    dispatcher = TypeDispatcher(resolve)
+    assert [dispatcher.get(value) for value in (1, 2, "a", 3, "b", True, None)] == \
+           ["int", "int", "str", "int", "str", "bool", "NoneType"]
+    assert resolved == [1, "a", True, None]
+
+
+@pytest.mark.parametrize("value", BASELINE_VALUES, ids=repr)
+def test_json_matches_baseline_encoder(value):
+    assert json.dumps(value, cls=ExtendedEncoder) == json.dumps(value, cls=BaselineEncoder)
+
+
+def test_json_converters():
+    row = RowSchema(("a", "b")).row(NAIVE, 1)
+    assert json_converters.get(row)(row) == {"a": NAIVE, "b": 1}
+    assert json_converters.get(b"\x00\xff")(b"\x00\xff") == "00ff"
+    assert json_converters.get(Colour.RED)(Colour.RED) == "RED"
+    assert json_converters.get(Location("x", 1))(Location("x", 1)) == "x @ 1"
+    # types the json module encodes itself (including subclasses) are left to it
+    for value in ("s", 1, 1.5, True, None, [], {}, (), Size.LARGE):
+        assert json_converters.get(value) is None
+    # anything unknown still raises as it did before
+    with pytest.raises(TypeError):
+        json.dumps(datetime.date(2024, 1, 1), cls=ExtendedEncoder)
+
+
+def _csv_line(values: list) -> str:
+    out = io.StringIO(newline="")
+    csv.writer(out).writerow(values)
+    return out.getvalue()
+
+
+def test_csv_converters_match_str_except_locations_and_enums():
+    values = [NAIVE, AWARE, b"\x00\xff", "text", 1, 1.5, True, None, [1, 2], {"a": 1}]
+    converted = [converter(value) if (converter := csv_converters.get(value)) is not None else value
+                 for value in values]
+    assert _csv_line(converted) == _csv_line(values)
+    assert csv_converters.get(Location("x", 1))(Location("x", 1)) == "x @ 1"
+    assert csv_converters.get(Colour.RED)(Colour.RED) == "RED"
+
+
+def test_stringify_locations_leaves_json_unchanged():
+    row = {"url": "https://example.com/", "location": Location("History", 5), "when": NAIVE}
+    schema = RowSchema(row)
+    for original, stringified in ((dict(row), stringify_locations(dict(row))),
+                                  (schema.row_from_dict(row), stringify_locations(schema.row_from_dict(row)))):
+        assert stringified["location"] == "History @ 5"
+        assert stringified["when"] is NAIVE
+        assert json.dumps(dict(stringified), cls=ExtendedEncoder) == json.dumps(dict(original), cls=BaselineEncoder)